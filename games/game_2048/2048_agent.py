@@ -1,19 +1,27 @@
 import time
 import os
-import pyautogui
 import argparse
 import numpy as np
-from tools.utils import encode_image, log_output
-from tools.serving.api_providers import anthropic_completion, openai_completion, gemini_completion
+from tools.utils import log_output
+from tools.frames import FrameEncoder, add_frame_args, to_pil
+from tools.frame_gate import FrameChangeGate, add_gate_args, wait_for_stable_frame
+from tools.serving.api_providers import completion, add_hedging_args, configure_hedging_from_args, provider_summary
+from tools.serving.resilience import ProviderUnavailable
+from tools.serving.response_cache import ResponseCache, state_fingerprint, add_cache_args
 import subprocess
 import multiprocessing
 import re
-import pygetwindow as gw
-import pywinctl as pwc
-# https://github.com/Kalmat/PyWinCtl, support linux and macos
-# pip3 install pywinctl
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+
+from logic import encode_board
+from board_parser import read_board, board_to_text
+from solver import ExpectimaxSolver, DIRECTION_NAMES, add_solver_args
+from server import Game2048Client
+from speculation import SpeculativePrefetcher, add_speculation_args
+# pyautogui, mss and pywinctl (https://github.com/Kalmat/PyWinCtl, support linux and macos,
+# pip3 install pywinctl) are imported where they are used, so runs against the
+# headless game server need no display.
 
-import mss
 # System prompt for LLM
 system_prompt = (  
     "You are an expert AI agent specialized in playing the 2048 game with advanced strategic reasoning. "  
@@ -50,6 +58,36 @@ system_prompt = (
     "- The 'thought' field provides a brief explanation (few words) of why the move is the best choice.\n"
 )
 
+# Move request, shared by regular and speculative requests.
+move_instructions = (
+    "Analyze the 2048 game state from the image and determine the best move: 'up', 'right', 'left', or 'down'.\n"
+    "Avoid repeating mistakes and prioritize flexible, strategic moves that maximize tile merging and board control.\n\n"
+
+    "### Move Evaluation ###\n"
+    "1. **Check if the move is possible**: A move is only valid if at least one tile can slide or merge.\n"
+    "2. **Ignore invalid moves**: If a direction does not allow movement (i.e., no space or different numbers that cannot merge), do not consider it.\n"
+    "3. **Avoid repeating past moves** *only if* the last four moves contained just 1-2 unique directions. If the previous four moves were diverse, focus on selecting the optimal move based on board state.\n\n"
+
+    "### 2048 Game Rules & Strategy ###\n"
+    "1. Keep the **highest-value tile in a corner**.\n"
+    "2. **Prioritize merging** over unnecessary movement.\n"
+    "3. **Avoid moves that limit future flexibility**.\n"
+    "4. If a deadlock is likely, **try an alternative strategy**.\n\n"
+
+    "### Decision-Making & Adaptation ###\n"
+    "1. If your thought is **similar to previous ones**, you might be repeating a mistake. Try a different approach.\n"
+    "2. If the last four moves include only **1-2 unique directions**, switch to a different move to avoid getting stuck.\n"
+    "3. If the last four moves were already varied, **focus on making the best possible move** rather than forcing a different one.\n\n"
+
+    "Provide your response in the strict format: move: \"<direction>\", thought: \"<brief reasoning>\"."
+)
+
+# Frame preprocessing defaults: a 4x4 board stays perfectly legible at 512px.
+preprocess_config = {
+    "crop": None,
+    "max_long_edge": 512,
+    "palette_colors": None,
+}
 
 # WIDTH, HEIGHT = 800, 700
 # WINDOW = pygame.display.set_mode((WIDTH, HEIGHT))
@@ -70,111 +108,271 @@ system_prompt = (
 
 #     return screenshot_path
 
-def get_pygame_window_position():
+def find_pygame_window():
     """
-    尝试找到2048 pygame窗口并返回其位置。
+    尝试找到2048 pygame窗口，返回窗口对象（找不到时返回None）。
     """
+    import pywinctl as pwc
     try:
-        # 正确使用pygetwindow API
-        # all_windows = gw.getAllWindows()
         all_windows = pwc.getAllWindows()
         pygame_windows = [w for w in all_windows if 'pygame' in w.title.lower()]
-        
+
         if pygame_windows:
             window = pygame_windows[0]
             print(f"找到pygame窗口: {window.title}")
-            return window.left, window.top, window.width, window.height
-        else:
-            print("未找到pygame窗口，尝试查找其他可能的窗口名称")
-            
-            # 尝试其他可能的窗口名称
-            possible_titles = ['2048', 'game', 'python']
-            for title in possible_titles:
-                matching_windows = [w for w in all_windows if title.lower() in w.title.lower()]
-                if matching_windows:
-                    window = matching_windows[0]
-                    print(f"找到可能的游戏窗口: {window.title}")
-                    return window.left, window.top, window.width, window.height
-            
-            # 如果没有找到任何匹配窗口，使用全屏
-            print("未找到任何可能的游戏窗口，使用全屏截图")
-            screen_width, screen_height = pyautogui.size()
-            return 0, 0, screen_width, screen_height
-    
+            return window
+
+        print("未找到pygame窗口，尝试查找其他可能的窗口名称")
+        # 尝试其他可能的窗口名称
+        possible_titles = ['2048', 'game', 'python']
+        for title in possible_titles:
+            matching_windows = [w for w in all_windows if title.lower() in w.title.lower()]
+            if matching_windows:
+                window = matching_windows[0]
+                print(f"找到可能的游戏窗口: {window.title}")
+                return window
+
+        print("未找到任何可能的游戏窗口，使用全屏截图")
     except Exception as e:
         print(f"获取窗口位置时出错: {str(e)}")
-        # 出错时使用全屏
-        screen_width, screen_height = pyautogui.size()
-        return 0, 0, screen_width, screen_height
+    return None
+
+class GameWindow:
+    """
+    Caches the game window and its geometry so captures don't enumerate every window.
+
+    The geometry is dropped when the window moves, is resized or closes (pywinctl's
+    watchdog), or when a capture fails; the window is then looked up again. Without a
+    watchdog, the geometry is read from the cached window on every capture, which is
+    still a single query. Falls back to the full screen while no window is found.
+    """
+
+    def __init__(self):
+        self._window = None
+        self._geometry = None
+        self._watched = False
+
+    def geometry(self):
+        """
+        (left, top, width, height) of the game window.
+        """
+        geometry = self._geometry
+        if geometry is not None:
+            return geometry
+
+        if self._window is None:
+            self._window = find_pygame_window()
+            self._watched = self._window is not None and self._watch(self._window)
+        if self._window is None:
+            import pyautogui
+            screen_width, screen_height = pyautogui.size()
+            return 0, 0, screen_width, screen_height
+
+        window = self._window
+        geometry = (window.left, window.top, window.width, window.height)
+        if self._watched:
+            self._geometry = geometry
+        return geometry
+
+    def _watch(self, window):
+        try:
+            window.watchdog.start(
+                isAliveCB=lambda alive: alive or self.invalidate(forget_window=True),
+                resizedCB=lambda size: self.invalidate(),
+                movedCB=lambda position: self.invalidate(),
+            )
+            return True
+        except Exception as e:
+            print(f"[WARNING] Window watchdog unavailable, reading the geometry on every capture: {e}")
+            return False
+
+    def invalidate(self, forget_window=False):
+        """
+        Drop the cached geometry (and the window itself with `forget_window`).
+        """
+        self._geometry = None
+        if forget_window:
+            if self._window is not None and self._watched:
+                try:
+                    self._window.watchdog.stop()
+                except Exception:
+                    pass
+            self._window = None
+            self._watched = False
+
+game_window = GameWindow()
+_screen_grabber = None
+
+def get_pygame_window_position():
+    """
+    Position and size of the 2048 pygame window (cached, see GameWindow).
+    """
+    return game_window.geometry()
 
 def capture_screenshot():
     """
-    Captures the pygame window dynamically based on its detected position.
+    Captures the pygame window dynamically based on its detected position
+    and returns it as an in-memory image.
+    """
+    global _screen_grabber
+    import mss
+    if _screen_grabber is None:
+        # Reused across captures: opening the display costs more than the grab itself.
+        _screen_grabber = mss.mss()
+    left, top, width, height = get_pygame_window_position()
+    monitor = {"top": top, "left": left, "width": width, "height": height}
+    try:
+        screenshot = _screen_grabber.grab(monitor)
+    except mss.exception.ScreenShotError:
+        # The window moved off screen or went away; look it up again.
+        game_window.invalidate(forget_window=True)
+        left, top, width, height = get_pygame_window_position()
+        monitor = {"top": top, "left": left, "width": width, "height": height}
+        screenshot = _screen_grabber.grab(monitor)
+
+    return to_pil(screenshot)
+
+class SettledCapture:
+    """
+    Wraps a capture function so each frame is taken once the board has reacted to the
+    last move and stopped changing (see `wait_for_stable_frame`), instead of after a
+    fixed worst-case delay.
     """
-    os.makedirs("cache/2048", exist_ok=True)
-    screenshot_path = "cache/2048/2048_screenshot.png"
 
-    position = get_pygame_window_position()
-    if position:
-        left, top, width, height = position
-        with mss.mss() as sct:
-            monitor = {"top": top, "left": left, "width": width, "height": height}
-            screenshot = sct.grab(monitor)
-            mss.tools.to_png(screenshot.rgb, screenshot.size, output=screenshot_path)
+    def __init__(self, grab, timeout=1.0, poll_interval=0.02):
+        self.grab = grab
+        self.timeout = timeout
+        self.poll_interval = poll_interval
+        self.last_frame = None
+
+    def __call__(self):
+        frame = wait_for_stable_frame(self.grab, self.last_frame, self.timeout, self.poll_interval)
+        self.last_frame = frame
+        return frame
 
-    return screenshot_path
 from collections import deque
 
-def get_best_move(system_prompt, api_provider, model_name, move_history):
+# Runs model requests so the local solver can take over when one is too slow;
+# a few threads so an abandoned request doesn't hold up the next one.
+_request_executor = ThreadPoolExecutor(max_workers=4)
+
+def parse_board(screenshot):
     """
-    Takes a screenshot, sends it to the LLM, and extracts the best move and reasoning,
-    considering the previous four moves and thoughts.
+    Read the board matrix from the screenshot, or return None if it can't be recognised.
     """
-    screenshot_path = capture_screenshot()
-    base64_image = encode_image(screenshot_path)
+    try:
+        return read_board(screenshot)
+    except ValueError as e:
+        print(f"[WARNING] Could not read the board: {e}")
+        return None
+
+def solve_locally(solver, board):
+    """
+    Pick a move for the parsed board with the expectimax solver.
+    Returns (move, thought).
+    """
+    if board is None:
+        return "unknown", "Failed to read the board."
+    start_time = time.time()
+    direction, value, depth = solver.best_move(encode_board(board))
+    if direction is None:
+        return "unknown", "No legal move left."
+    print(f"[INFO] Local solver latency: {(time.time() - start_time) * 1000:.1f}ms")
+    return DIRECTION_NAMES[direction], f"expectimax depth {depth}, value {value:.0f}"
+
+def text_board_prompt(board):
+    return f"The current board, row by row from the top (0 = empty cell):\n{board_to_text(board)}\n\n"
 
-    # Format the move history
+def build_move_prompt(board_prompt, move_history):
+    """
+    Move prompt for a board (text prompt or "" for an image) and the last four moves.
+    """
     history_prompt = "\n".join(
         [f"{i+1}. move: {entry['move']}, thought: {entry['thought']}" for i, entry in enumerate(move_history)]
     ) if move_history else "No previous moves."
+    return board_prompt + f"Your last four moves and thoughts:\n{history_prompt}\n\n" + move_instructions
 
-    move_prompt = (
-    f"Your last four moves and thoughts:\n{history_prompt}\n\n"
-    "Analyze the 2048 game state from the image and determine the best move: 'up', 'right', 'left', or 'down'.\n"
-    "Avoid repeating mistakes and prioritize flexible, strategic moves that maximize tile merging and board control.\n\n"
-    
-    "### Move Evaluation ###\n"
-    "1. **Check if the move is possible**: A move is only valid if at least one tile can slide or merge.\n"
-    "2. **Ignore invalid moves**: If a direction does not allow movement (i.e., no space or different numbers that cannot merge), do not consider it.\n"
-    "3. **Avoid repeating past moves** *only if* the last four moves contained just 1-2 unique directions. If the previous four moves were diverse, focus on selecting the optimal move based on board state.\n\n"
-    
-    "### 2048 Game Rules & Strategy ###\n"
-    "1. Keep the **highest-value tile in a corner**.\n"
-    "2. **Prioritize merging** over unnecessary movement.\n"
-    "3. **Avoid moves that limit future flexibility**.\n"
-    "4. If a deadlock is likely, **try an alternative strategy**.\n\n"
-    
-    "### Decision-Making & Adaptation ###\n"
-    "1. If your thought is **similar to previous ones**, you might be repeating a mistake. Try a different approach.\n"
-    "2. If the last four moves include only **1-2 unique directions**, switch to a different move to avoid getting stuck.\n"
-    "3. If the last four moves were already varied, **focus on making the best possible move** rather than forcing a different one.\n\n"
-    
-    "Provide your response in the strict format: move: \"<direction>\", thought: \"<brief reasoning>\"."
-    )
+def get_best_move(system_prompt, api_provider, model_name, move_history, encoder, gate=None, cache=None,
+                  solver=None, fallback_timeout=None, board_input="image", capture=capture_screenshot,
+                  speculation=None):
+    """
+    Takes a screenshot, sends it to the LLM, and extracts the best move and reasoning,
+    considering the previous four moves and thoughts.
+    If a frame-change gate is given, unchanged frames (e.g. while tiles are still
+    animating) are re-captured instead of being sent.
+    If a response cache is given, boards seen before are answered from the cache.
+    With api_provider "local" the move comes from the expectimax solver instead; with
+    `fallback_timeout`, the solver also answers whenever the model takes longer than that,
+    and it always answers when the provider is unavailable (errors, open circuit).
+    The board is read from the screenshot's pixels to fingerprint the state; with
+    board_input "text" it is sent to the model as text instead of the image.
+    `capture` returns the current frame (the pygame window by default).
+    With a speculative prefetcher, a request already made for the board while the last
+    move was executing is used instead of a new one.
+    Returns (move, thought, state fingerprint, board or None).
+    """
+    screenshot = capture()
+    while gate is not None and not gate.check(screenshot):
+        time.sleep(0.05)
+        screenshot = capture()
 
-    start_time = time.time()
+    board = parse_board(screenshot)
+    state = state_fingerprint(board=board) if board is not None else state_fingerprint(image=screenshot)
+
+    if api_provider == "local":
+        move, thought = solve_locally(solver, board)
+        return move, thought, state, board
 
-    if api_provider == "anthropic":
-        response = anthropic_completion(system_prompt, model_name, base64_image, move_prompt)
-    elif api_provider == "openai":
-        response = openai_completion(system_prompt, model_name, base64_image, move_prompt)
-    elif api_provider == "gemini":
-        response = gemini_completion(system_prompt, model_name, base64_image, move_prompt)
+    if board_input == "text" and board is not None:
+        base64_image = None
+        board_prompt = text_board_prompt(board)
     else:
-        raise NotImplementedError(f"API provider '{api_provider}' is not supported.")
+        base64_image = encoder.encode(screenshot, debug_stem="cache/2048/2048_screenshot")
+        board_prompt = ""
+
+    move_prompt = build_move_prompt(board_prompt, move_history)
+
+    # The history changes every move, so the cache is keyed on the instructions and the board only.
+    cache_key = ResponseCache.make_key(api_provider, model_name, system_prompt, move_instructions, state)
+    response = None
+    if cache is not None:
+        if move_history and move_history[-1].get("state") == state:
+            # The last move left the board unchanged; don't replay the same decision.
+            cache.invalidate(cache_key)
+        else:
+            response = cache.get(cache_key)
 
-    latency = time.time() - start_time
-    print(f"[INFO] LLM Response Latency: {latency:.2f}s")
+    if response is not None:
+        print(f"[INFO] Cache hit ({cache.summary()})")
+    else:
+        start_time = time.time()
+        request = speculation.take(board) if speculation is not None and board is not None else None
+        if request is not None:
+            print(f"[INFO] Speculative hit ({speculation.summary()})")
+        else:
+            # Past the fallback timeout the answer is dropped, so there is no point retrying beyond it.
+            deadline = start_time + fallback_timeout if fallback_timeout else None
+            request = _request_executor.submit(
+                completion, api_provider, system_prompt, model_name, base64_image, move_prompt, deadline
+            )
+        try:
+            response = request.result(timeout=fallback_timeout if solver is not None else None)
+        except FutureTimeout:
+            # The late response still finishes in the background and is simply dropped.
+            print(f"[INFO] LLM slower than {fallback_timeout}s, falling back to the local solver")
+            move, thought = solve_locally(solver, board)
+            return move, thought, state, board
+        except ProviderUnavailable as e:
+            if gate is not None:
+                gate.rollback(screenshot)
+            if solver is None:
+                return "unknown", f"Model unavailable: {e}", state, board
+            print(f"[INFO] Model unavailable ({e}), falling back to the local solver")
+            move, thought = solve_locally(solver, board)
+            return move, thought, state, board
+        latency = time.time() - start_time
+        payload = f"image payload: {len(base64_image)} bytes" if base64_image is not None else "text board"
+        print(f"[INFO] LLM Response Latency: {latency:.2f}s, {payload}")
     
     # Regular expression to extract move and thought
     match = re.search(r'move:\s*"?(up|down|left|right)"?,\s*thought:\s*"([^"]+)"', response, re.IGNORECASE)
@@ -182,11 +380,13 @@ def get_best_move(system_prompt, api_provider, model_name, move_history):
     if match:
         move = match.group(1).strip().lower()  # Extract the move (up, down, left, right)
         thought = match.group(2).strip()  # Extract the reasoning
+        if cache is not None:
+            cache.put(cache_key, response)
     else:
         print(f"[WARNING] Unexpected response format: {response}")
         move, thought = "unknown", "Failed to extract reasoning."
 
-    return move, thought
+    return move, thought, state, board
 
 def main():
     """
@@ -195,13 +395,56 @@ def main():
     """
     parser = argparse.ArgumentParser(description="2048 LLM AI Agent (Single Worker)")
     parser.add_argument("--api_provider", type=str, default="openai",
-                        help="API provider to use (anthropic, openai, gemini).")
+                        help="API provider to use (anthropic, openai, gemini), or 'local' for the expectimax solver.")
     parser.add_argument("--model_name", type=str, default="gpt-4-turbo",
                         help="Model name.")
-    parser.add_argument("--loop_interval", type=float, default=0.5,
-                        help="Time in seconds between moves.")
+    parser.add_argument("--loop_interval", type=float, default=0.0,
+                        help="Extra delay in seconds after each move; frames are captured once the board has settled.")
+    parser.add_argument("--settle_timeout", type=float, default=1.0,
+                        help="Longest wait in seconds for the board to settle after a move; 0 captures right away.")
+    parser.add_argument("--settle_poll", type=float, default=0.02,
+                        help="Interval in seconds between the small captures compared while waiting for the board to settle.")
+    parser.add_argument("--local_fallback", type=float, default=None,
+                        help="Use the local solver's move when the model takes longer than this many seconds.")
+    parser.add_argument("--board_input", type=str, default="image", choices=["image", "text"],
+                        help="Send the model the screenshot, or the board read from its pixels as text.")
+    parser.add_argument("--game_url", type=str, default=None,
+                        help="Play a headless game served by server.py (e.g. http://127.0.0.1:8048) instead of the pygame window.")
+    add_solver_args(parser)
+    add_frame_args(parser)
+    add_gate_args(parser)
+    add_cache_args(parser)
+    add_speculation_args(parser)
+    add_hedging_args(parser)
 
     args = parser.parse_args()
+    if args.speculate and args.board_input != "text":
+        parser.error("--speculate needs --board_input text: predicted boards are sent to the model as text.")
+    configure_hedging_from_args(args)
+    encoder = FrameEncoder.from_args(args, preprocess_config)
+    gate = FrameChangeGate.from_args(args)
+    cache = ResponseCache.from_args(args)
+    # Also keeps the game going when the provider is unavailable.
+    solver = ExpectimaxSolver.from_args(args)
+    speculation = SpeculativePrefetcher.from_args(args) if args.speculate and args.api_provider != "local" else None
+
+    if args.game_url:
+        game = Game2048Client(args.game_url)
+        game.reset()
+        capture = game.render_image
+
+        def press(move):
+            _, _, done, info = game.step(move)
+            if done:
+                print(f"Game over ({info['status']}), score {info['score']}. Starting a new game...")
+                game.reset()
+    else:
+        import pyautogui
+        press = pyautogui.press
+        if args.settle_timeout > 0:
+            capture = SettledCapture(capture_screenshot, args.settle_timeout, args.settle_poll)
+        else:
+            capture = capture_screenshot
 
     print(f"Starting 2048 AI Agent...")
     print(f"API Provider: {args.api_provider}, Model Name: {args.model_name}")
@@ -210,20 +453,40 @@ def main():
 
     try:
         while True:
-            move, thought = get_best_move(system_prompt, args.api_provider, args.model_name, list(move_history))
-            move_history.append({"move": move, "thought": thought})  # Add move to history
+            move, thought, state, board = get_best_move(
+                system_prompt, args.api_provider, args.model_name, list(move_history), encoder, gate, cache,
+                solver, args.local_fallback, args.board_input, capture, speculation
+            )
+            move_history.append({"move": move, "thought": thought, "state": state})  # Add move to history
 
             if move in ["up", "right", "left", "down"]:
-                pyautogui.press(move)
+                if speculation is not None and board is not None:
+                    # Ask about the likely next boards while this move executes.
+                    history = list(move_history)
+                    speculation.prefetch(board, move, lambda successor: completion(
+                        args.api_provider, system_prompt, args.model_name, None,
+                        build_move_prompt(text_board_prompt(successor), history)
+                    ))
+                press(move)
                 print(f"Executed move: {move}")
                 print(f"Thought: {thought}")  # Print the reasoning for the move
+                print(f"Frame gate: {gate.summary()}")
             else:
                 print(f"Invalid move received: {move}, Thought: {thought}")
 
-            time.sleep(args.loop_interval)  # Delay before next move
+            if args.loop_interval > 0:
+                time.sleep(args.loop_interval)  # Optional extra delay before next move
 
     except KeyboardInterrupt:
         print("\nGame interrupted by user. Exiting...")
+    finally:
+        if solver is not None:
+            solver.close()
+        if speculation is not None:
+            print(f"Speculation: {speculation.summary()}")
+            speculation.close()
+        if args.api_provider != "local":
+            print(f"Providers:\n{provider_summary()}")
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,182 @@
+"""
+Vectorized 2048 environment stepping many boards at once with NumPy.
+
+Boards are an (N, 4, 4) uint8 array of tile exponents (0 = empty, 1 = 2, 2 = 4, ...).
+Each line a move slides (rows for left/right, columns for up/down) is packed into a
+16-bit index and looked up in the same row tables as the bitboard engine in logic.py,
+so a step is a handful of array operations regardless of N.
+"""
+
+import time
+import argparse
+
+import numpy as np
+
+from logic import ROW_LEFT, ROW_RIGHT, SCORE_LEFT, SCORE_RIGHT
+
+DIRECTIONS = ("w", "a", "s", "d")
+_VERTICAL = np.array([True, False, True, False])
+_TOWARDS_END = np.array([0, 0, 1, 1], dtype=np.int64)  # down and right slide towards index 3
+
+# Row tables flattened as [towards_end * 65536 + packed_line].
+_LINE_TABLE = np.array(ROW_LEFT + ROW_RIGHT, dtype=np.uint16)
+_SCORE_TABLE = np.array(SCORE_LEFT + SCORE_RIGHT, dtype=np.int64)
+# Whether a packed line can slide in at least one direction.
+_CAN_SLIDE = (_LINE_TABLE[:65536] != np.arange(65536)) | (_LINE_TABLE[65536:] != np.arange(65536))
+_SHIFTS = np.array([0, 4, 8, 12], dtype=np.uint16)
+
+
+def _pack_lines(boards):
+    """
+    (N, 4, 4) exponents -> packed rows and packed columns, both (N, 4) uint16 with
+    index 0 of the line in the lowest nibble.
+    """
+    b = boards.astype(np.uint16)
+    rows = b[:, :, 0] | (b[:, :, 1] << 4) | (b[:, :, 2] << 8) | (b[:, :, 3] << 12)
+    cols = b[:, 0, :] | (b[:, 1, :] << 4) | (b[:, 2, :] << 8) | (b[:, 3, :] << 12)
+    return rows, cols
+
+
+def _unpack_lines(lines):
+    """
+    (N, 4) packed lines -> (N, 4, 4) exponents with one line per row.
+    """
+    return ((lines[..., None] >> _SHIFTS) & 0xF).astype(np.uint8)
+
+
+class BatchGame2048:
+    """
+    N independent 2048 games stepped together.
+
+    Moves, merges and scores follow logic.py; a 2 or 4 is spawned on a random empty cell
+    of every board that changed, with the same rule as `fillTwoOrFour` (the first tiles
+    of a game are 2s, later ones 2 or 4 with equal probability). Boards that reached
+    `max_tile` or ran out of moves are marked done and ignored by `step` until reset.
+    """
+
+    def __init__(self, num_boards, seed=None, max_tile=2048):
+        self.num_boards = num_boards
+        self.win_exponent = max_tile.bit_length() - 1
+        self.rng = np.random.default_rng(seed)
+        self.boards = np.zeros((num_boards, 4, 4), dtype=np.uint8)
+        self.scores = np.zeros(num_boards, dtype=np.int64)
+        self.done = np.zeros(num_boards, dtype=bool)
+        self.reset()
+
+    def reset(self, mask=None):
+        """
+        Start new games on the boards selected by `mask` (all boards by default).
+        """
+        if mask is None:
+            mask = np.ones(self.num_boards, dtype=bool)
+        self.boards[mask] = 0
+        self.scores[mask] = 0
+        self.done[mask] = False
+        self._spawn(mask)
+        self._spawn(mask)
+
+    def step(self, directions):
+        """
+        Apply one move per board.
+
+        Parameters:
+            directions: (N,) array of indices into DIRECTIONS, or a string/sequence of "w", "a", "s", "d"
+        Returns:
+            (tuple): rewards (N,) int64, changed (N,) bool, done (N,) bool
+        """
+        directions = self._direction_indices(directions)
+        vertical = _VERTICAL[directions]
+        towards_end = _TOWARDS_END[directions]
+
+        rows, cols = _pack_lines(self.boards)
+        lines = np.where(vertical[:, None], cols, rows)
+        index = (towards_end << 16)[:, None] + lines
+        new_lines = _LINE_TABLE.take(index)
+        rewards = _SCORE_TABLE.take(index).sum(axis=1)
+
+        changed = (new_lines != lines).any(axis=1) & ~self.done
+        rewards[~changed] = 0
+        new = _unpack_lines(new_lines[changed])
+        flip = vertical[changed]
+        new[flip] = new[flip].transpose(0, 2, 1)
+        self.boards[changed] = new
+        self.scores += rewards
+        self._spawn(changed)
+        self.done |= self.status_codes() != 0
+        return rewards, changed, self.done.copy()
+
+    def status_codes(self):
+        """
+        Per-board game status: 0 = PLAY, 1 = WIN, -1 = LOSE (mirrors `checkGameStatus`).
+        """
+        win = self.boards.reshape(self.num_boards, 16).max(axis=1) >= self.win_exponent
+        rows, cols = _pack_lines(self.boards)
+        lose = ~(_CAN_SLIDE[rows].any(axis=1) | _CAN_SLIDE[cols].any(axis=1))
+        return np.where(win, 1, np.where(lose, -1, 0))
+
+    def tiles(self):
+        """
+        Boards as tile values (N, 4, 4), like the list-of-lists boards of logic.py.
+        """
+        return np.where(self.boards > 0, np.left_shift(1, self.boards.astype(np.int64)), 0)
+
+    def _direction_indices(self, directions):
+        if isinstance(directions, str) or (len(directions) and isinstance(directions[0], str)):
+            directions = [DIRECTIONS.index(d) for d in directions]
+        directions = np.asarray(directions, dtype=np.intp)
+        if directions.shape != (self.num_boards,):
+            raise ValueError(f"Expected {self.num_boards} directions, got shape {directions.shape}.")
+        return directions
+
+    def _spawn(self, mask):
+        """
+        Place one tile on a random empty cell of every board selected by `mask`.
+        """
+        flat = self.boards.reshape(self.num_boards, 16)
+        boards = np.nonzero(mask)[0]
+        empty = flat[boards] == 0
+        num_empty = empty.sum(axis=1, dtype=np.int8)
+        keep = num_empty > 0
+        boards, empty, num_empty = boards[keep], empty[keep], num_empty[keep]
+        if not len(boards):
+            return
+
+        # Uniform choice among the empty cells: pick the k-th empty cell, k uniform in [0, num_empty).
+        k = (self.rng.random(len(boards)) * num_empty).astype(np.int64)
+        cells = ((np.cumsum(empty, axis=1, dtype=np.int8) == (k + 1)[:, None]) & empty).argmax(axis=1)
+
+        # fillTwoOrFour places a 2 while the tile sum is 0 or 2 (empty board or a single 2).
+        first_tiles = (num_empty == 16) | ((num_empty == 15) & (flat[boards].max(axis=1) == 1))
+        exponents = np.where(first_tiles, 1, self.rng.integers(1, 3, len(boards)))
+        flat[boards, cells] = exponents
+
+
+def benchmark(num_boards, steps, seed=None):
+    """
+    Play uniformly random moves on `num_boards` boards and return board-steps per second.
+    Finished boards are reset so the whole batch stays busy.
+    """
+    env = BatchGame2048(num_boards, seed=seed)
+    rng = np.random.default_rng(seed)
+    start = time.perf_counter()
+    for _ in range(steps):
+        env.step(rng.integers(0, 4, num_boards))
+        if env.done.any():
+            env.reset(env.done)
+    elapsed = time.perf_counter() - start
+    return num_boards * steps / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the vectorized 2048 environment with a random policy.")
+    parser.add_argument("--num_boards", type=int, default=10000, help="Number of boards stepped together.")
+    parser.add_argument("--steps", type=int, default=200, help="Number of batch steps.")
+    parser.add_argument("--seed", type=int, default=0, help="RNG seed.")
+    args = parser.parse_args()
+
+    rate = benchmark(args.num_boards, args.steps, args.seed)
+    print(f"{rate:,.0f} board-steps/s ({args.num_boards} boards x {args.steps} steps)")
+
+
+if __name__ == "__main__":
+    main()
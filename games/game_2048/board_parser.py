@@ -0,0 +1,132 @@
+"""
+Read the 2048 board from a screenshot of the pygame window.
+
+game.py draws every tile as a flat rectangle whose colour comes from constants.json,
+on a 4x4 grid whose geometry only depends on the window size (see `display`). The
+window is located once by its background colour; after that, each frame is read by
+sampling a few pixels inside every tile, away from the digits, and matching them to
+the closest palette colour, which takes well under a millisecond.
+"""
+
+import os
+import json
+
+import numpy as np
+
+from tools.frames import PixelView
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+with open(os.path.join(BASE_DIR, "constants.json"), "r") as f:
+    COLOURS = json.load(f)["colour"]
+
+# Maximum distance (RGB Euclidean) between a sampled colour and the palette.
+MAX_COLOUR_DISTANCE = 30.0
+
+
+class BoardParser:
+    """
+    Reads boards from screenshots of the game window.
+
+    The window geometry is found on the first frame and reused while the frame size
+    stays the same and the background is still where it is expected; otherwise the
+    parser re-locates the window.
+    """
+
+    def __init__(self, theme="light"):
+        self.theme = theme
+        self.background = np.array(COLOURS[theme]["background"], dtype=np.int16)
+        keys = [key for key in COLOURS[theme] if key.isdigit()]
+        self.values = np.array([int(key) for key in keys])
+        self.palette = np.array([COLOURS[theme][key] for key in keys], dtype=np.float32)
+
+        self._shape = None
+        self._sample_y = None
+        self._sample_x = None
+        self._check_y = None
+        self._check_x = None
+
+    def calibrate(self, frame):
+        """
+        Locate the window by its background colour and precompute the sample points.
+        """
+        rgb = frame.rgb().astype(np.int16)
+        ys, xs = np.nonzero((np.abs(rgb - self.background) <= 2).all(axis=2))
+        if len(xs) == 0:
+            raise ValueError("No 2048 window found in the screenshot.")
+        left, top = xs.min(), ys.min()
+        width, height = xs.max() - left + 1, ys.max() - top + 1
+
+        # Same layout as game.display().
+        box = width // 4
+        padding = box // 10
+        grid_start_y = height // 10 + padding
+        inset = max((box - 2 * padding) // 8, 1)
+
+        sample_y, sample_x = [], []
+        for i in range(4):
+            for j in range(4):
+                x0 = left + j * box + padding
+                x1 = x0 + box - 2 * padding - 1
+                # Sample along the top edge of the tile: the digits sit in the middle
+                # and the bottom row of tiles may be clipped by the window.
+                y = min(top + i * box + grid_start_y + inset, top + height - 1)
+                sample_y.append([y, y, y])
+                sample_x.append([x0 + inset, (x0 + x1) // 2, x1 - inset])
+
+        self._shape = frame.shape
+        self._sample_y = np.array(sample_y)
+        self._sample_x = np.array(sample_x)
+        # Gaps left of each tile column and above the grid are always background.
+        self._check_y = np.array([top + height // 10 + padding // 2] * 4)
+        self._check_x = np.array([left + j * box + padding // 2 for j in range(4)])
+
+    def _calibrated_for(self, frame):
+        if self._shape != frame.shape:
+            return False
+        checks = frame.sample(self._check_y, self._check_x).astype(np.int16)
+        return bool((np.abs(checks - self.background) <= 2).all())
+
+    def parse(self, image):
+        """
+        Rebuild the board matrix from a screenshot.
+
+        Parameters:
+            image: screenshot of the game window (PIL image, mss ScreenShot or ndarray)
+        Returns:
+            (list): 4x4 game board of tile values
+        Raises:
+            ValueError: if the game window or a tile cannot be recognised
+        """
+        frame = PixelView(image)
+        if not self._calibrated_for(frame):
+            self.calibrate(frame)
+
+        samples = frame.sample(self._sample_y, self._sample_x).astype(np.float32)
+        colours = np.median(samples, axis=1)  # (16, 3)
+        distances = np.linalg.norm(colours[:, None, :] - self.palette[None, :, :], axis=2)
+        best = distances.argmin(axis=1)
+        misses = np.nonzero(distances[np.arange(16), best] > MAX_COLOUR_DISTANCE)[0]
+        if len(misses):
+            cell = misses[0]
+            raise ValueError(f"Unrecognised tile colour {tuple(colours[cell])} at {divmod(cell, 4)}.")
+        return self.values[best].reshape(4, 4).tolist()
+
+
+_parsers = {}
+
+
+def read_board(image, theme="light"):
+    """
+    Rebuild the board matrix from a screenshot with a shared BoardParser per theme.
+    """
+    if theme not in _parsers:
+        _parsers[theme] = BoardParser(theme)
+    return _parsers[theme].parse(image)
+
+
+def board_to_text(board):
+    """
+    Compact text rendering of a board for text-only prompts, one row per line.
+    """
+    width = max(len(str(cell)) for row in board for cell in row)
+    return "\n".join(" ".join(str(cell).rjust(width) for cell in row) for row in board)
@@ -1,7 +1,6 @@
 import json
 import sys
 import time
-from copy import deepcopy
 
 import pygame
 from pygame.locals import *
@@ -25,18 +24,18 @@ WHITE = (255, 255, 255)
 score = 0
 
 
-def winCheck(board, status, theme, text_col, size):
+def winCheck(state, status, theme, text_col, size):
     """
     Check game status and display win/lose result.
 
     Parameters:
-        board (list): game board
+        state (Game2048State): game state
         status (str): game status
         theme (str): game interface theme
         text_col (tuple): text colour
         size (tuple): (width, height) of the game window
     Returns:
-        board (list): updated game board
+        state (Game2048State): updated game state
         status (str): game status
     """
     if status != "PLAY":
@@ -49,8 +48,8 @@ def winCheck(board, status, theme, text_col, size):
         title_font_size = max(size[0] // 10, 36)  # Scale with screen width
         subtitle_font_size = max(size[0] // 20, 24)  # Slightly smaller for prompts
 
-        title_font = pygame.font.SysFont(c["font"], title_font_size, bold=True)
-        subtitle_font = pygame.font.SysFont(c["font"], subtitle_font_size, bold=True)
+        title_font = renderer.font(title_font_size)
+        subtitle_font = renderer.font(subtitle_font_size)
 
         # Display win/lose message
         msg = "YOU WIN!" if status == "WIN" else "GAME OVER!"
@@ -70,6 +69,7 @@ def winCheck(board, status, theme, text_col, size):
         screen.blit(restart_text, (restart_x, restart_y))
 
         pygame.display.update()
+        renderer.invalidate()  # The overlay covers the board
 
         while True:
             for event in pygame.event.get():
@@ -81,10 +81,10 @@ def winCheck(board, status, theme, text_col, size):
 
                 if event.type == pygame.KEYDOWN and event.key == pygame.K_y:
                     # 'Y' is pressed to start a new game
-                    board = newGame(theme, text_col, size)
-                    return board, "PLAY"
+                    state = newGame(theme, text_col, size)
+                    return state, "PLAY"
 
-    return board, status
+    return state, status
 
 
 def newGame(theme, text_col, size):
@@ -96,15 +96,14 @@ def newGame(theme, text_col, size):
         text_col (tuple): text colour
         size (tuple): (width, height) of the game window
     Returns:
-        board (list): new game board
+        state (Game2048State): new game state
     """
     # Clear the board to start a new game
-    board = [[0] * 4 for _ in range(4)]
-    display(board, theme, size, 0)  # Display with zero score
+    display(Game2048State().to_list(), theme, size, 0)  # Display with zero score
 
     # Dynamically adjust font size based on window size
     font_size = max(size[0] // 15, 24)  # Scales with screen width, min size 24
-    title_font = pygame.font.SysFont(c["font"], font_size, bold=True)
+    title_font = renderer.font(font_size)
 
     # Render "NEW GAME!" text
     new_game_text = title_font.render("NEW GAME!", True, text_col)
@@ -116,18 +115,19 @@ def newGame(theme, text_col, size):
     # Blit text to screen at centered position
     screen.blit(new_game_text, (text_x, text_y))
     pygame.display.update()
+    renderer.invalidate()  # The message covers the board
 
     # Wait for 1 second before starting game
     time.sleep(1)
 
     # Fill two random tiles at the beginning
-    board = fillTwoOrFour(board, iter=2)
-    display(board, theme, size, 0)
+    state = Game2048State.new()
+    display(state.to_list(), theme, size, 0)
 
-    return board
+    return state
 
 
-def restart(board, theme, text_col, size):
+def restart(state, theme, text_col, size):
     """
     Restart the game immediately when 'N' is pressed.
     """
@@ -135,82 +135,125 @@ def restart(board, theme, text_col, size):
     return newGame(theme, text_col, size)
 
 
-def display(board, theme, size, score):
+class BoardRenderer:
     """
-    Display the board 'matrix' on the game window.
+    Draws the board on the game window with as little work per frame as possible.
 
-    Parameters:
-        board (list): game board
-        theme (str): game interface theme
-        size (tuple): (width, height) of the game window
-        score (int): current game score
+    Fonts are created once per size, and every tile (colour + number) is rendered once
+    per (value, theme, box size) and then just blitted. Only the tiles and the score
+    that changed since the last frame are redrawn, and only their rectangles are
+    pushed to the display. Anything drawn over the board (overlays, messages) must
+    call `invalidate()` so the next frame is redrawn in full.
     """
-    screen.fill(tuple(c["colour"][theme]["background"]))
-
-    grid_size = 4  # 2048 is a 4x4 grid
-
-    # Add space at the top for score display
-    score_height = size[1] // 10  # Reserve 10% of screen height for score
-
-    # Adjust box size to account for score area
-    box = size[0] // grid_size  # Width stays the same
-    padding = box // 10  # Set padding relative to box size
-
-    # Update font size dynamically based on tile size
-    font_size = max(box // 3, 24)  # Ensure font is proportional but not too small
-    my_font = pygame.font.SysFont(c["font"], font_size, bold=True)
-
-    # Score display - make it larger and more prominent
-    score_font_size = max(size[0] // 20, 28)  # Larger font for score
-    score_font = pygame.font.SysFont(c["font"], score_font_size, bold=True)
-    score_text = score_font.render(
-        f"Score: {score}",
-        True,
-        tuple(
-            c["colour"][theme]["dark"]
-            if theme == "light"
-            else c["colour"][theme]["light"]
-        ),
-    )
-
-    # Center the score text horizontally
-    score_x = (size[0] - score_text.get_width()) // 2
-    screen.blit(score_text, (score_x, padding))
-
-    # Adjust the starting y-position for the grid to make room for score
-    grid_start_y = score_height + padding
-
-    for i in range(grid_size):
-        for j in range(grid_size):
-            colour = tuple(c["colour"][theme][str(board[i][j])])
-            pygame.draw.rect(
-                screen,
-                colour,
-                (
-                    j * box + padding,
-                    i * box + grid_start_y,  # Offset by score area
-                    box - 2 * padding,
-                    box - 2 * padding,
-                ),
-                0,
-            )
 
-            if board[i][j] != 0:
-                if board[i][j] in (2, 4):
+    def __init__(self):
+        self._fonts = {}
+        self._tiles = {}
+        self._layout = None  # (theme, size) of the frame on screen
+        self._drawn = {}  # (i, j) -> value currently on screen
+        self._score = None
+        self._score_rect = None
+
+    def font(self, size):
+        if size not in self._fonts:
+            self._fonts[size] = pygame.font.SysFont(c["font"], size, bold=True)
+        return self._fonts[size]
+
+    def invalidate(self):
+        self._layout = None
+
+    def tile(self, value, theme, box):
+        """
+        Pre-rendered tile surface, number included, cached on (value, theme, box size).
+        """
+        key = (value, theme, box)
+        if key not in self._tiles:
+            padding = box // 10
+            surface = pygame.Surface((box - 2 * padding, box - 2 * padding))
+            surface.fill(tuple(c["colour"][theme][str(value)]))
+            if value != 0:
+                if value in (2, 4):
                     text_colour = tuple(c["colour"][theme]["dark"])
                 else:
                     text_colour = tuple(c["colour"][theme]["light"])
 
-                # Render number text centered within tile
-                text_surface = my_font.render(f"{board[i][j]}", True, text_colour)
+                # Font size is proportional to the tile but not too small
+                text_surface = self.font(max(box // 3, 24)).render(f"{value}", True, text_colour)
+
+                # Centered within the tile's box, relative to the tile's top-left corner
+                text_x = (box - text_surface.get_width()) // 2 - padding
+                text_y = (box - text_surface.get_height()) // 2
+                surface.blit(text_surface, (text_x, text_y))
+            self._tiles[key] = surface
+        return self._tiles[key]
+
+    def draw(self, board, theme, size, score):
+        grid_size = 4  # 2048 is a 4x4 grid
+
+        # Reserve 10% of screen height for the score; tiles are a quarter of the width
+        score_height = size[1] // 10
+        box = size[0] // grid_size
+        padding = box // 10
+        grid_start_y = score_height + padding
+
+        full = self._layout != (theme, size)
+        if full:
+            screen.fill(tuple(c["colour"][theme]["background"]))
+            self._layout = (theme, size)
+            self._drawn = {}
+            self._score = None
+            self._score_rect = None
+
+        dirty = []
+        if score != self._score:
+            if self._score_rect is not None:
+                screen.fill(tuple(c["colour"][theme]["background"]), self._score_rect)
+                dirty.append(self._score_rect)
+
+            # Score display - make it larger and more prominent
+            score_text = self.font(max(size[0] // 20, 28)).render(
+                f"Score: {score}",
+                True,
+                tuple(
+                    c["colour"][theme]["dark"]
+                    if theme == "light"
+                    else c["colour"][theme]["light"]
+                ),
+            )
+            score_x = (size[0] - score_text.get_width()) // 2
+            self._score_rect = screen.blit(score_text, (score_x, padding))
+            self._score = score
+            dirty.append(self._score_rect)
+
+        for i in range(grid_size):
+            for j in range(grid_size):
+                value = board[i][j]
+                if self._drawn.get((i, j)) == value:
+                    continue
+                position = (j * box + padding, i * box + grid_start_y)  # Offset by score area
+                dirty.append(screen.blit(self.tile(value, theme, box), position))
+                self._drawn[(i, j)] = value
 
-                # Calculate center position dynamically
-                text_x = j * box + (box - text_surface.get_width()) // 2
-                text_y = i * box + grid_start_y + (box - text_surface.get_height()) // 2
+        if full:
+            pygame.display.update()
+        elif dirty:
+            pygame.display.update(dirty)
 
-                screen.blit(text_surface, (text_x, text_y))
 
-    pygame.display.update()
+renderer = BoardRenderer()
+
+
+def display(board, theme, size, score):
+    """
+    Display the board 'matrix' on the game window.
+
+    Parameters:
+        board (list): game board
+        theme (str): game interface theme
+        size (tuple): (width, height) of the game window
+        score (int): current game score
+    """
+    renderer.draw(board, theme, size, score)
 
 
 def playGame(theme, difficulty, size):
@@ -223,13 +266,12 @@ def playGame(theme, difficulty, size):
     """
     # Initialise game status
     status = "PLAY"
-    score = 0  # Initialize score
 
     # Set text colour according to theme
     text_col = (0, 0, 0) if theme == "light" else (255, 255, 255)
 
-    board = newGame(theme, text_col, size)
-    display(board, theme, size, score)  # Display initial board with score
+    state = newGame(theme, text_col, size)
+    display(state.to_list(), theme, size, state.score)  # Display initial board with score
 
     # Define movement key mappings
     movement_keys = {
@@ -252,9 +294,8 @@ def playGame(theme, difficulty, size):
 
                 if event.key == pygame.K_LCTRL or event.key == pygame.K_RCTRL:
                     print("Restarting game...")
-                    board = restart(board, theme, text_col, size)
-                    score = 0  # Reset score on restart
-                    display(board, theme, size, score)
+                    state = restart(state, theme, text_col, size)  # Score starts over with the new state
+                    display(state.to_list(), theme, size, state.score)
                     continue
 
                 # Handle Movement Keys
@@ -262,23 +303,15 @@ def playGame(theme, difficulty, size):
                     key = movement_keys[event.key]
                     print(f"Key mapped: {key}")  # Debugging output
 
-                    # Store old board to check for changes
-                    old_board = deepcopy(board)
-
-                    # Perform move
-                    new_board = move(key, deepcopy(board))
+                    # Perform move; the state reports the reward and whether anything moved
+                    state, _, changed = state.step(key)
 
                     # Only update board if there was a change
-                    if new_board != old_board:
-                        # Get score from the move
-                        points = get_last_score()
-                        score += points
-
-                        board = fillTwoOrFour(new_board)
-                        display(board, theme, size, score)
+                    if changed:
+                        display(state.to_list(), theme, size, state.score)
 
                         # Update game status
-                        status = checkGameStatus(board, difficulty)
+                        status = state.status(difficulty)
 
                         # Check win/lose
-                        board, status = winCheck(board, status, theme, text_col, size)
+                        state, status = winCheck(state, status, theme, text_col, size)
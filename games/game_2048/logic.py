@@ -1,244 +1,367 @@
-import random
+"""
+2048 engine on 64-bit bitboards.
 
-# Add this global variable at the top of the file
-last_score = 0
+A board is packed into a single int: 16 cells of 4 bits each, holding the tile
+exponent (0 = empty, 1 = 2, 2 = 4, ..., 15 = 32768). Cell (i, j) lives at bits
+4 * (4 * i + j), so row i is the 16-bit chunk starting at bit 16 * i and, within a
+row, column 0 is the lowest nibble.
 
+Left/right moves and their score deltas are looked up per row in precomputed
+65536-entry tables; up/down moves transpose the board and reuse the row tables.
+All move functions are pure and return (new_board, score_gained, changed).
+Game2048State wraps a bitboard and its score in an immutable, reentrant object
+whose step() returns the reward directly.
+"""
 
-def move(direction, board):
-    """
-    Call functions to move & merge in the specified direction.
+import random
 
-    Parameters:
-        direction (str): direction in which to move the tiles
-        board (list): game board
-    Returns:
-        (list): updated board after move completion
-    """
-    global last_score
-    last_score = 0  # Reset score for this move
+ROW_MASK = 0xFFFF
+MAX_EXPONENT = 15
 
-    if direction == "w":
-        return moveUp(board)
-    if direction == "s":
-        return moveDown(board)
-    if direction == "a":
-        return moveLeft(board)
-    if direction == "d":
-        return moveRight(board)
 
+def _reverse_row(row):
+    return (
+        ((row & 0x000F) << 12)
+        | ((row & 0x00F0) << 4)
+        | ((row & 0x0F00) >> 4)
+        | ((row & 0xF000) >> 12)
+    )
 
-def checkGameStatus(board, max_tile=2048):
+
+def _build_row_tables():
     """
-    Update the game status by checking if the max. tile has been obtained.
+    Precompute the result and score of sliding every possible row to the left and right.
+    """
+    row_left = [0] * 65536
+    row_right = [0] * 65536
+    score_left = [0] * 65536
+    score_right = [0] * 65536
+
+    for row in range(65536):
+        tiles = [(row >> (4 * j)) & 0xF for j in range(4)]
+        nonzero = [t for t in tiles if t]
+        merged, score = [], 0
+        j = 0
+        while j < len(nonzero):
+            if j + 1 < len(nonzero) and nonzero[j] == nonzero[j + 1] and nonzero[j] < MAX_EXPONENT:
+                merged.append(nonzero[j] + 1)
+                score += 1 << (nonzero[j] + 1)
+                j += 2
+            else:
+                merged.append(nonzero[j])
+                j += 1
+        merged.extend([0] * (4 - len(merged)))
+
+        result = 0
+        for j, t in enumerate(merged):
+            result |= t << (4 * j)
+        row_left[row] = result
+        score_left[row] = score
+
+    for row in range(65536):
+        reverse = _reverse_row(row)
+        row_right[row] = _reverse_row(row_left[reverse])
+        score_right[row] = score_left[reverse]
+
+    return row_left, row_right, score_left, score_right
+
+
+ROW_LEFT, ROW_RIGHT, SCORE_LEFT, SCORE_RIGHT = _build_row_tables()
+
+
+def encode_board(board):
+    """
+    Pack a list-of-lists board of tile values into a bitboard.
 
     Parameters:
-        board (list): game board
-        max_tile (int): tile number required to win, default = 2048
+        board (list): 4x4 game board of tile values (0, 2, 4, ...)
     Returns:
-        (str): game status WIN/LOSE/PLAY
+        (int): bitboard of tile exponents
     """
-    flat_board = [cell for row in board for cell in row]
-    if max_tile in flat_board:
-        # game has been won if max_tile value is found
-        return "WIN"
-
+    bits = 0
     for i in range(4):
         for j in range(4):
-            # check if a merge is possible
-            if (
-                j != 3
-                and board[i][j] == board[i][j + 1]
-                or i != 3
-                and board[i][j] == board[i + 1][j]
-            ):
-                return "PLAY"
-
-    if 0 not in flat_board:
-        return "LOSE"
-    else:
-        return "PLAY"
+            value = board[i][j]
+            if value:
+                bits |= (value.bit_length() - 1) << (4 * (4 * i + j))
+    return bits
 
 
-def fillTwoOrFour(board, iter=1):
+def decode_board(bits):
     """
-    Randomly fill 2 or 4 in available spaces on the board.
+    Unpack a bitboard into a list-of-lists board of tile values.
 
     Parameters:
-        board (list): game board
-        iter (int): number of times to repeat the process
+        bits (int): bitboard of tile exponents
     Returns:
-        board (list): updated game board
+        (list): 4x4 game board of tile values
     """
-    for _ in range(iter):
-        a = random.randint(0, 3)
-        b = random.randint(0, 3)
-        while board[a][b] != 0:
-            a = random.randint(0, 3)
-            b = random.randint(0, 3)
-
-        if sum([cell for row in board for cell in row]) in (0, 2):
-            board[a][b] = 2
-        else:
-            board[a][b] = random.choice((2, 4))
+    board = []
+    for i in range(4):
+        row = []
+        for j in range(4):
+            exponent = (bits >> (4 * (4 * i + j))) & 0xF
+            row.append(1 << exponent if exponent else 0)
+        board.append(row)
     return board
 
 
-def moveLeft(board):
+def transpose(bits):
     """
-    Move and merge tiles to the left.
-
-    Parameters:
-        board (list): game board
-    Returns:
-        board (list): updated game board
+    Swap rows and columns of a bitboard.
     """
-    global last_score
-    # initial shift
-    shiftLeft(board)
+    a1 = bits & 0xF0F00F0FF0F00F0F
+    a2 = bits & 0x0000F0F00000F0F0
+    a3 = bits & 0x0F0F00000F0F0000
+    a = a1 | (a2 << 12) | (a3 >> 12)
+    b1 = a & 0xFF00FF0000FF00FF
+    b2 = a & 0x00FF00FF00000000
+    b3 = a & 0x00000000FF00FF00
+    return b1 | (b2 >> 24) | (b3 << 24)
+
+
+def _slide_rows(bits, rows, scores):
+    r0 = bits & ROW_MASK
+    r1 = (bits >> 16) & ROW_MASK
+    r2 = (bits >> 32) & ROW_MASK
+    r3 = (bits >> 48) & ROW_MASK
+    new = rows[r0] | (rows[r1] << 16) | (rows[r2] << 32) | (rows[r3] << 48)
+    return new, scores[r0] + scores[r1] + scores[r2] + scores[r3]
+
+
+def move_left(bits):
+    new, score = _slide_rows(bits, ROW_LEFT, SCORE_LEFT)
+    return new, score, new != bits
+
+
+def move_right(bits):
+    new, score = _slide_rows(bits, ROW_RIGHT, SCORE_RIGHT)
+    return new, score, new != bits
 
-    # merge cells
-    for i in range(4):
-        for j in range(3):
-            if board[i][j] == board[i][j + 1] and board[i][j] != 0:
-                board[i][j] *= 2
-                last_score += board[i][j]  # Add score when merging
-                board[i][j + 1] = 0
-                j = 0
-
-    # final shift
-    shiftLeft(board)
-    return board
 
+def move_up(bits):
+    new, score = _slide_rows(transpose(bits), ROW_LEFT, SCORE_LEFT)
+    new = transpose(new)
+    return new, score, new != bits
 
-def moveUp(board):
+
+def move_down(bits):
+    new, score = _slide_rows(transpose(bits), ROW_RIGHT, SCORE_RIGHT)
+    new = transpose(new)
+    return new, score, new != bits
+
+
+MOVES = {"w": move_up, "s": move_down, "a": move_left, "d": move_right}
+
+
+def move_bits(direction, bits):
     """
-    Move ane merge tiles upwards.
+    Move & merge a bitboard in the specified direction.
 
     Parameters:
-        board (list): game board
+        direction (str): "w", "a", "s" or "d"
+        bits (int): bitboard
     Returns:
-        board (list): updated game board
+        (tuple): (new_board, score_gained, changed)
     """
-    global last_score
-    board = rotateLeft(board)
-    board = moveLeft(board)
-    board = rotateRight(board)
-    return board
+    return MOVES[direction](bits)
 
 
-def moveRight(board):
+def empty_cells(bits):
+    """
+    Return the indices (4 * i + j) of the empty cells of a bitboard.
     """
-    Move and merge tiles to the right.
+    return [k for k in range(16) if not (bits >> (4 * k)) & 0xF]
 
-    Parameters:
-        board (list): game board
-    Returns:
-        board (list): updated game board
+
+def max_exponent(bits):
+    return max((bits >> (4 * k)) & 0xF for k in range(16))
+
+
+def can_move(bits):
+    """
+    True if at least one direction changes the board.
     """
-    global last_score
-    # initial shift
-    shiftRight(board)
+    transposed = transpose(bits)
+    for board in (bits, transposed):
+        for shift in (0, 16, 32, 48):
+            row = (board >> shift) & ROW_MASK
+            if ROW_LEFT[row] != row or ROW_RIGHT[row] != row:
+                return True
+    return False
 
-    # merge cells
-    for i in range(4):
-        for j in range(3, 0, -1):
-            if board[i][j] == board[i][j - 1] and board[i][j] != 0:
-                board[i][j] *= 2
-                last_score += board[i][j]  # Add score when merging
-                board[i][j - 1] = 0
-                j = 0
-
-    # final shift
-    shiftRight(board)
-    return board
+
+def game_status(bits, max_tile=2048):
+    """
+    Game status of a bitboard: WIN once `max_tile` is reached, LOSE when no move is left, PLAY otherwise.
+    """
+    if max_exponent(bits) >= max_tile.bit_length() - 1:
+        return "WIN"
+    return "PLAY" if can_move(bits) else "LOSE"
 
 
-def moveDown(board):
+def spawn_tile(bits, rng=random):
     """
-    Move and merge tiles downwards.
+    Place a 2 or a 4 on a random empty cell of a bitboard, following `fillTwoOrFour`:
+    the first tiles of a game are always 2s, later ones are 2 or 4 with equal probability.
 
     Parameters:
-        board (list): game board
+        bits (int): bitboard
+        rng: random.Random-like source
     Returns:
-        board (list): updated game board
+        (int): updated bitboard
     """
-    global last_score
-    board = rotateLeft(board)
-    board = moveLeft(board)
-    shiftRight(board)
-    board = rotateRight(board)
-    return board
+    empty = empty_cells(bits)
+    if not empty:
+        return bits
+    cell = rng.choice(empty)
+    # Tile sum of 0 or 2: an empty board or a single 2.
+    if bits == 0 or (len(empty) == 15 and max_exponent(bits) == 1):
+        exponent = 1
+    else:
+        exponent = rng.choice((1, 2))
+    return bits | (exponent << (4 * cell))
 
 
-def shiftLeft(board):
+def spawn_outcomes(bits):
     """
-    Perform tile shift to the left.
+    Every board `spawn_tile` can produce from a bitboard, with its probability.
 
-    Parameters:
-        board (list): game board
+    Returns:
+        (list): (bitboard, probability) pairs, most likely first
     """
-    # remove 0's in between numbers
-    for i in range(4):
-        nums, count = [], 0
-        for j in range(4):
-            if board[i][j] != 0:
-                nums.append(board[i][j])
-                count += 1
-        board[i] = nums
-        board[i].extend([0] * (4 - count))
+    empty = empty_cells(bits)
+    if not empty:
+        return [(bits, 1.0)]
+    if bits == 0 or (len(empty) == 15 and max_exponent(bits) == 1):
+        spawns = ((1, 1.0),)
+    else:
+        spawns = ((1, 0.5), (2, 0.5))
+    outcomes = [
+        (bits | (exponent << (4 * cell)), prob / len(empty))
+        for exponent, prob in spawns for cell in empty
+    ]
+    outcomes.sort(key=lambda outcome: -outcome[1])
+    return outcomes
 
 
-def shiftRight(board):
+class Game2048State:
     """
-    Perform tile shift to the right.
+    Immutable 2048 game state: a bitboard plus the running score.
 
-    Parameters:
-        board (list): game board
+    Every operation returns a new state, so states can be shared between threads,
+    processes and search trees without copying or locking.
     """
-    # remove 0's in between numbers
-    for i in range(4):
-        nums, count = [], 0
-        for j in range(4):
-            if board[i][j] != 0:
-                nums.append(board[i][j])
-                count += 1
-        board[i] = [0] * (4 - count)
-        board[i].extend(nums)
 
+    __slots__ = ("board", "score")
+
+    def __init__(self, board=0, score=0):
+        object.__setattr__(self, "board", board)
+        object.__setattr__(self, "score", score)
+
+    def __setattr__(self, name, value):
+        raise AttributeError("Game2048State is immutable")
+
+    def __reduce__(self):
+        # pickle and copy would otherwise restore the slots through __setattr__.
+        return (Game2048State, (self.board, self.score))
+
+    @classmethod
+    def new(cls, rng=random):
+        """
+        Empty board with the two starting tiles.
+        """
+        return cls(spawn_tile(spawn_tile(0, rng), rng))
 
-def rotateLeft(board):
+    @classmethod
+    def from_list(cls, board, score=0):
+        return cls(encode_board(board), score)
+
+    def to_list(self):
+        return decode_board(self.board)
+
+    def after(self, direction):
+        """
+        Slide and merge without spawning a tile.
+
+        Returns:
+            (tuple): (afterstate, reward, changed)
+        """
+        board, reward, changed = move_bits(direction, self.board)
+        if not changed:
+            return self, 0, False
+        return Game2048State(board, self.score + reward), reward, True
+
+    def step(self, direction, rng=random):
+        """
+        Play one move: slide, merge and, if anything moved, spawn a new tile.
+
+        Parameters:
+            direction (str): "w", "a", "s" or "d"
+            rng: random.Random-like source for the spawned tile
+        Returns:
+            (tuple): (next_state, reward, changed)
+        """
+        board, reward, changed = move_bits(direction, self.board)
+        if not changed:
+            return self, 0, False
+        return Game2048State(spawn_tile(board, rng), self.score + reward), reward, True
+
+    def legal_moves(self):
+        return [direction for direction, fn in MOVES.items() if fn(self.board)[2]]
+
+    def status(self, max_tile=2048):
+        return game_status(self.board, max_tile)
+
+    def __eq__(self, other):
+        return isinstance(other, Game2048State) and (self.board, self.score) == (other.board, other.score)
+
+    def __hash__(self):
+        return hash((self.board, self.score))
+
+    def __repr__(self):
+        return f"Game2048State(board={self.board:#018x}, score={self.score})"
+
+
+def move(direction, board):
     """
-    90 degree counter-clockwise rotation.
+    Call functions to move & merge in the specified direction.
 
     Parameters:
+        direction (str): direction in which to move the tiles
         board (list): game board
     Returns:
-        b (list): new game board after rotation
+        (tuple): updated board after move completion, score gained by the move
     """
-    b = [[board[j][i] for j in range(4)] for i in range(3, -1, -1)]
-    return b
+    bits, score, _ = move_bits(direction, encode_board(board))
+    return decode_board(bits), score
 
 
-def rotateRight(board):
+def checkGameStatus(board, max_tile=2048):
     """
-    270 degree counter-clockwise rotation.
+    Update the game status by checking if the max. tile has been obtained.
 
     Parameters:
         board (list): game board
+        max_tile (int): tile number required to win, default = 2048
     Returns:
-        (list): new game board after rotation
+        (str): game status WIN/LOSE/PLAY
     """
-    b = rotateLeft(board)
-    b = rotateLeft(b)
-    return rotateLeft(b)
+    return game_status(encode_board(board), max_tile)
 
 
-def get_last_score():
+def fillTwoOrFour(board, iter=1):
     """
-    Get the score from the last move.
+    Randomly fill 2 or 4 in available spaces on the board.
 
+    Parameters:
+        board (list): game board
+        iter (int): number of times to repeat the process
     Returns:
-        (int): score from the last move
+        board (list): updated game board
     """
-    global last_score
-    return last_score
+    bits = encode_board(board)
+    for _ in range(iter):
+        bits = spawn_tile(bits)
+    board[:] = decode_board(bits)
+    return board
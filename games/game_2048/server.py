@@ -0,0 +1,286 @@
+"""
+Headless 2048: the game without pygame, a display or keyboard input.
+
+HeadlessGame2048 exposes reset()/step(action)/render_rgb() in-process, on top of the
+bitboard engine in logic.py. Frames are drawn with PIL using the same layout and
+colours as game.py, so screenshot-based code (e.g. the board parser) works on them.
+`serve` puts any number of games behind a small local HTTP endpoint, and
+Game2048Client talks to it, so many games can run on one machine with no X server
+and no input-injection latency.
+"""
+
+import io
+import os
+import json
+import random
+import argparse
+import threading
+import urllib.request
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+import numpy as np
+from PIL import Image, ImageDraw, ImageFont
+
+from logic import Game2048State
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+with open(os.path.join(BASE_DIR, "constants.json"), "r") as f:
+    c = json.load(f)
+
+ACTIONS = {
+    "up": "w", "down": "s", "left": "a", "right": "d",
+    "w": "w", "s": "s", "a": "a", "d": "d",
+}
+
+
+def _font(size):
+    try:
+        return ImageFont.truetype(c["font"], size)
+    except OSError:
+        return ImageFont.load_default(size)
+
+
+def render_board(board, score, size=(500, 500), theme="light"):
+    """
+    Draw a board like game.display() does.
+
+    Parameters:
+        board (list): game board
+        score (int): current game score
+        size (tuple): (width, height) of the frame
+        theme (str): game interface theme
+    Returns:
+        (Image): RGB frame
+    """
+    colours = c["colour"][theme]
+    image = Image.new("RGB", size, tuple(colours["background"]))
+    draw = ImageDraw.Draw(image)
+
+    box = size[0] // 4
+    padding = box // 10
+    grid_start_y = size[1] // 10 + padding
+    text_colour = tuple(colours["dark"] if theme == "light" else colours["light"])
+
+    score_font = _font(max(size[0] // 20, 28))
+    draw.text((size[0] // 2, padding), f"Score: {score}", fill=text_colour, font=score_font, anchor="mt")
+
+    tile_font = _font(max(box // 3, 24))
+    for i in range(4):
+        for j in range(4):
+            value = board[i][j]
+            x, y = j * box + padding, i * box + grid_start_y
+            draw.rectangle(
+                (x, y, x + box - 2 * padding - 1, y + box - 2 * padding - 1),
+                fill=tuple(colours.get(str(value), colours["2048"])),
+            )
+            if value:
+                digit_colour = colours["dark"] if value in (2, 4) else colours["light"]
+                draw.text(
+                    (j * box + box // 2, i * box + grid_start_y + box // 2), str(value),
+                    fill=tuple(digit_colour), font=tile_font, anchor="mm",
+                )
+    return image
+
+
+class HeadlessGame2048:
+    """
+    One 2048 game with a programmatic step API.
+    """
+
+    def __init__(self, seed=None, max_tile=2048, size=(500, 500), theme="light"):
+        self.max_tile = max_tile
+        self.size = size
+        self.theme = theme
+        self.rng = random.Random(seed)
+        self.state = Game2048State.new(self.rng)
+        self._lock = threading.Lock()
+
+    def reset(self, seed=None):
+        """
+        Start a new game. Returns the observation (board).
+        """
+        with self._lock:
+            if seed is not None:
+                self.rng.seed(seed)
+            self.state = Game2048State.new(self.rng)
+            return self.state.to_list()
+
+    def step(self, action):
+        """
+        Play one move ("up"/"down"/"left"/"right" or "w"/"a"/"s"/"d").
+
+        Returns:
+            (tuple): (board, reward, done, info) with info holding changed, status and score
+        """
+        if action not in ACTIONS:
+            raise ValueError(f"Unknown action: {action}")
+        with self._lock:
+            self.state, reward, changed = self.state.step(ACTIONS[action], self.rng)
+            status = self.state.status(self.max_tile)
+            info = {"changed": changed, "status": status, "score": self.state.score}
+            return self.state.to_list(), reward, status != "PLAY", info
+
+    def observation(self):
+        with self._lock:
+            state = self.state
+        status = state.status(self.max_tile)
+        return {"board": state.to_list(), "score": state.score, "status": status}
+
+    def render_image(self):
+        with self._lock:
+            state = self.state
+        return render_board(state.to_list(), state.score, self.size, self.theme)
+
+    def render_rgb(self):
+        """
+        Current frame as an (H, W, 3) uint8 array.
+        """
+        return np.asarray(self.render_image())
+
+
+class _GameRequestHandler(BaseHTTPRequestHandler):
+    """
+    JSON endpoints, all taking an optional `game` id (default "0"):
+      POST /reset  {"game": id, "seed": int}          -> {"board", "score", "status"}
+      POST /step   {"game": id, "action": "up"}       -> {"board", "reward", "done", "info"}
+      GET  /state?game=id                             -> {"board", "score", "status"}
+      GET  /render?game=id                            -> PNG frame
+    """
+
+    def _game(self, game_id):
+        server = self.server
+        with server.games_lock:
+            if game_id not in server.games:
+                server.games[game_id] = HeadlessGame2048(**server.game_options)
+            return server.games[game_id]
+
+    def _send_json(self, payload, status=200):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _query_game(self):
+        query = self.path.partition("?")[2]
+        params = dict(part.split("=", 1) for part in query.split("&") if "=" in part)
+        return params.get("game", "0")
+
+    def do_GET(self):
+        route = self.path.partition("?")[0]
+        game = self._game(self._query_game())
+        if route == "/state":
+            self._send_json(game.observation())
+        elif route == "/render":
+            buffer = io.BytesIO()
+            game.render_image().save(buffer, format="PNG", compress_level=1)
+            body = buffer.getvalue()
+            self.send_response(200)
+            self.send_header("Content-Type", "image/png")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        else:
+            self._send_json({"error": f"Unknown route {route}"}, status=404)
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        try:
+            request = json.loads(self.rfile.read(length) or b"{}")
+        except json.JSONDecodeError as e:
+            self._send_json({"error": f"Invalid JSON: {e}"}, status=400)
+            return
+        game = self._game(str(request.get("game", "0")))
+        route = self.path.partition("?")[0]
+        if route == "/reset":
+            game.reset(request.get("seed"))
+            self._send_json(game.observation())
+        elif route == "/step":
+            try:
+                board, reward, done, info = game.step(request.get("action"))
+            except ValueError as e:
+                self._send_json({"error": str(e)}, status=400)
+                return
+            self._send_json({"board": board, "reward": reward, "done": done, "info": info})
+        else:
+            self._send_json({"error": f"Unknown route {route}"}, status=404)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def make_server(host="127.0.0.1", port=8048, **game_options):
+    """
+    Create (but don't start) the HTTP server; games are created on first use.
+    """
+    server = ThreadingHTTPServer((host, port), _GameRequestHandler)
+    server.games = {}
+    server.games_lock = threading.Lock()
+    server.game_options = game_options
+    return server
+
+
+class Game2048Client:
+    """
+    Client for the HTTP endpoint with the same API as HeadlessGame2048.
+    """
+
+    def __init__(self, url="http://127.0.0.1:8048", game="0", timeout=10.0):
+        self.url = url.rstrip("/")
+        self.game = str(game)
+        self.timeout = timeout
+
+    def _post(self, route, payload):
+        payload = dict(payload, game=self.game)
+        request = urllib.request.Request(
+            self.url + route, data=json.dumps(payload).encode("utf-8"),
+            headers={"Content-Type": "application/json"},
+        )
+        with urllib.request.urlopen(request, timeout=self.timeout) as response:
+            return json.loads(response.read())
+
+    def _get(self, route):
+        with urllib.request.urlopen(f"{self.url}{route}?game={self.game}", timeout=self.timeout) as response:
+            return response.read()
+
+    def reset(self, seed=None):
+        return self._post("/reset", {"seed": seed})["board"]
+
+    def step(self, action):
+        result = self._post("/step", {"action": action})
+        return result["board"], result["reward"], result["done"], result["info"]
+
+    def observation(self):
+        return json.loads(self._get("/state"))
+
+    def render_image(self):
+        return Image.open(io.BytesIO(self._get("/render"))).convert("RGB")
+
+    def render_rgb(self):
+        return np.asarray(self.render_image())
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve headless 2048 games over local HTTP.")
+    parser.add_argument("--host", type=str, default="127.0.0.1", help="Address to bind.")
+    parser.add_argument("--port", type=int, default=8048, help="Port to listen on.")
+    parser.add_argument("--seed", type=int, default=None, help="RNG seed of new games.")
+    parser.add_argument("--max_tile", type=int, default=2048, help="Tile that wins the game.")
+    parser.add_argument("-wd", "--width", type=int, default=500, help="Width of rendered frames.")
+    parser.add_argument("-ht", "--height", type=int, default=500, help="Height of rendered frames.")
+    args = parser.parse_args()
+
+    server = make_server(args.host, args.port, seed=args.seed, max_tile=args.max_tile,
+                         size=(args.width, args.height))
+    print(f"Serving headless 2048 on http://{args.host}:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("\nShutting down...")
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,296 @@
+"""
+Depth-limited expectimax search for 2048, usable as a local, zero-latency policy.
+
+The search runs on the bitboards of logic.py. Max nodes try the four moves, chance
+nodes average over every empty cell and both spawn values (2 and 4 are equally
+likely, as in `fillTwoOrFour`). Leaves are scored with a heuristic precomputed per
+row (monotonicity, empty cells, merge opportunities, tile sum) plus a bonus for
+keeping the largest tile in a corner. Results are memoized in a transposition table,
+and iterative deepening keeps the best fully searched move within the time budget.
+"""
+
+import os
+import time
+import random
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+
+from logic import MOVES, Game2048State, transpose, empty_cells, max_exponent
+
+DIRECTION_NAMES = {"w": "up", "a": "left", "s": "down", "d": "right"}
+SPAWNS = ((1, 0.5), (2, 0.5))
+
+# Heuristic weights, tuned on self-play.
+LOST_PENALTY = 200000.0
+MONOTONICITY_POWER = 4.0
+MONOTONICITY_WEIGHT = 47.0
+SUM_POWER = 3.5
+SUM_WEIGHT = 11.0
+MERGES_WEIGHT = 700.0
+EMPTY_WEIGHT = 270.0
+CORNER_WEIGHT = 1000.0
+
+CORNER_SHIFTS = (0, 12, 48, 60)
+
+
+def _row_heuristic(row):
+    line = [(row >> (4 * j)) & 0xF for j in range(4)]
+    total = 0.0
+    empty = 0
+    merges = 0
+    previous = 0
+    counter = 0
+    for rank in line:
+        total += rank ** SUM_POWER
+        if rank == 0:
+            empty += 1
+        else:
+            if previous == rank:
+                counter += 1
+            elif counter > 0:
+                merges += 1 + counter
+                counter = 0
+            previous = rank
+    if counter > 0:
+        merges += 1 + counter
+
+    monotonicity_left = 0.0
+    monotonicity_right = 0.0
+    for j in range(1, 4):
+        if line[j - 1] > line[j]:
+            monotonicity_left += line[j - 1] ** MONOTONICITY_POWER - line[j] ** MONOTONICITY_POWER
+        else:
+            monotonicity_right += line[j] ** MONOTONICITY_POWER - line[j - 1] ** MONOTONICITY_POWER
+
+    return (
+        LOST_PENALTY / 8
+        + EMPTY_WEIGHT * empty
+        + MERGES_WEIGHT * merges
+        - MONOTONICITY_WEIGHT * min(monotonicity_left, monotonicity_right)
+        - SUM_WEIGHT * total
+    )
+
+
+_HEURISTIC_TABLE = [_row_heuristic(row) for row in range(65536)]
+
+
+def heuristic(board):
+    """
+    Static evaluation of a bitboard: row heuristics over rows and columns plus the corner bonus.
+    """
+    table = _HEURISTIC_TABLE
+    columns = transpose(board)
+    value = (
+        table[board & 0xFFFF] + table[(board >> 16) & 0xFFFF]
+        + table[(board >> 32) & 0xFFFF] + table[(board >> 48) & 0xFFFF]
+        + table[columns & 0xFFFF] + table[(columns >> 16) & 0xFFFF]
+        + table[(columns >> 32) & 0xFFFF] + table[(columns >> 48) & 0xFFFF]
+    )
+    top = max_exponent(board)
+    if any((board >> shift) & 0xF == top for shift in CORNER_SHIFTS):
+        value += CORNER_WEIGHT * top
+    return value
+
+
+class _Timeout(Exception):
+    pass
+
+
+class _Search:
+    """
+    One expectimax search to a fixed depth, with its own transposition table.
+    """
+
+    def __init__(self, depth, deadline=None, prob_cutoff=1e-4):
+        self.depth = depth
+        self.deadline = deadline
+        self.prob_cutoff = prob_cutoff
+        self.table = {}
+        self.nodes = 0
+
+    def max_node(self, board, depth, prob):
+        best = 0.0  # No legal move: the game is lost.
+        for fn in MOVES.values():
+            new, _, changed = fn(board)
+            if changed:
+                value = self.chance_node(new, depth - 1, prob)
+                if value > best:
+                    best = value
+        return best
+
+    def chance_node(self, board, depth, prob):
+        if depth <= 0 or prob < self.prob_cutoff:
+            return heuristic(board)
+
+        cached = self.table.get(board)
+        if cached is not None and cached[0] >= depth:
+            return cached[1]
+
+        self.nodes += 1
+        if self.deadline is not None and self.nodes % 16 == 0 and time.time() > self.deadline:
+            raise _Timeout()
+
+        cells = empty_cells(board)
+        cell_prob = prob / len(cells)
+        total = 0.0
+        for cell in cells:
+            for exponent, spawn_prob in SPAWNS:
+                total += spawn_prob * self.max_node(board | (exponent << (4 * cell)), depth, cell_prob * spawn_prob)
+        value = total / len(cells)
+        self.table[board] = (depth, value)
+        return value
+
+
+def _search_afterstate(afterstate, max_depth, deadline, prob_cutoff):
+    """
+    Iteratively deepen the chance node after one root move.
+    Returns the values of every completed depth, shallowest first.
+    """
+    values = []
+    for depth in range(1, max_depth + 1):
+        try:
+            values.append(_Search(depth, deadline, prob_cutoff).chance_node(afterstate, depth, 1.0))
+        except _Timeout:
+            break
+    return values
+
+
+def _warm_up(delay):
+    # Keeps a worker busy briefly so the next task goes to a process that isn't started yet.
+    time.sleep(delay)
+
+
+class ExpectimaxSolver:
+    """
+    Expectimax policy with iterative deepening up to `depth` within `time_budget`
+    seconds per move. With `workers` > 1 the root moves are searched in parallel
+    processes (at most one per CPU). The pool is started up front, and the time by
+    which cut-off searches come back late (dispatch, result transfer, scheduling;
+    tracked as a moving average) is taken off the workers' deadline, so a move still
+    takes about `time_budget`.
+    """
+
+    def __init__(self, depth=3, time_budget=0.5, workers=1, prob_cutoff=1e-4):
+        self.depth = depth
+        self.time_budget = time_budget
+        # More CPU-bound processes than cores only get descheduled past their deadline.
+        self.workers = workers = min(workers, os.cpu_count() or 1)
+        self.prob_cutoff = prob_cutoff
+        self.dispatch_overhead = 0.0
+        self._pool = None
+        if workers > 1:
+            self._pool = ProcessPoolExecutor(max_workers=workers)
+            # Start every process (and build its heuristic table) before the first move.
+            for future in [self._pool.submit(_warm_up, 0.05) for _ in range(workers)]:
+                future.result()
+
+    @classmethod
+    def from_args(cls, args):
+        return cls(depth=args.search_depth, time_budget=args.search_time, workers=args.search_workers)
+
+    def best_move(self, board):
+        """
+        Pick a move for a bitboard (or Game2048State).
+
+        Returns:
+            (tuple): (direction "w"/"a"/"s"/"d" or None if no move is legal, value, completed depth)
+        """
+        if isinstance(board, Game2048State):
+            board = board.board
+        deadline = time.time() + self.time_budget if self.time_budget else None
+
+        afterstates = {}
+        for direction, fn in MOVES.items():
+            new, _, changed = fn(board)
+            if changed:
+                afterstates[direction] = new
+        if not afterstates:
+            return None, 0.0, 0
+        if len(afterstates) == 1:
+            (direction,) = afterstates
+            return direction, 0.0, 0
+
+        if self._pool is not None:
+            results = self._search_parallel(afterstates, deadline)
+        else:
+            results = self._search_sequential(afterstates, deadline)
+
+        # Compare moves at the deepest depth every root move completed.
+        common = min(len(values) for values in results.values())
+        if common == 0:
+            direction = next(iter(afterstates))
+            return direction, 0.0, 0
+        direction = max(results, key=lambda d: results[d][common - 1])
+        return direction, results[direction][common - 1], common
+
+    def _search_parallel(self, afterstates, deadline):
+        worker_deadline = deadline - self.dispatch_overhead if deadline is not None else None
+        futures = {
+            direction: self._pool.submit(_search_afterstate, new, self.depth, worker_deadline, self.prob_cutoff)
+            for direction, new in afterstates.items()
+        }
+        results = {direction: future.result() for direction, future in futures.items()}
+        if worker_deadline is not None and any(len(values) < self.depth for values in results.values()):
+            # A search ran into the deadline: measure how late its result got back.
+            late = max(time.time() - worker_deadline, 0.0)
+            self.dispatch_overhead = 0.8 * self.dispatch_overhead + 0.2 * late
+        return results
+
+    def _search_sequential(self, afterstates, deadline):
+        results = {direction: [] for direction in afterstates}
+        for depth in range(1, self.depth + 1):
+            search = _Search(depth, deadline, self.prob_cutoff)  # Shares the table across root moves.
+            try:
+                layer = {direction: search.chance_node(new, depth, 1.0) for direction, new in afterstates.items()}
+            except _Timeout:
+                break
+            for direction, value in layer.items():
+                results[direction].append(value)
+        return results
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.shutdown(cancel_futures=True)
+            self._pool = None
+
+
+def add_solver_args(parser):
+    """
+    Register the local expectimax solver command line options.
+    """
+    parser.add_argument("--search_depth", type=int, default=3,
+                        help="Maximum expectimax depth (moves) of the local solver.")
+    parser.add_argument("--search_time", type=float, default=0.5,
+                        help="Time budget in seconds per move of the local solver; 0 searches to full depth.")
+    parser.add_argument("--search_workers", type=int, default=1,
+                        help="Processes searching the root moves of the local solver in parallel.")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Play 2048 games headlessly with the expectimax solver.")
+    parser.add_argument("--games", type=int, default=1, help="Number of games to play.")
+    parser.add_argument("--seed", type=int, default=0, help="RNG seed for tile spawns.")
+    parser.add_argument("--max_tile", type=int, default=2048, help="Stop a game once this tile is reached.")
+    add_solver_args(parser)
+    args = parser.parse_args()
+
+    solver = ExpectimaxSolver.from_args(args)
+    rng = random.Random(args.seed)
+    try:
+        for game in range(args.games):
+            state = Game2048State.new(rng)
+            moves, start = 0, time.time()
+            while state.status(args.max_tile) == "PLAY":
+                direction, _, _ = solver.best_move(state)
+                state, _, _ = state.step(direction, rng)
+                moves += 1
+            elapsed = time.time() - start
+            print(f"Game {game + 1}: {state.status(args.max_tile)}, score {state.score}, "
+                  f"max tile {1 << max_exponent(state.board)}, {moves} moves, "
+                  f"{elapsed / max(moves, 1) * 1000:.1f}ms/move")
+    finally:
+        solver.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+"""
+Speculative prefetch of the next 2048 decision.
+
+Once a move is chosen, the next board is known up to the tile that spawns after it.
+The prefetcher slides the board with logic.py, enumerates the spawn outcomes and asks
+the model about the `top_k` most likely ones while the move is being executed. When
+the real board appears, the matching request (often already answered) is used and the
+others are dropped, so most of the model latency overlaps with move execution.
+"""
+
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from logic import encode_board, decode_board, move_bits, spawn_outcomes
+
+MOVE_KEYS = {"up": "w", "left": "a", "down": "s", "right": "d"}
+
+
+class SpeculativePrefetcher:
+    """
+    Requests decisions for likely successor boards ahead of time.
+
+    At most `max_inflight` speculative requests run at once; a new prefetch cancels
+    the speculative requests of the previous move that haven't started yet.
+    """
+
+    def __init__(self, top_k=4, max_inflight=4):
+        self.top_k = top_k
+        self.hits = 0
+        self.misses = 0
+        self.requests = 0
+
+        self._executor = ThreadPoolExecutor(max_workers=max_inflight, thread_name_prefix="speculate")
+        self._pending = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_args(cls, args):
+        return cls(top_k=args.speculate, max_inflight=args.speculate_inflight)
+
+    def successors(self, board, move):
+        """
+        The `top_k` most likely boards after playing `move` on `board`, with their probabilities.
+        """
+        afterstate, _, changed = move_bits(MOVE_KEYS[move], encode_board(board))
+        if not changed:
+            return []
+        return [(decode_board(bits), prob) for bits, prob in spawn_outcomes(afterstate)[:self.top_k]]
+
+    def prefetch(self, board, move, request):
+        """
+        Start `request(successor_board)` for the likely successors of `board` after `move`.
+        Returns the total probability that one of them is the next board.
+        """
+        successors = self.successors(board, move)
+        with self._lock:
+            self._drop_pending()
+            for successor, _ in successors:
+                self._pending[encode_board(successor)] = self._executor.submit(request, successor)
+            self.requests += len(successors)
+        return sum(prob for _, prob in successors)
+
+    def take(self, board):
+        """
+        The speculative request for `board` (a Future), or None if it wasn't predicted.
+        The other speculative requests are dropped either way.
+        """
+        with self._lock:
+            if not self._pending:
+                return None
+            future = self._pending.pop(encode_board(board), None)
+            self._drop_pending()
+            if future is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+            return future
+
+    def _drop_pending(self):
+        # Requests already running finish in the background and are ignored.
+        for future in self._pending.values():
+            future.cancel()
+        self._pending.clear()
+
+    def summary(self):
+        total = self.hits + self.misses
+        rate = self.hits / total if total else 0.0
+        return f"{self.hits} hits, {self.misses} misses ({rate:.0%}), {self.requests} speculative requests"
+
+    def close(self):
+        with self._lock:
+            self._drop_pending()
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+def add_speculation_args(parser):
+    """
+    Register the speculative prefetch command line options.
+    """
+    parser.add_argument("--speculate", type=int, default=0,
+                        help="Ask the model about this many likely next boards while a move executes; 0 disables.")
+    parser.add_argument("--speculate_inflight", type=int, default=4,
+                        help="Maximum number of speculative requests running at once.")
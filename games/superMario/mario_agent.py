@@ -1,18 +1,31 @@
-import time
-import numpy as np
-import concurrent.futures
 import argparse
 
-from games.superMario.workers import worker_short, worker_long
+from games.superMario.workers import worker_short, worker_long, FALLBACK_CODE
+from tools.serving.engine import InferenceEngine
+from tools.serving.api_providers import add_hedging_args, configure_hedging_from_args, provider_summary
+from tools.frames import FrameEncoder, add_frame_args
+from tools.capture import FrameCaptureService, screen_region_grabber, add_capture_args
+from tools.frame_gate import FrameChangeGate, add_gate_args
+from tools.actions import ActionArbiter, add_scheduler_args
+from tools.pacing import AdaptivePacer, add_pacing_args
 
 # System prompt remains constant
 system_prompt = (
     "You are an intelligent Super Mario gameplay agent that controls Mario, search for and execute optimal path given each game state. Prioritize survival over speed."
 )
 
+# Frame preprocessing defaults; the NES picture is upscaled on a full screen, so a
+# smaller image keeps all the detail the model needs.
+preprocess_config = {
+    "crop": None,
+    "max_long_edge": 768,
+    "palette_colors": None,
+}
+
 def main():
     """
     Spawns a number of short-term and/or long-term workers based on user-defined parameters.
+    Workers run as tasks on a single asyncio event loop.
     """
     parser = argparse.ArgumentParser(
         description="Super Mario gameplay agent with configurable concurrent workers."
@@ -27,37 +40,70 @@ def main():
                         help="Estimated API response latency in seconds.")
     parser.add_argument("--policy", type=str, default="alternate", choices=["mixed", "alternate", "long", "short"],
                         help="Worker policy: 'long', or 'short'. In 'long' or 'short' modes only those workers are enabled.")
+    parser.add_argument("--io_workers", type=int, default=8,
+                        help="Threads used for blocking helper work such as frame comparison.")
+    parser.add_argument("--streaming_exec", action="store_true",
+                        help="Execute each generated PyAutoGUI statement as soon as it is streamed.")
+    parser.add_argument("--fallback", type=str, default="hop", choices=["hop", "none"],
+                        help="Keep hopping forward while the model is unavailable (errors, timeouts, open circuit), or just wait.")
+    add_frame_args(parser)
+    add_capture_args(parser)
+    add_gate_args(parser)
+    add_scheduler_args(parser)
+    add_pacing_args(parser)
+    add_hedging_args(parser)
 
     args = parser.parse_args()
+    configure_hedging_from_args(args)
 
     num_threads = int(args.api_response_latency_estimate / args.concurrency_interval)
     offsets = [i * args.concurrency_interval for i in range(num_threads)]
+    pacer = None
+    if args.adaptive_workers:
+        pacer = AdaptivePacer.from_args(args, args.concurrency_interval, num_threads)
+        num_threads = pacer.max_workers
+        offsets = [0] * num_threads
+        print(f"Adaptive worker pool: {pacer.active} of {num_threads} workers active to start.")
 
-    print(f"Starting with {num_threads} threads using policy '{args.policy}'...")
+    print(f"Starting with {num_threads} workers using policy '{args.policy}'...")
     print(f"API Provider: {args.api_provider}, Model Name: {args.model_name}")
 
-    with concurrent.futures.ThreadPoolExecutor(max_workers=num_threads) as executor:
-        for i in range(num_threads):
-            if args.policy == "mixed":
-                if i % 2 == 0:
-                    executor.submit(worker_long, i, offsets[i], system_prompt, args.api_provider, args.model_name)
-                executor.submit(worker_short, i, offsets[i], system_prompt, args.api_provider, args.model_name)
-            if args.policy == "alternate":
-                # Alternate between long and short workers.
-                if i % 2 == 0:
-                    executor.submit(worker_long, i, offsets[i], system_prompt, args.api_provider, args.model_name)
-                else:    
-                    executor.submit(worker_short, i, offsets[i], system_prompt, args.api_provider, args.model_name)
-            elif args.policy == "long":
-                executor.submit(worker_long, i, offsets[i], system_prompt, args.api_provider, args.model_name)
-            elif args.policy == "short":
-                executor.submit(worker_short, i, offsets[i], system_prompt, args.api_provider, args.model_name)
-
-        try:
-            while True:
-                time.sleep(0.25)
-        except KeyboardInterrupt:
-            print("\nMain thread interrupted. Exiting all threads...")
+    engine = InferenceEngine(io_workers=args.io_workers)
+    gate = FrameChangeGate.from_args(args)
+    scheduler = ActionArbiter.from_args(args)
+    capture = FrameCaptureService(
+        screen_region_grabber(), FrameEncoder.from_args(args, preprocess_config),
+        fps=args.capture_fps, buffer_size=args.frame_buffer, debug_stem="cache/mario/screenshot",
+    )
+    fallback = FALLBACK_CODE if args.fallback == "hop" else None
+    worker_args = (system_prompt, args.api_provider, args.model_name, args.streaming_exec, pacer, fallback)
+    workers = []
+    for i in range(num_threads):
+        if args.policy == "mixed":
+            if i % 2 == 0:
+                workers.append(worker_long(engine, capture, gate, scheduler, i, offsets[i], *worker_args))
+            workers.append(worker_short(engine, capture, gate, scheduler, i, offsets[i], *worker_args))
+        if args.policy == "alternate":
+            # Alternate between long and short workers.
+            if i % 2 == 0:
+                workers.append(worker_long(engine, capture, gate, scheduler, i, offsets[i], *worker_args))
+            else:
+                workers.append(worker_short(engine, capture, gate, scheduler, i, offsets[i], *worker_args))
+        elif args.policy == "long":
+            workers.append(worker_long(engine, capture, gate, scheduler, i, offsets[i], *worker_args))
+        elif args.policy == "short":
+            workers.append(worker_short(engine, capture, gate, scheduler, i, offsets[i], *worker_args))
+
+    capture.start()
+    try:
+        engine.run(workers)
+    finally:
+        capture.stop()
+        scheduler.stop()
+        print(f"Input scheduler: {scheduler.summary()}")
+        if pacer is not None:
+            print(f"Worker pool: {pacer.summary()}")
+        print(f"Providers:\n{provider_summary()}")
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
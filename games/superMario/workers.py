@@ -1,174 +1,234 @@
+import asyncio
 import time
-import os
-import pyautogui
 import numpy as np
 
-from tools.utils import encode_image, log_output, extract_python_code
-from tools.serving.api_providers import anthropic_completion, openai_completion, gemini_completion
-
-def worker_short(thread_id, offset, system_prompt, api_provider, model_name):
+from tools.utils import log_output, extract_python_code
+from tools.serving.api_providers import async_completion, async_completion_stream
+from tools.serving.resilience import ProviderUnavailable
+from tools.streaming import StreamingCodeParser
+from tools.actions import Plan, parse_actions, plan_duration
+from tools.capture import frame_age
+
+SHORT_PROMPT = (
+    f"Analyze the current game state and generate PyAutoGUI code to control Mario "
+    "for the next 1 second.\n"
+    "Mario's position most likely has moved forward when the generated code gets to execute.\n"
+    "Your objective is to avoid obstacles, enemies, and hazards.\n"
+
+    "### General Controls:\n"
+    "- Press 'Enter' to start the game ONLY IF the game hasn't started.\n"
+    "  Otherwise the game will be paused.\n"
+    "- Press the right arrow to move forward.\n"
+    "- Press 'X' along with right/left arrow to jump over obstacles or gaps. Be very careful with gaps, do lopped jumps if necessary.\n\n"
+
+    "### Strategies and Caveats:\n"
+    "- Whenever a gap is detected, AVOID jumping over the gap. Only do small position adjustments to prepare for big jump.\n"
+    "- If an obstacle or enemy is near, move/jump left to dodge.\n"
+    "- If an enemy is detected, do one big jump ONLY IF very confident, ortherwise do consecutive short jumps.\n"
+    "- If in doubt, take a more defensive approaches like moving to the left (move back).\n"
+    "- Sleep and do nothing if no obvious danger."
+
+    "### Output Format:\n"
+    "- Output ONLY the Python code for PyAutoGUI commands.\n"
+    "- Include brief comments for each action.\n"
+)
+
+LONG_PROMPT = (
+    f"Analyze the current game state and generate PyAutoGUI code to control Mario "
+    "for the next 2 seconds.\n"
+    "Mario's position most likely has moved forward when the generated code gets to execute.\n"
+    "Your objective is to make progress while avoiding obstacles, enemies, and hazards.\n"
+
+    "### General Controls:\n"
+    "- Press 'Enter' to start the game ONLY IF the game hasn't started.\n"
+    "  Otherwise the game will be paused.\n"
+    "- Press the right arrow to move forward.\n"
+    "- Press 'X' along with right/left arrow to jump over obstacles or gaps. Be very careful with gaps, do lopped jumps if necessary.\n\n"
+
+    "### Strategies and Caveats:\n"
+    "- Don't move too fast, as unseen enemies may appear from off-screen.\n"
+    "- If an obstacle or enemy is near, move forward in small increments and be ready to jump.\n"
+    "- Avoid walking forward without jumping as Mario can run into off-screen enemies.\n"
+    "- If a gap is detected, make sure to leave room for acceleration and then jump. Otherwise, move left first to get more space for acceleration.\n"
+    "- If in doubt, take a more defensive approaches like moving to the left (move back).\n"
+    "- Secondary goal: only if very safe, collect as many question mark blocks as possible.\n\n"
+
+    "### Output Format:\n"
+    "- Output ONLY the Python code for PyAutoGUI commands.\n"
+    "- Include brief comments for each action.\n"
+)
+
+HORIZONS = {"SHORT": 1.0, "LONG": 2.0}
+
+# Played while the model is unavailable: short hops forward, as the prompts suggest when in doubt.
+FALLBACK_CODE = (
+    'pyautogui.keyDown("right")\n'
+    'pyautogui.press("x")\n'
+    'time.sleep(0.3)\n'
+    'pyautogui.keyUp("right")\n'
+    'time.sleep(0.2)\n'
+)
+
+def submit_code(scheduler, thread_id, tag, clean_code, frame):
     """
-    Worker function for short-term (1 second) motion control.
-    1) Sleeps 'offset' seconds before starting (to stagger starts).
-    2) Continuously takes screenshots, calls Anthropic with streaming output, logs latency, executes returned code, etc.
+    Parse generated PyAutoGUI code into actions and hand them to the input scheduler,
+    stamped with the capture time of `frame` and the worker's control horizon.
+    Returns the submitted Plan, or None if the code could not be parsed.
     """
-    all_response_time = []
-
-    time.sleep(offset)
-    print(f"[Thread {thread_id} - SHORT] Starting after {offset}s delay...")
-
-    short_prompt = (
-        f"Analyze the current game state and generate PyAutoGUI code to control Mario "
-        "for the next 1 second.\n"
-        "Mario's position most likely has moved forward when the generated code gets to execute.\n"
-        "Your objective is to avoid obstacles, enemies, and hazards.\n"
-
-        "### General Controls:\n"
-        "- Press 'Enter' to start the game ONLY IF the game hasn't started.\n"
-        "  Otherwise the game will be paused.\n"
-        "- Press the right arrow to move forward.\n"
-        "- Press 'X' along with right/left arrow to jump over obstacles or gaps. Be very careful with gaps, do lopped jumps if necessary.\n\n"
-
-        "### Strategies and Caveats:\n"
-        "- Whenever a gap is detected, AVOID jumping over the gap. Only do small position adjustments to prepare for big jump.\n"
-        "- If an obstacle or enemy is near, move/jump left to dodge.\n"
-        "- If an enemy is detected, do one big jump ONLY IF very confident, ortherwise do consecutive short jumps.\n"
-        "- If in doubt, take a more defensive approaches like moving to the left (move back).\n"
-        "- Sleep and do nothing if no obvious danger."
-
-        "### Output Format:\n"
-        "- Output ONLY the Python code for PyAutoGUI commands.\n"
-        "- Include brief comments for each action.\n"
-    )
-
     try:
-        while True:
-            screen_width, screen_height = pyautogui.size()
-            region = (0, 0, screen_width, screen_height)
-            screenshot = pyautogui.screenshot(region=region)
-
-            thread_folder = f"cache/mario/thread_{thread_id}"
-            os.makedirs(thread_folder, exist_ok=True)
-
-            screenshot_path = os.path.join(thread_folder, "screenshot.png")
-            screenshot.save(screenshot_path)
-
-            base64_image = encode_image(screenshot_path)
-
-            start_time = time.time()
-
-            if api_provider == "anthropic":
-                generated_code_str = anthropic_completion(system_prompt, model_name, base64_image, short_prompt)
-            elif api_provider == "openai":
-                generated_code_str = openai_completion(system_prompt, model_name, base64_image, short_prompt)
-            elif api_provider == "gemini":
-                generated_code_str = gemini_completion(system_prompt, model_name, base64_image, short_prompt)
-            else:
-                raise NotImplementedError(f"API provider: {api_provider} is not supported.")
-
-            end_time = time.time()
-            latency = end_time - start_time
-            all_response_time.append(latency)
-
-            print(f"[Thread {thread_id} - SHORT] Request latency: {latency:.2f}s")
-            avg_latency = np.mean(all_response_time)
-            print(f"[Thread {thread_id} - SHORT] Latencies: {all_response_time}")
-            print(f"[Thread {thread_id} - SHORT] Average latency: {avg_latency:.2f}s")
-
-            print(f"\n[Thread {thread_id} - SHORT] --- Generation (Streaming) ---\n{generated_code_str}\n")
-
-            clean_code = extract_python_code(generated_code_str)
-            log_output(thread_id, f"[Thread {thread_id} - SHORT] Python code to be executed:\n{clean_code}\n", "mario")
-            print(f"[Thread {thread_id} - SHORT] Python code to be executed:\n{clean_code}\n")
-
-            try:
-                exec(clean_code)
-            except Exception as e:
-                print(f"[Thread {thread_id} - SHORT] Error executing code: {e}")
+        actions = parse_actions(clean_code)
+    except (SyntaxError, ValueError) as e:
+        print(f"[Thread {thread_id} - {tag}] Error parsing code: {e}")
+        return None
+    print(f"[Thread {thread_id} - {tag}] Plan: {len(actions)} actions over {plan_duration(actions):.2f}s")
+    plan = Plan(actions, source=clean_code, captured_at=frame.timestamp, horizon=HORIZONS[tag])
+    plan.close()
+    return scheduler.submit(plan)
+
+async def _stream_and_execute(engine, scheduler, thread_id, tag, system_prompt, api_provider, model_name, frame, prompt):
+    """
+    Stream the model response and schedule each PyAutoGUI statement as soon as it is complete,
+    instead of waiting for the last token.
+    Returns the full response text and the (possibly still running) Plan.
+    """
+    parser = StreamingCodeParser()
+    plan = None
+    base64_image = frame.payload
 
-    except KeyboardInterrupt:
-        print(f"[Thread {thread_id} - SHORT] Interrupted by user. Exiting...")
+    start_time = time.time()
+    partial_chunks = []
+    try:
+        async for chunk in async_completion_stream(api_provider, system_prompt, model_name, base64_image, prompt,
+                                                   deadline=scheduler.deadline(frame.timestamp)):
+            partial_chunks.append(chunk)
+            for statement in parser.feed(chunk):
+                actions = _statement_actions(thread_id, tag, statement)
+                if not actions:
+                    continue
+                if plan is None:
+                    # Only take over the keyboard once there is something to do
+                    # (not on `import pyautogui` or a comment-only statement).
+                    print(f"[Thread {thread_id} - {tag}] Time to first action: {time.time() - start_time:.2f}s")
+                    plan = scheduler.submit(Plan(captured_at=frame.timestamp, horizon=HORIZONS[tag]))
+                plan.extend(actions)
+        actions = []
+        for statement in parser.close():
+            actions += _statement_actions(thread_id, tag, statement)
+        if plan is None:
+            plan = scheduler.submit(Plan(captured_at=frame.timestamp, horizon=HORIZONS[tag]))
+        plan.extend(actions)
+    finally:
+        # The scheduler finishes the actions already queued, then ends the plan.
+        if plan is not None:
+            plan.close()
+
+    generated_code_str = "".join(partial_chunks)
+    log_output(thread_id, f"[Thread {thread_id} - {tag}] Streamed response:\n{generated_code_str}\n", "mario")
+    return generated_code_str, plan
+
+def _statement_actions(thread_id, tag, statement):
+    try:
+        return parse_actions(statement)
+    except (SyntaxError, ValueError) as e:
+        print(f"[Thread {thread_id} - {tag}] Skipping statement `{statement}`: {e}")
+        return []
 
-def worker_long(thread_id, offset, system_prompt, api_provider, model_name):
+async def _worker_loop(engine, capture, gate, scheduler, thread_id, tag, offset, system_prompt, api_provider, model_name, prompt, streaming=False, pacer=None, fallback=None):
     """
-    Worker function for long-term (2 seconds) motion control.
-    1) Sleeps 'offset' seconds before starting (to stagger starts).
-    2) Continuously takes screenshots, calls Anthropic with streaming output, logs latency, executes returned code, etc.
+    Shared control loop of the short and long workers.
+    Frames come from the shared capture service and pass through the frame-change gate;
+    the model request is awaited on the loop and the generated code is parsed into an action
+    plan for the input scheduler. With `streaming`, statements are scheduled while the
+    response is still being generated. With an adaptive `pacer`, the worker only makes
+    requests while its slot is active and takes turns with the other workers.
+    Requests are given up once their answer would be too stale to play; while the model
+    is unavailable, the `fallback` code (if any) is played on the freshest frame instead.
     """
     all_response_time = []
 
-    time.sleep(offset)
-    print(f"[Thread {thread_id} - LONG] Starting after {offset}s delay...")
-
-    long_prompt = (
-        f"Analyze the current game state and generate PyAutoGUI code to control Mario "
-        "for the next 2 seconds.\n"
-        "Mario's position most likely has moved forward when the generated code gets to execute.\n"
-        "Your objective is to make progress while avoiding obstacles, enemies, and hazards.\n"
-
-        "### General Controls:\n"
-        "- Press 'Enter' to start the game ONLY IF the game hasn't started.\n"
-        "  Otherwise the game will be paused.\n"
-        "- Press the right arrow to move forward.\n"
-        "- Press 'X' along with right/left arrow to jump over obstacles or gaps. Be very careful with gaps, do lopped jumps if necessary.\n\n"
-
-        "### Strategies and Caveats:\n"
-        "- Don't move too fast, as unseen enemies may appear from off-screen.\n"
-        "- If an obstacle or enemy is near, move forward in small increments and be ready to jump.\n"
-        "- Avoid walking forward without jumping as Mario can run into off-screen enemies.\n"
-        "- If a gap is detected, make sure to leave room for acceleration and then jump. Otherwise, move left first to get more space for acceleration.\n"
-        "- If in doubt, take a more defensive approaches like moving to the left (move back).\n"
-        "- Secondary goal: only if very safe, collect as many question mark blocks as possible.\n\n"
-
-        "### Output Format:\n"
-        "- Output ONLY the Python code for PyAutoGUI commands.\n"
-        "- Include brief comments for each action.\n"
-    )
+    await asyncio.sleep(offset)
+    print(f"[Thread {thread_id} - {tag}] Starting after {offset}s delay...")
 
     try:
         while True:
-            screen_width, screen_height = pyautogui.size()
-            region = (0, 0, screen_width, screen_height)
-            screenshot = pyautogui.screenshot(region=region)
-
-            thread_folder = f"cache/mario/thread_{thread_id}"
-            os.makedirs(thread_folder, exist_ok=True)
-
-            screenshot_path = os.path.join(thread_folder, "screenshot.png")
-            screenshot.save(screenshot_path)
-
-            base64_image = encode_image(screenshot_path)
+            if pacer is not None:
+                await pacer.turn(thread_id)
+            frame = capture.latest() or await engine.run_io(capture.wait_for_frame)
+            if not await engine.run_io(gate.check, frame.image):
+                # Screen hasn't changed since the last request; wait for the next capture.
+                await asyncio.sleep(capture.interval)
+                continue
+            base64_image = frame.payload
 
             start_time = time.time()
-
-            if api_provider == "anthropic":
-                generated_code_str = anthropic_completion(system_prompt, model_name, base64_image, long_prompt)
-            elif api_provider == "openai":
-                generated_code_str = openai_completion(system_prompt, model_name, base64_image, long_prompt)
-            elif api_provider == "gemini":
-                generated_code_str = gemini_completion(system_prompt, model_name, base64_image, long_prompt)
-            else:
-                raise NotImplementedError(f"API provider: {api_provider} is not supported.")
-
+            try:
+                if streaming:
+                    generated_code_str, plan = await _stream_and_execute(
+                        engine, scheduler, thread_id, tag, system_prompt, api_provider, model_name, frame, prompt
+                    )
+                else:
+                    generated_code_str = await async_completion(
+                        api_provider, system_prompt, model_name, base64_image, prompt,
+                        deadline=scheduler.deadline(frame.timestamp),
+                    )
+            except ProviderUnavailable as e:
+                gate.rollback(frame.image)
+                print(f"[Thread {thread_id} - {tag}] Model unavailable ({e})")
+                if fallback is None:
+                    await asyncio.sleep(HORIZONS[tag])
+                    continue
+                frame = capture.latest() or await engine.run_io(capture.wait_for_frame)
+                plan = Plan(parse_actions(fallback), source=fallback, captured_at=frame.timestamp, horizon=HORIZONS[tag])
+                plan.close()
+                # Joins the fallback plan of another worker if one is still playing.
+                plan = scheduler.submit_fallback(plan)
+                await plan.wait_async()
+                print(f"[Thread {thread_id} - {tag}] Fallback plan {plan.status}")
+                continue
             end_time = time.time()
             latency = end_time - start_time
             all_response_time.append(latency)
 
-            print(f"[Thread {thread_id} - LONG] Request latency: {latency:.2f}s")
+            print(f"[Thread {thread_id} - {tag}] Request latency: {latency:.2f}s")
             avg_latency = np.mean(all_response_time)
-            print(f"[Thread {thread_id} - LONG] Latencies: {all_response_time}")
-            print(f"[Thread {thread_id} - LONG] Average latency: {avg_latency:.2f}s")
-
-            print(f"\n[Thread {thread_id} - LONG] --- Generation (Streaming) ---\n{generated_code_str}\n")
-
-            clean_code = extract_python_code(generated_code_str)
-            log_output(thread_id, f"[Thread {thread_id} - LONG] Python code to be executed:\n{clean_code}\n", "mario")
-            print(f"[Thread {thread_id} - LONG] Python code to be executed:\n{clean_code}\n")
-
-            try:
-                exec(clean_code)
-            except Exception as e:
-                print(f"[Thread {thread_id} - LONG] Error executing code: {e}")
+            print(f"[Thread {thread_id} - {tag}] Latencies: {all_response_time}")
+            print(f"[Thread {thread_id} - {tag}] Average latency: {avg_latency:.2f}s")
+            if pacer is not None:
+                pacer.record(latency)
+                print(f"[Thread {thread_id} - {tag}] Pacer: {pacer.summary()}")
+            print(f"[Thread {thread_id} - {tag}] Frame gate: {gate.summary()}")
+            print(f"[Thread {thread_id} - {tag}] Frame {frame.index} age: {frame_age(frame):.2f}s, image payload: {len(base64_image)} bytes")
+
+            print(f"\n[Thread {thread_id} - {tag}] --- Generation (Streaming) ---\n{generated_code_str}\n")
+
+            if not streaming:
+                clean_code = extract_python_code(generated_code_str)
+                log_output(thread_id, f"[Thread {thread_id} - {tag}] Python code to be executed:\n{clean_code}\n", "mario")
+                print(f"[Thread {thread_id} - {tag}] Python code to be executed:\n{clean_code}\n")
+                plan = submit_code(scheduler, thread_id, tag, clean_code, frame)
+
+            # Pace this worker by its own plan; a plan from a newer frame may pre-empt it,
+            # and the scheduler drops it if its frame is already stale.
+            if plan is not None:
+                await plan.wait_async()
+                print(f"[Thread {thread_id} - {tag}] Plan {plan.status}, max drift {plan.max_drift * 1000:.1f}ms ({scheduler.summary()})")
+
+    except asyncio.CancelledError:
+        print(f"[Thread {thread_id} - {tag}] Cancelled. Exiting...")
+        raise
+
+async def worker_short(engine, capture, gate, scheduler, thread_id, offset, system_prompt, api_provider, model_name, streaming=False, pacer=None, fallback=None):
+    """
+    Worker coroutine for short-term (1 second) motion control.
+    1) Sleeps 'offset' seconds before starting (to stagger starts).
+    2) Continuously takes the freshest frame, calls the model, logs latency, schedules the returned actions, etc.
+    """
+    await _worker_loop(engine, capture, gate, scheduler, thread_id, "SHORT", offset, system_prompt, api_provider, model_name, SHORT_PROMPT, streaming, pacer, fallback)
 
-    except KeyboardInterrupt:
-        print(f"[Thread {thread_id} - LONG] Interrupted by user. Exiting...")
\ No newline at end of file
+async def worker_long(engine, capture, gate, scheduler, thread_id, offset, system_prompt, api_provider, model_name, streaming=False, pacer=None, fallback=None):
+    """
+    Worker coroutine for long-term (2 seconds) motion control.
+    1) Sleeps 'offset' seconds before starting (to stagger starts).
+    2) Continuously takes the freshest frame, calls the model, logs latency, schedules the returned actions, etc.
+    """
+    await _worker_loop(engine, capture, gate, scheduler, thread_id, "LONG", offset, system_prompt, api_provider, model_name, LONG_PROMPT, streaming, pacer, fallback)
@@ -0,0 +1,323 @@
+"""
+Read the Tetris playfield, the active piece and the next piece from screen pixels.
+
+The playfield is located once per window layout: either from fractions of the frame
+given in the config, or as the largest block of columns that differ from the window
+background, with the preview box being the largest such block to its right. After that, a frame is read by
+sampling the centre of every cell and a coarse grid over the preview box, which takes
+a fraction of a millisecond. Cells are split into the locked stack and the active piece
+by colour and shape: the active piece is the topmost four same-coloured cells forming
+a tetromino, preferring one that can still fall, then one that wasn't part of the
+stack in the previous frame.
+"""
+
+import time
+import argparse
+from collections import namedtuple
+
+import numpy as np
+
+from tools.frames import PixelView
+from games.tetris.simulator import ROTATIONS, PIECE_COLOURS, EMPTY_COLOUR, WIDTH, TetrisSimulator
+
+# rows: occupancy bitmask per row of the locked stack, top row first (bit c = column c).
+# piece/rotation/x/y: the active piece as in TetrisSimulator (None if it wasn't found).
+TetrisObservation = namedtuple("TetrisObservation", ["rows", "piece", "rotation", "x", "y", "next_piece"])
+
+# Maximum distance (RGB Euclidean) of an empty cell from the empty colour.
+EMPTY_DISTANCE = 40.0
+# Background colour tolerance (per channel) while locating the playfield.
+LOCATE_DISTANCE = 8
+
+default_config = {
+    "columns": 10,
+    "rows": 20,
+    "playfield": None,   # (left, top, right, bottom) fractions of the frame; None locates it
+    "preview": None,     # same for the next-piece box
+    "empty_colour": EMPTY_COLOUR,
+    "palette": PIECE_COLOURS,
+}
+
+
+def _shape_key(cells):
+    top = min(r for r, _ in cells)
+    left = min(c for _, c in cells)
+    return frozenset((r - top, c - left) for r, c in cells), top, left
+
+
+def _build_shapes():
+    """
+    Normalised cell set -> (piece, rotation, row offset, column offset) of the first matching rotation.
+    """
+    shapes = {}
+    for piece, states in ROTATIONS.items():
+        for rotation, cells in enumerate(states):
+            key, top, left = _shape_key(cells)
+            shapes.setdefault(key, (piece, rotation, top, left))
+    return shapes
+
+
+SHAPES = _build_shapes()
+
+
+def _runs(counts):
+    """
+    (start, end) index ranges of consecutive non-zero counts.
+    """
+    runs, start = [], None
+    for i, count in enumerate(counts):
+        if count and start is None:
+            start = i
+        elif not count and start is not None:
+            runs.append((start, i - 1))
+            start = None
+    if start is not None:
+        runs.append((start, len(counts) - 1))
+    return runs
+
+
+class TetrisBoardExtractor:
+    """
+    Reads TetrisObservations from screenshots.
+
+    `crop` (fractions of the frame, like preprocess_config) limits where the playfield is
+    looked for. The layout is calibrated on the first frame and kept while the frame
+    size is the same and the pixel left of the playfield still has its calibrated colour.
+    """
+
+    def __init__(self, config=None, crop=None):
+        config = dict(default_config, **(config or {}))
+        self.columns = config["columns"]
+        self.num_rows = config["rows"]
+        self.playfield = config["playfield"]
+        self.preview = config["preview"]
+        self.crop = crop
+        self.empty = np.array(config["empty_colour"], dtype=np.float32)
+        self.names = list(config["palette"])
+        self.palette = np.array([config["palette"][name] for name in self.names], dtype=np.float32)
+
+        self._shape = None
+        self._cell_y = self._cell_x = None
+        self._preview_y = self._preview_x = None
+        self._check_y = self._check_x = None
+        self._check_colour = None
+        self._last_rows = None
+
+    @classmethod
+    def from_args(cls, args, config=None, crop=None):
+        return cls(config, crop=args.crop if args.crop is not None else crop)
+
+    def _region(self, frame):
+        height, width = frame.shape
+        left, top, right, bottom = self.crop or (0, 0, 1, 1)
+        return int(left * width), int(top * height), int(right * width), int(bottom * height)
+
+    def _locate(self, frame):
+        """
+        (playfield box, preview box) in pixels, each (left, top, right, bottom) inclusive.
+        """
+        height, width = frame.shape
+        if self.playfield is not None:
+            fractions = [self.playfield, self.preview]
+            return [
+                None if box is None else (int(box[0] * width), int(box[1] * height),
+                                          int(box[2] * width) - 1, int(box[3] * height) - 1)
+                for box in fractions
+            ]
+
+        x0, y0, x1, y1 = self._region(frame)
+        rgb = frame.rgb()[y0:y1, x0:x1].astype(np.int16)
+        # Everything that isn't the window background (its top-left colour): the
+        # playfield and the preview box, separated by background columns.
+        foreground = (np.abs(rgb - rgb[0, 0]) > LOCATE_DISTANCE).any(axis=2)
+        if not foreground.any():
+            raise ValueError("No Tetris playfield found in the screenshot.")
+
+        # Largest block of columns, then the largest block of rows within it (drops other
+        # content above or below the window), then the columns again within those rows.
+        counts = foreground.sum(axis=0)
+        left, right = max(_runs(counts), key=lambda run: counts[run[0]:run[1] + 1].sum())
+        rows = foreground[:, left:right + 1].sum(axis=1)
+        top, bottom = max(_runs(rows), key=lambda run: rows[run[0]:run[1] + 1].sum())
+        band = foreground[top:bottom + 1]
+        counts = band.sum(axis=0)
+        runs = _runs(counts)
+        weight = lambda run: counts[run[0]:run[1] + 1].sum()
+
+        def box(run):
+            ys = np.nonzero(band[:, run[0]:run[1] + 1].any(axis=1))[0]
+            return (x0 + run[0], y0 + top + int(ys[0]), x0 + run[1], y0 + top + int(ys[-1]))
+
+        # The playfield is the largest block, the preview box the largest one to its right.
+        playfield_run = max(runs, key=weight)
+        right_runs = [run for run in runs if run[0] > playfield_run[1]]
+        preview = box(max(right_runs, key=weight)) if right_runs else None
+        return box(playfield_run), preview
+
+    def calibrate(self, frame):
+        """
+        Locate the playfield and preview box and precompute the sample points.
+        """
+        playfield, preview = self._locate(frame)
+        left, top, right, bottom = playfield
+        cell_w = (right - left + 1) / self.columns
+        cell_h = (bottom - top + 1) / self.num_rows
+        centres_x = (left + (np.arange(self.columns) + 0.5) * cell_w).astype(np.intp)
+        centres_y = (top + (np.arange(self.num_rows) + 0.5) * cell_h).astype(np.intp)
+        self._cell_y, self._cell_x = np.meshgrid(centres_y, centres_x, indexing="ij")
+
+        if preview is not None:
+            p_left, p_top, p_right, p_bottom = preview
+            # Half-cell grid: every preview cell gets at least one sample whatever its offset.
+            xs = np.arange(p_left + cell_w / 4, p_right, cell_w / 2).astype(np.intp)
+            ys = np.arange(p_top + cell_h / 4, p_bottom, cell_h / 2).astype(np.intp)
+            self._preview_y, self._preview_x = np.meshgrid(ys, xs, indexing="ij")
+        else:
+            self._preview_y = self._preview_x = None
+
+        self._shape = frame.shape
+        self._check_y = np.array([(top + bottom) // 2])
+        self._check_x = np.array([max(left - 2, 0)])
+        self._check_colour = frame.sample(self._check_y, self._check_x).astype(np.int16)
+
+    def _calibrated_for(self, frame):
+        if self._shape != frame.shape:
+            return False
+        check = frame.sample(self._check_y, self._check_x).astype(np.int16)
+        return bool((np.abs(check - self._check_colour) <= 2).all())
+
+    def _classify(self, samples):
+        """
+        Palette index of each sample, or -1 for empty cells.
+        """
+        samples = samples.astype(np.float32)
+        empty = np.linalg.norm(samples - self.empty, axis=-1) <= EMPTY_DISTANCE
+        distances = np.linalg.norm(samples[..., None, :] - self.palette, axis=-1)
+        return np.where(empty, -1, distances.argmin(axis=-1))
+
+    def parse(self, image):
+        """
+        Read a screenshot.
+
+        Parameters:
+            image: screenshot (PIL image, mss ScreenShot or ndarray)
+        Returns:
+            (TetrisObservation)
+        Raises:
+            ValueError: if the playfield cannot be found
+        """
+        frame = PixelView(image)
+        if not self._calibrated_for(frame):
+            self.calibrate(frame)
+
+        colours = self._classify(frame.sample(self._cell_y, self._cell_x))
+        filled = colours >= 0
+        piece, rotation, x, y, piece_cells = self._active_piece(colours, filled)
+        if self._last_rows is not None:
+            locked = ((np.array(self._last_rows)[:, None] >> np.arange(self.columns)) & 1).astype(bool)
+            if piece is None or all(locked[r, c] for r, c in piece_cells):
+                # The piece may touch stack cells of its own colour: look among the new cells only.
+                found = self._active_piece(colours, filled & ~locked)
+                if found[0] is not None:
+                    piece, rotation, x, y, piece_cells = found
+        rows = []
+        for r in range(self.num_rows):
+            mask = 0
+            for c in range(self.columns):
+                if colours[r, c] >= 0 and (r, c) not in piece_cells:
+                    mask |= 1 << c
+            rows.append(mask)
+        self._last_rows = rows
+        return TetrisObservation(rows, piece, rotation, x, y, self._next_piece(frame))
+
+    def _active_piece(self, colours, filled):
+        """
+        (piece, rotation, x, y, cells) of the active piece among the `filled` cells,
+        or Nones and an empty set.
+        """
+        seen = set()
+        fallback = None
+        for r, c in zip(*np.nonzero(filled)):
+            if (r, c) in seen:
+                continue
+            # Same-coloured 4-connected component, stopping once it's too big for a piece.
+            component, stack = {(r, c)}, [(r, c)]
+            while stack and len(component) <= 4:
+                cr, cc = stack.pop()
+                for nr, nc in ((cr + 1, cc), (cr - 1, cc), (cr, cc + 1), (cr, cc - 1)):
+                    if (0 <= nr < self.num_rows and 0 <= nc < self.columns and (nr, nc) not in component
+                            and filled[nr, nc] and colours[nr, nc] == colours[r, c]):
+                        component.add((nr, nc))
+                        stack.append((nr, nc))
+            seen |= component
+            if len(component) != 4:
+                continue
+            key, top, left = _shape_key(component)
+            if key not in SHAPES:
+                continue
+            piece, rotation, row_offset, column_offset = SHAPES[key]
+            found = (piece, rotation, int(left - column_offset), int(top - row_offset), component)
+            can_fall = all(
+                cr + 1 < self.num_rows and ((cr + 1, cc) in component or not filled[cr + 1, cc])
+                for cr, cc in component
+            )
+            if can_fall:
+                return found
+            # A landed piece looks like the stack; prefer one that wasn't locked last frame.
+            was_locked = self._last_rows is not None and all(self._last_rows[cr] >> cc & 1 for cr, cc in component)
+            if fallback is None or (fallback[5] and not was_locked):
+                fallback = found + (was_locked,)
+        return fallback[:5] if fallback else (None, None, None, None, set())
+
+    def _next_piece(self, frame):
+        if self._preview_y is None:
+            return None
+        colours = self._classify(frame.sample(self._preview_y, self._preview_x))
+        filled = colours[colours >= 0]
+        if not len(filled):
+            return None
+        return self.names[np.bincount(filled).argmax()]
+
+
+def observation_to_text(observation):
+    """
+    Compact text rendering for prompts: "#" stack, the piece letter for the active piece,
+    "." empty, one row per line, plus the current and next piece.
+    """
+    grid = [["#" if row >> c & 1 else "." for c in range(WIDTH)] for row in observation.rows]
+    if observation.piece is not None:
+        for r, c in ROTATIONS[observation.piece][observation.rotation]:
+            if 0 <= observation.y + r < len(grid):
+                grid[observation.y + r][observation.x + c] = observation.piece
+    header = f"Current piece: {observation.piece or 'unknown'}, next piece: {observation.next_piece or 'unknown'}"
+    return header + "\n" + "\n".join("".join(row) for row in grid)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check the Tetris board extractor on simulated frames.")
+    parser.add_argument("--frames", type=int, default=200, help="Number of frames to read.")
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the simulated game.")
+    args = parser.parse_args()
+
+    game = TetrisSimulator(args.seed)
+    extractor = TetrisBoardExtractor()
+    rng = np.random.default_rng(args.seed)
+    correct, elapsed = 0, 0.0
+    for _ in range(args.frames):
+        for key in rng.choice(["left", "right", "up", "down"], size=3):
+            game.press(key)
+        game.advance(0.75)
+        if game.game_over:
+            game.reset(int(rng.integers(1 << 30)))
+        frame = np.asarray(game.render_image())
+        start = time.perf_counter()
+        observation = extractor.parse(frame)
+        elapsed += time.perf_counter() - start
+        stack = [sum(1 << c for c, cell in enumerate(row) if cell) for row in game.locked]
+        correct += (observation.rows == stack and observation.piece == game.piece
+                    and observation.next_piece == game.next_pieces[0])
+    print(f"{correct}/{args.frames} frames read correctly, {elapsed / args.frames * 1000:.3f}ms/frame")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,227 @@
+"""
+Local Tetris placement search: a policy that answers in milliseconds.
+
+For the current piece, every rotation x column is dropped straight down on the bitmask
+rows of the stack, and each result is looked ahead one piece (every placement of the
+next piece). Boards are scored with a weighted sum of aggregate height, complete
+lines, holes and bumpiness, and the best placement is turned into key presses by
+replaying them on TetrisSimulator, so rotation kicks move the piece as in the game.
+"""
+
+import re
+import json
+
+from tools.actions import Action, DEFAULT_CALL_PAUSE
+from games.tetris.simulator import ROTATIONS, PIECE_MASKS, WIDTH, GRAVITY, TetrisSimulator
+
+# Weights of the heuristic (per feature); the defaults are a well-known tuned set.
+DEFAULT_WEIGHTS = {
+    "height": -0.510066,
+    "lines": 0.760666,
+    "holes": -0.35663,
+    "bumpiness": -0.184483,
+}
+
+# Lowest cell row of each column of a rotation state: column -> row offset.
+_BOTTOMS = {
+    piece: [{c: max(r for r, cc in cells if cc == c) for _, c in cells} for cells in states]
+    for piece, states in ROTATIONS.items()
+}
+
+
+def column_heights(rows, width=WIDTH):
+    """
+    Height of every column (0 = empty) and the number of holes, for rows listed top first.
+    """
+    height = len(rows)
+    heights = [0] * width
+    seen = 0
+    holes = 0
+    for r, row in enumerate(rows):
+        new = row & ~seen
+        while new:
+            bit = new & -new
+            heights[bit.bit_length() - 1] = height - r
+            new ^= bit
+        seen |= row
+        holes += bin(seen & ~row).count("1")
+    return heights, holes
+
+
+def drop(rows, heights, piece, rotation, x):
+    """
+    Drop a piece straight down at column `x` in the given rotation.
+
+    Returns:
+        (tuple): (new rows, lines cleared, landing y), or None if it doesn't fit
+    """
+    masks, left, right = PIECE_MASKS[piece][rotation]
+    if x + left < 0 or x + right >= WIDTH:
+        return None
+    height = len(rows)
+    # The piece rests on the highest stack cell under any of its columns.
+    y = min(height - heights[x + c] - 1 - bottom for c, bottom in _BOTTOMS[piece][rotation].items())
+    new = list(rows)
+    for dr, mask in masks:
+        row = y + dr
+        if row < 0:
+            return None  # Tops out.
+        new[row] |= mask << x if x >= 0 else mask >> -x
+    full = (1 << WIDTH) - 1
+    kept = [row for row in new if row != full]
+    cleared = height - len(kept)
+    return [0] * cleared + kept, cleared, y
+
+
+def placements(rows, piece):
+    """
+    Every distinct (rotation, x, new rows, lines cleared, landing y) of a piece.
+    """
+    heights, _ = column_heights(rows)
+    seen = set()
+    for rotation in range(4):
+        for x in range(-3, WIDTH):
+            result = drop(rows, heights, piece, rotation, x)
+            if result is None:
+                continue
+            # Symmetric rotation states give the same board; keep the first.
+            key = tuple(result[0])
+            if key in seen:
+                continue
+            seen.add(key)
+            yield (rotation, x) + result
+
+
+class PlacementPlanner:
+    """
+    Chooses where to put the current piece and how to get it there.
+    The weights can be replaced at runtime (e.g. by a model acting as an advisor).
+    """
+
+    def __init__(self, weights=None, lookahead=True, call_pause=DEFAULT_CALL_PAUSE, gravity=GRAVITY):
+        self.weights = dict(DEFAULT_WEIGHTS, **(weights or {}))
+        self.lookahead = lookahead
+        self.call_pause = call_pause
+        self.gravity = gravity
+        # Decisions per (stack, piece, next piece): a piece is re-planned on every new frame.
+        self._decisions = {}
+
+    def set_weights(self, weights):
+        """
+        Update the known weights from a dict, ignoring unknown keys and non-numbers.
+        """
+        updated = {key: float(value) for key, value in weights.items()
+                   if key in DEFAULT_WEIGHTS and isinstance(value, (int, float))}
+        self.weights = dict(self.weights, **updated)
+        self._decisions.clear()
+        return updated
+
+    def evaluate(self, rows, lines):
+        heights, holes = column_heights(rows)
+        bumpiness = sum(abs(a - b) for a, b in zip(heights, heights[1:]))
+        w = self.weights
+        return w["height"] * sum(heights) + w["lines"] * lines + w["holes"] * holes + w["bumpiness"] * bumpiness
+
+    def best_placement(self, rows, piece, next_piece=None):
+        """
+        Returns:
+            (tuple): (rotation, x, landing y, score), or None if every placement tops out
+        """
+        key = (tuple(rows), piece, next_piece)
+        if key in self._decisions:
+            return self._decisions[key]
+        if len(self._decisions) > 4096:
+            self._decisions.clear()
+
+        best = None
+        for rotation, x, new_rows, lines, y in placements(rows, piece):
+            score = self.evaluate(new_rows, lines)
+            if self.lookahead and next_piece is not None:
+                follow = [self.evaluate(r2, lines + l2) for _, _, r2, l2, _ in placements(new_rows, next_piece)]
+                if follow:
+                    score = max(follow)
+            if best is None or score > best[3]:
+                best = (rotation, x, y, score)
+        self._decisions[key] = best
+        return best
+
+    def plan(self, rows, piece, rotation, x, y, next_piece=None):
+        """
+        Key presses that move the active piece to its best placement, as Actions.
+        """
+        target = self.best_placement(rows, piece, next_piece)
+        if target is None:
+            return []
+        target_rotation, target_x, landing_y, _ = target
+
+        game = TetrisSimulator.from_observation(rows, piece, rotation, x, y, gravity=self.gravity)
+        keys = []
+        for _ in range((target_rotation - rotation) % 4):
+            if game.press("up"):
+                keys.append("up")
+        key = "left" if target_x < game.x else "right"
+        while game.x != target_x and game.press(key):
+            keys.append(key)
+
+        # Soft-drop most of the way; gravity covers the rest while the keys play.
+        elapsed = len(keys) * self.call_pause
+        distance = landing_y - game.y - elapsed / self.gravity
+        downs = int(distance / (1 + self.call_pause / self.gravity)) - 1
+        keys += ["down"] * max(downs, 0)
+
+        actions = []
+        for key in keys:
+            actions += [Action("press", key), Action("sleep", self.call_pause)]
+        return actions
+
+    def plan_for(self, game):
+        """
+        Plan from a TetrisSimulator (e.g. a simulated capture).
+        """
+        if game.game_over:
+            return []
+        next_piece = game.next_pieces[0] if game.next_pieces else None
+        return self.plan(game.rows, game.piece, game.rotation, game.x, game.y, next_piece)
+
+    def plan_observation(self, observation):
+        """
+        Plan from a TetrisObservation read from the screen; no actions if no piece was found.
+        """
+        if observation.piece is None:
+            return []
+        return self.plan(observation.rows, observation.piece, observation.rotation,
+                         observation.x, observation.y, observation.next_piece)
+
+
+def planner_policy(planner):
+    """
+    Wrap a planner as a simulator policy.
+    """
+    def policy(game, plan_seconds):
+        return planner.plan_for(game)
+    return policy
+
+
+def parse_weights(response):
+    """
+    Read a JSON object of heuristic weights from a model response.
+    """
+    match = re.search(r"\{.*?\}", response, re.DOTALL)
+    if not match:
+        raise ValueError(f"No weights found in response: {response!r}")
+    return json.loads(match.group(0))
+
+
+ADVISOR_PROMPT = """
+You are advising a Tetris placement search. It scores every board with
+  height * (sum of column heights) + lines * (lines cleared) + holes * (covered empty cells) + bumpiness * (sum of height differences between neighbouring columns)
+and picks the placement with the highest score.
+
+Current weights: {weights}
+
+{board}
+
+Given the board, suggest weights for the next few pieces: e.g. penalise height harder when the stack is high,
+or favour line clears when several rows are nearly complete.
+Reply with a single JSON object with the keys "height", "lines", "holes" and "bumpiness" and nothing else.
+"""
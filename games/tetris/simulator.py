@@ -0,0 +1,464 @@
+"""
+Deterministic headless Tetris for measuring policies and latency effects offline.
+
+TetrisSimulator is a 10x20 Tetris on bitmask rows (bit c of a row is column c) with
+SRS rotation and wall kicks, a seeded 7-bag and gravity of one row every 0.75s, the
+speed the Tetris prompt states. It takes the same keys the agent sends (left, right,
+up = rotate clockwise, down = one row down) and runs on a simulated clock.
+
+`simulate` replays the agent's control model on top of it: workers start at staggered
+offsets, each captures the board, waits out a simulated API latency, and hands the
+plan its policy produced to an arbiter that behaves like tools.actions.ActionArbiter
+(preemption, stale and superseded plans, horizon truncation). Everything runs in
+simulated time, so minutes of play take well under a second.
+"""
+
+import copy
+import heapq
+import random
+import argparse
+from collections import deque
+
+from PIL import Image, ImageDraw
+
+from tools.actions import Action, DEFAULT_CALL_PAUSE, parse_actions, add_scheduler_args
+
+WIDTH, HEIGHT = 10, 20
+GRAVITY = 0.75
+PIECE_NAMES = "IJLOSTZ"
+LINE_SCORES = {1: 100, 2: 300, 3: 500, 4: 800}
+
+# Colours of `render_image`, the reference layout of board_extractor.
+PIECE_COLOURS = {
+    "I": (0, 240, 240), "J": (0, 0, 240), "L": (240, 160, 0), "O": (240, 240, 0),
+    "S": (0, 240, 0), "T": (160, 0, 240), "Z": (240, 0, 0),
+}
+EMPTY_COLOUR = (0, 0, 0)
+STACK_COLOUR = (128, 128, 128)  # Stack cells of unknown piece
+GRID_COLOUR = (24, 24, 24)
+BACKGROUND_COLOUR = (60, 60, 80)
+
+# Spawn orientation of each piece in its SRS bounding box, top row first.
+SHAPES = {
+    "I": ("....", "####", "....", "...."),
+    "J": ("#..", "###", "..."),
+    "L": ("..#", "###", "..."),
+    "O": ("##", "##"),
+    "S": (".##", "##.", "..."),
+    "T": (".#.", "###", "..."),
+    "Z": ("##.", ".##", "..."),
+}
+
+# SRS clockwise kicks from rotation state r, as (dx, dy) with y pointing up.
+_KICKS_JLSTZ = (
+    ((0, 0), (-1, 0), (-1, 1), (0, -2), (-1, -2)),
+    ((0, 0), (1, 0), (1, -1), (0, 2), (1, 2)),
+    ((0, 0), (1, 0), (1, 1), (0, -2), (1, -2)),
+    ((0, 0), (-1, 0), (-1, -1), (0, 2), (-1, 2)),
+)
+_KICKS_I = (
+    ((0, 0), (-2, 0), (1, 0), (-2, -1), (1, 2)),
+    ((0, 0), (-1, 0), (2, 0), (-1, 2), (2, -1)),
+    ((0, 0), (2, 0), (-1, 0), (2, 1), (-1, -2)),
+    ((0, 0), (1, 0), (-2, 0), (1, -2), (-2, 1)),
+)
+
+
+def _rotations(shape):
+    """
+    Cells (row, col) of the four rotation states of a shape, rotating clockwise in its box.
+    """
+    size = len(shape)
+    cells = [(r, c) for r, line in enumerate(shape) for c, ch in enumerate(line) if ch == "#"]
+    states = []
+    for _ in range(4):
+        states.append(tuple(sorted(cells)))
+        cells = [(c, size - 1 - r) for r, c in cells]
+    return states
+
+
+def _row_masks(cells):
+    """
+    (row offset, column bitmask) per occupied row of a rotation state, plus its column span.
+    """
+    rows = {}
+    for r, c in cells:
+        rows[r] = rows.get(r, 0) | (1 << c)
+    columns = [c for _, c in cells]
+    return tuple(sorted(rows.items())), min(columns), max(columns)
+
+
+ROTATIONS = {name: _rotations(shape) for name, shape in SHAPES.items()}
+PIECE_MASKS = {name: [_row_masks(cells) for cells in states] for name, states in ROTATIONS.items()}
+SPAWN_X = {name: (4 if name == "O" else 3) for name in SHAPES}
+SPAWN_Y = {name: (-1 if name == "I" else 0) for name in SHAPES}
+
+
+class TetrisSimulator:
+    """
+    One Tetris game on a simulated clock.
+
+    `rows[0]` is the top row. The active piece is `piece` in rotation state `rotation`
+    with its bounding box at column `x`, row `y` (rows above the board are allowed while
+    a piece enters). A piece that can't fall on a gravity tick locks; a new piece that
+    overlaps the stack ends the game.
+    """
+
+    def __init__(self, seed=None, gravity=GRAVITY, width=WIDTH, height=HEIGHT, preview=1):
+        self.gravity = gravity
+        self.width = width
+        self.height = height
+        self.preview = preview
+        self.full_row = (1 << width) - 1
+        self.reset(seed)
+
+    @classmethod
+    def from_observation(cls, rows, piece, rotation, x, y, next_pieces=(), **kwargs):
+        """
+        Game in a given position, e.g. one read from the screen. The stack has no colours.
+        """
+        game = cls(**kwargs)
+        game.rows = list(rows)
+        game.locked = [["#" if row >> c & 1 else "" for c in range(game.width)] for row in game.rows]
+        game.piece, game.rotation, game.x, game.y = piece, rotation, x, y
+        game.queue = deque(next_pieces)
+        return game
+
+    def reset(self, seed=None, start_time=0.0):
+        """
+        Start a new game, with the clock at `start_time`.
+        """
+        self.rng = random.Random(seed)
+        self.rows = [0] * self.height
+        self.locked = [[""] * self.width for _ in range(self.height)]
+        self.queue = deque()
+        self.time = start_time
+        self.lines = 0
+        self.score = 0
+        self.pieces = 0
+        self.game_over = False
+        self._next_drop = start_time + self.gravity
+        self._spawn()
+
+    def _refill(self):
+        while len(self.queue) <= self.preview:
+            bag = list(PIECE_NAMES)
+            self.rng.shuffle(bag)
+            self.queue.extend(bag)
+
+    def _spawn(self):
+        self._refill()
+        self.piece = self.queue.popleft()
+        self._refill()
+        self.rotation = 0
+        self.x, self.y = SPAWN_X[self.piece], SPAWN_Y[self.piece]
+        if self.collides(self.piece, self.rotation, self.x, self.y):
+            self.game_over = True
+
+    @property
+    def next_pieces(self):
+        return list(self.queue)[:self.preview]
+
+    def collides(self, piece, rotation, x, y, rows=None):
+        """
+        Whether the piece would leave the board or overlap the stack at (x, y).
+        """
+        rows = self.rows if rows is None else rows
+        masks, left, right = PIECE_MASKS[piece][rotation]
+        if x + left < 0 or x + right >= self.width:
+            return True
+        for dr, mask in masks:
+            row = y + dr
+            if row >= self.height:
+                return True
+            if row >= 0 and rows[row] & (mask << x if x >= 0 else mask >> -x):
+                return True
+        return False
+
+    def press(self, key):
+        """
+        Apply one key ("left", "right", "up" or "down"). Returns whether the piece moved.
+        """
+        if self.game_over:
+            return False
+        if key in ("left", "right"):
+            dx = -1 if key == "left" else 1
+            if not self.collides(self.piece, self.rotation, self.x + dx, self.y):
+                self.x += dx
+                return True
+        elif key == "up":
+            return self._rotate()
+        elif key == "down":
+            if not self.collides(self.piece, self.rotation, self.x, self.y + 1):
+                self.y += 1
+                return True
+        return False
+
+    def _rotate(self):
+        if self.piece == "O":
+            return False
+        target = (self.rotation + 1) % 4
+        kicks = _KICKS_I if self.piece == "I" else _KICKS_JLSTZ
+        for dx, dy in kicks[self.rotation]:
+            if not self.collides(self.piece, target, self.x + dx, self.y - dy):
+                self.rotation, self.x, self.y = target, self.x + dx, self.y - dy
+                return True
+        return False
+
+    def advance(self, seconds):
+        self.advance_to(self.time + seconds)
+
+    def advance_to(self, t):
+        """
+        Run gravity until the clock reaches `t`.
+        """
+        while not self.game_over and self._next_drop <= t:
+            self.time = self._next_drop
+            self._next_drop += self.gravity
+            if not self.collides(self.piece, self.rotation, self.x, self.y + 1):
+                self.y += 1
+            else:
+                self._lock()
+        self.time = max(self.time, t)
+
+    def _lock(self):
+        masks, _, _ = PIECE_MASKS[self.piece][self.rotation]
+        for dr, mask in masks:
+            row = self.y + dr
+            if row < 0:
+                # Locked above the visible board: top-out.
+                self.game_over = True
+                return
+            self.rows[row] |= mask << self.x if self.x >= 0 else mask >> -self.x
+        for r, c in ROTATIONS[self.piece][self.rotation]:
+            self.locked[self.y + r][self.x + c] = self.piece
+        kept = [i for i, row in enumerate(self.rows) if row != self.full_row]
+        cleared = self.height - len(kept)
+        if cleared:
+            self.rows = [0] * cleared + [self.rows[i] for i in kept]
+            self.locked = [[""] * self.width for _ in range(cleared)] + [self.locked[i] for i in kept]
+            self.lines += cleared
+            self.score += LINE_SCORES[cleared]
+        self.pieces += 1
+        self._spawn()
+
+    def play(self, actions):
+        """
+        Execute a list of Actions (from tools.actions) in simulated time.
+        """
+        for action in actions:
+            if action.name == "sleep":
+                self.advance(action.arg)
+            elif action.name in ("press", "keyDown"):
+                self.press(action.arg)
+
+    def cells(self):
+        """
+        The board as a list of rows of piece names ("" for empty), active piece included.
+        """
+        grid = [list(row) for row in self.locked]
+        if not self.game_over:
+            for r, c in ROTATIONS[self.piece][self.rotation]:
+                if 0 <= self.y + r < self.height:
+                    grid[self.y + r][self.x + c] = self.piece
+        return grid
+
+    def render_image(self, cell=30, border=20):
+        """
+        Draw the game: the playfield on the left, the next piece in a box to its right.
+
+        Returns:
+            (Image): RGB frame
+        """
+        board_width, board_height = self.width * cell, self.height * cell
+        image = Image.new("RGB", (3 * border + board_width + 6 * cell, 2 * border + board_height), BACKGROUND_COLOUR)
+        draw = ImageDraw.Draw(image)
+
+        def draw_cell(x, y, piece):
+            draw.rectangle((x, y, x + cell - 1, y + cell - 1), fill=GRID_COLOUR)
+            draw.rectangle((x + 1, y + 1, x + cell - 2, y + cell - 2), fill=PIECE_COLOURS.get(piece, STACK_COLOUR) if piece else EMPTY_COLOUR)
+
+        for r, row in enumerate(self.cells()):
+            for c, piece in enumerate(row):
+                draw_cell(border + c * cell, border + r * cell, piece)
+
+        preview_left = 2 * border + board_width
+        draw.rectangle((preview_left, border, preview_left + 6 * cell - 1, border + 4 * cell - 1), fill=EMPTY_COLOUR)
+        if self.next_pieces:
+            piece = self.next_pieces[0]
+            for r, c in ROTATIONS[piece][0]:
+                draw_cell(preview_left + (c + 1) * cell, border + (r + 1) * cell, piece)
+        return image
+
+    def snapshot(self):
+        """
+        Independent copy of the game, e.g. the state a worker captured.
+        """
+        return copy.deepcopy(self)
+
+    def __str__(self):
+        return "\n".join("".join(cell[:1] or "." for cell in row) for row in self.cells())
+
+
+def random_policy(seed=None):
+    """
+    Baseline policy: shift and rotate the piece at random, then drop it a few rows.
+    """
+    rng = random.Random(seed)
+
+    def policy(game, plan_seconds):
+        keys = ["up"] * rng.randint(0, 3) + [rng.choice(["left", "right"])] * rng.randint(0, 5)
+        keys += ["down"] * rng.randint(0, 4)
+        actions = []
+        for key in keys:
+            actions += [Action("press", key), Action("sleep", DEFAULT_CALL_PAUSE)]
+        return actions
+    return policy
+
+
+def simulate(policy, seconds, offsets, plan_seconds, latency, seed=None, latency_jitter=0.0,
+             preempt=True, max_frame_age=None, horizon_slack=0.5):
+    """
+    Play `seconds` of simulated time with one worker per offset, like tetris_agent.
+
+    Parameters:
+        policy: policy(game_snapshot, plan_seconds) -> list of Actions, or PyAutoGUI code
+        seconds (float): simulated play time
+        offsets (list): start delay of each worker in seconds
+        plan_seconds (float): control time each plan is requested for
+        latency (float): mean API latency in seconds (capture to plan submission)
+        latency_jitter (float): latencies are uniform in latency * (1 +- jitter)
+        preempt, max_frame_age, horizon_slack: as for ActionArbiter
+    Returns:
+        (dict): lines, lines_per_minute, pieces, top_outs and plan counters
+    """
+    game = TetrisSimulator(seed)
+    rng = random.Random(seed)
+    stats = {"lines": 0, "pieces": 0, "top_outs": 0, "plans": 0, "preempted": 0,
+             "stale": 0, "superseded": 0, "truncated": 0}
+    events = []
+    sequence = 0
+
+    def push(t, kind, *payload):
+        nonlocal sequence
+        heapq.heappush(events, (t, sequence, kind, payload))
+        sequence += 1
+
+    plan_workers = {}      # plan id -> worker waiting for it
+    cancelled = set()
+    current = None         # plan id submitted last
+    busy_until = 0.0
+    latest_capture = float("-inf")
+
+    for worker, offset in enumerate(offsets):
+        push(offset, "capture", worker)
+
+    while events and events[0][0] <= seconds:
+        t, _, kind, payload = heapq.heappop(events)
+        game.advance_to(t)
+        if game.game_over:
+            stats["top_outs"] += 1
+            stats["lines"] += game.lines
+            stats["pieces"] += game.pieces
+            game.reset(rng.random(), start_time=t)
+
+        if kind == "capture":
+            (worker,) = payload
+            delay = latency * (1 + latency_jitter * (2 * rng.random() - 1))
+            push(t + max(delay, 0.0), "response", worker, t, game.snapshot())
+
+        elif kind == "response":
+            worker, captured_at, snapshot = payload
+            if max_frame_age is not None and t - captured_at > max_frame_age:
+                stats["stale"] += 1
+                push(t, "capture", worker)
+                continue
+            if captured_at < latest_capture:
+                stats["superseded"] += 1
+                push(t, "capture", worker)
+                continue
+            latest_capture = captured_at
+
+            actions = policy(snapshot, plan_seconds)
+            if isinstance(actions, str):
+                try:
+                    actions = parse_actions(actions)
+                except (SyntaxError, ValueError):
+                    actions = []
+            stats["plans"] += 1
+            plan = stats["plans"]
+            plan_workers[plan] = worker
+
+            if preempt and current is not None and busy_until > t:
+                stats["preempted"] += 1
+                cancelled.add(current)
+                push(t, "capture", plan_workers.pop(current))
+            start = t if preempt else max(t, busy_until)
+            offset = 0.0
+            for action in actions:
+                if action.name == "sleep":
+                    offset += action.arg
+                    continue
+                if offset > plan_seconds + horizon_slack:
+                    stats["truncated"] += 1
+                    break
+                if action.name in ("press", "keyDown"):
+                    push(start + offset, "key", plan, action.arg)
+            current, busy_until = plan, start + offset
+            push(busy_until, "plan_end", plan)
+
+        elif kind == "key":
+            plan, key = payload
+            if plan not in cancelled:
+                game.press(key)
+
+        elif kind == "plan_end":
+            (plan,) = payload
+            if plan in plan_workers:
+                push(t, "capture", plan_workers.pop(plan))
+
+    game.advance_to(seconds)
+    stats["lines"] += game.lines
+    stats["pieces"] += game.pieces
+    stats["lines_per_minute"] = stats["lines"] / (seconds / 60)
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Simulate the Tetris agent's control loop headlessly.")
+    parser.add_argument("--seconds", type=float, default=600, help="Simulated play time per run.")
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the piece bag and latencies.")
+    parser.add_argument("--policy", type=str, default="random", choices=["random", "planner"],
+                        help="Policy to simulate: random key presses or the local placement planner.")
+    parser.add_argument("--concurrency_interval", type=float, default=1,
+                        help="Interval in seconds between workers.")
+    parser.add_argument("--api_response_latency_estimate", type=float, default=5,
+                        help="Mean simulated API response latency in seconds.")
+    parser.add_argument("--latency_jitter", type=float, default=0.3,
+                        help="Simulated latencies are uniform in latency * (1 +- jitter).")
+    parser.add_argument("-control_time", type=float, default=4,
+                        help="Worker control time.")
+    add_scheduler_args(parser)
+    args = parser.parse_args()
+
+    # workers and planner build on this module.
+    from games.tetris.workers import worker_offsets
+    from games.tetris.planner import PlacementPlanner, planner_policy
+
+    offsets = worker_offsets(args.api_response_latency_estimate, args.control_time, args.concurrency_interval)
+    policy = planner_policy(PlacementPlanner()) if args.policy == "planner" else random_policy(args.seed)
+
+    stats = simulate(
+        policy, args.seconds, offsets, args.control_time, args.api_response_latency_estimate,
+        seed=args.seed, latency_jitter=args.latency_jitter, preempt=not args.no_preempt,
+        max_frame_age=args.max_frame_age, horizon_slack=args.horizon_slack,
+    )
+    print(f"{len(offsets)} workers, {args.seconds:.0f}s simulated: "
+          f"{stats['lines']} lines ({stats['lines_per_minute']:.2f}/min), {stats['pieces']} pieces, "
+          f"{stats['top_outs']} top-outs")
+    print(f"Plans: {stats['plans']} run, {stats['preempted']} preempted, {stats['stale']} stale, "
+          f"{stats['superseded']} superseded, {stats['truncated']} truncated")
+
+
+if __name__ == "__main__":
+    main()
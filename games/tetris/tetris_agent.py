@@ -1,14 +1,32 @@
-import time
-import numpy as np
-import concurrent.futures
 import argparse
 
-from games.tetris.workers import worker_tetris
+from games.tetris.workers import worker_tetris, worker_offsets, worker_tetris_planner, advise_weights, planner_fallback
+from tools.serving.engine import InferenceEngine
+from tools.serving.api_providers import add_hedging_args, configure_hedging_from_args, provider_summary
+from tools.frames import FrameEncoder, add_frame_args
+from tools.capture import FrameCaptureService, screen_region_grabber, add_capture_args
+from tools.frame_gate import FrameChangeGate, add_gate_args
+from tools.actions import ActionArbiter, add_scheduler_args
+from tools.pacing import AdaptivePacer, add_pacing_args
+from games.tetris.board_extractor import TetrisBoardExtractor
+from games.tetris.planner import PlacementPlanner
 
 system_prompt = (
     "You are an expert AI agent specialized in playing Tetris gameplay, search for and execute optimal moves given each game state. Prioritize line clearing over speed."
 )
 
+# Frame preprocessing defaults. The crop covers the play area of the reference
+# Tetris window; adjust it (or pass --crop) to match your layout.
+preprocess_config = {
+    "crop": (0, 0, 18 / 64, 40 / 64),
+    "max_long_edge": None,
+    "palette_colors": None,
+}
+
+# Board extractor layout overrides (see board_extractor.default_config). By default the
+# playfield and the next-piece box are located automatically inside the crop.
+extractor_config = {}
+
 def main():
     """
     Spawns a number of short-term and/or long-term Tetris workers based on user-defined parameters.
@@ -28,38 +46,84 @@ def main():
     parser.add_argument("-control_time", type=float, default=4,
                         help=" orker control time.")
     parser.add_argument("--policy", type=str, default="fixed", 
-                        choices=["fixed"],
-                        help="Worker policy")
+                        choices=["fixed", "planner"],
+                        help="Worker policy: 'fixed' model workers, or the local placement planner.")
+    parser.add_argument("--advisor_interval", type=float, default=0,
+                        help="With the planner policy, ask the model for new heuristic weights every this many seconds; 0 never asks.")
+    parser.add_argument("--io_workers", type=int, default=4,
+                        help="Threads used for blocking helper work such as frame comparison.")
+    parser.add_argument("--board_input", type=str, default="image", choices=["image", "text"],
+                        help="Send the model the screenshot, or the board read from its pixels as text.")
+    parser.add_argument("--fallback", type=str, default="planner", choices=["planner", "none"],
+                        help="Policy that plays while the model is unavailable (errors, timeouts, open circuit).")
+    add_frame_args(parser)
+    add_capture_args(parser)
+    add_gate_args(parser)
+    add_scheduler_args(parser)
+    add_pacing_args(parser)
+    add_hedging_args(parser)
 
     args = parser.parse_args()
+    configure_hedging_from_args(args)
 
-    worker_span = args.control_time + args.concurrency_interval
-    num_threads = int(args.api_response_latency_estimate // worker_span)
-    
-    if args.api_response_latency_estimate % worker_span != 0:
-        num_threads += 1
-    
-    # Create an offset list
-    offsets = [i * (args.control_time + args.concurrency_interval) for i in range(num_threads)]
+    if args.policy == "planner":
+        offsets = [0]  # A single local worker; the model only advises, if at all.
+    else:
+        offsets = worker_offsets(args.api_response_latency_estimate, args.control_time, args.concurrency_interval)
+    num_threads = len(offsets)
+    pacer = None
+    if args.adaptive_workers and args.policy == "fixed":
+        # Decisions every control_time + concurrency_interval, as with the fixed offsets.
+        pacer = AdaptivePacer.from_args(args, args.control_time + args.concurrency_interval, num_threads)
+        offsets = [0] * pacer.max_workers
+        num_threads = pacer.max_workers
+        print(f"Adaptive worker pool: {pacer.active} of {num_threads} workers active to start.")
 
-    print(f"Starting with {num_threads} threads using policy '{args.policy}'...")
+    print(f"Starting with {num_threads} workers using policy '{args.policy}'...")
     print(f"API Provider: {args.api_provider}, Model Name: {args.model_name}")
 
-    with concurrent.futures.ThreadPoolExecutor(max_workers=num_threads) as executor:
+    engine = InferenceEngine(io_workers=args.io_workers)
+    gate = FrameChangeGate.from_args(args)
+    scheduler = ActionArbiter.from_args(args)
+    extractor = None
+    if args.board_input == "text" or args.policy == "planner":
+        extractor = TetrisBoardExtractor.from_args(args, extractor_config, preprocess_config["crop"])
+    capture = FrameCaptureService(
+        screen_region_grabber(), FrameEncoder.from_args(args, preprocess_config),
+        fps=args.capture_fps, buffer_size=args.frame_buffer, debug_stem="cache/tetris/screenshot",
+    )
+    workers = []
+    if args.policy == "planner":
+        planner = PlacementPlanner()
+        workers.append(worker_tetris_planner(engine, capture, scheduler, extractor, planner, args.control_time))
+        if args.advisor_interval > 0:
+            workers.append(advise_weights(
+                engine, capture, extractor, planner, system_prompt,
+                args.api_provider, args.model_name, args.advisor_interval
+            ))
+    elif args.policy == "fixed":
+        fallback = None
+        if args.fallback == "planner":
+            fallback_extractor = extractor or TetrisBoardExtractor.from_args(args, extractor_config, preprocess_config["crop"])
+            fallback = planner_fallback(fallback_extractor, PlacementPlanner())
         for i in range(num_threads):
-            if args.policy == "fixed":
-                executor.submit(
-                    worker_tetris, i, offsets[i], system_prompt,
-                    args.api_provider, args.model_name, args.control_time
-                )
-            else:
-                raise NotImplementedError(f"policy: {args.policy} not implemented.")
+            workers.append(worker_tetris(
+                engine, capture, gate, scheduler, i, offsets[i], system_prompt,
+                args.api_provider, args.model_name, args.control_time, extractor, pacer, fallback
+            ))
+    else:
+        raise NotImplementedError(f"policy: {args.policy} not implemented.")
 
-        try:
-            while True:
-                time.sleep(0.25)
-        except KeyboardInterrupt:
-            print("\nMain thread interrupted. Exiting all threads...")
+    capture.start()
+    try:
+        engine.run(workers)
+    finally:
+        capture.stop()
+        scheduler.stop()
+        print(f"Input scheduler: {scheduler.summary()}")
+        if pacer is not None:
+            print(f"Worker pool: {pacer.summary()}")
+        print(f"Providers:\n{provider_summary()}")
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
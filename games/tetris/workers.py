@@ -1,31 +1,109 @@
+import asyncio
 import time
-import os
-import pyautogui
+import json
 import numpy as np
 
-from tools.utils import encode_image, log_output, extract_python_code
-from tools.serving.api_providers import anthropic_completion, openai_completion, gemini_completion
+from tools.utils import log_output, extract_python_code
+from tools.serving.api_providers import async_completion
+from tools.serving.resilience import ProviderUnavailable
+from tools.capture import frame_age
+from tools.actions import Plan, parse_actions, plan_duration
+from games.tetris.board_extractor import observation_to_text
+from games.tetris.planner import ADVISOR_PROMPT, parse_weights
 
-def worker_tetris(
+def worker_offsets(latency_estimate, control_time, concurrency_interval):
+    """
+    Start offsets of enough workers, staggered by control_time + concurrency_interval,
+    to cover the estimated API latency.
+    """
+    worker_span = control_time + concurrency_interval
+    num_threads = int(latency_estimate // worker_span)
+    if latency_estimate % worker_span != 0:
+        num_threads += 1
+    return [i * worker_span for i in range(num_threads)]
+
+def planner_fallback(extractor, planner):
+    """
+    Fallback policy for when the model is unavailable: the placement planner's key presses
+    for the board read from a frame (raises ValueError if the board can't be read).
+    """
+    def fallback(image):
+        return planner.plan_observation(extractor.parse(image))
+    return fallback
+
+async def play_fallback(engine, capture, scheduler, thread_id, fallback, plan_seconds, reason):
+    """
+    Keep playing while the model is unavailable: plan the freshest frame with `fallback`
+    (or wait out the control horizon without one) and wait for the plan to finish.
+    """
+    print(f"[Thread {thread_id}] Model unavailable ({reason})")
+    if fallback is None:
+        await asyncio.sleep(plan_seconds)
+        return
+    frame = capture.latest() or await engine.run_io(capture.wait_for_frame)
+    try:
+        actions = await engine.run_io(fallback, frame.image)
+    except ValueError as e:
+        print(f"[Thread {thread_id}] Fallback could not read the board: {e}")
+        await asyncio.sleep(capture.interval)
+        return
+    plan = Plan(actions, source="fallback", captured_at=frame.timestamp, horizon=plan_seconds)
+    plan.close()
+    # Joins the fallback plan of another worker if one is still playing.
+    plan = scheduler.submit_fallback(plan)
+    await plan.wait_async()
+    print(f"[Thread {thread_id}] Fallback plan of {len(plan.actions)} actions {plan.status}")
+
+def submit_code(scheduler, thread_id, clean_code, frame, plan_seconds):
+    """
+    Parse generated PyAutoGUI code into actions and hand them to the input scheduler,
+    stamped with the capture time of `frame` and a horizon of `plan_seconds`.
+    Returns the submitted Plan, or None if the code could not be parsed.
+    """
+    try:
+        actions = parse_actions(clean_code)
+    except (SyntaxError, ValueError) as e:
+        print(f"[Thread {thread_id}] Error parsing code: {e}")
+        return None
+    print(f"[Thread {thread_id}] Plan: {len(actions)} actions over {plan_duration(actions):.2f}s")
+    plan = Plan(actions, source=clean_code, captured_at=frame.timestamp, horizon=plan_seconds)
+    plan.close()
+    return scheduler.submit(plan)
+
+async def worker_tetris(
+    engine,
+    capture,
+    gate,
+    scheduler,
     thread_id,
     offset,
     system_prompt,
     api_provider,
     model_name,
     plan_seconds,
+    extractor=None,
+    pacer=None,
+    fallback=None,
 ):
     """
-    A single Tetris worker that plans moves for 'plan_seconds'.
+    A single Tetris worker coroutine that plans moves for 'plan_seconds'.
+    Frames come from the shared capture service; generated code is parsed into an action
+    plan that the input scheduler executes.
     1) Sleeps 'offset' seconds before starting (to stagger starts).
     2) Continuously:
-        - Captures a screenshot
-        - Calls the LLM with a Tetris prompt that includes 'plan_seconds'
+        - With an adaptive pacer, waits until its slot is active and its turn has come
+        - Takes the freshest frame from the capture service
+        - Skips the request if the frame-change gate says the board hasn't changed
+        - Calls the LLM with a Tetris prompt that includes 'plan_seconds'; with a board
+          extractor, the board is read from the pixels and sent as text instead of the image.
+          The request is given up once its answer would be too stale to play; while the
+          model is unavailable, the 'fallback' policy (if any) plays instead
         - Extracts the Python code from the LLM output
-        - Executes the code with `exec()`
+        - Parses the code into actions and waits for the input scheduler to play them
     """
     all_response_time = []
 
-    time.sleep(offset)
+    await asyncio.sleep(offset)
     print(f"[Thread {thread_id}] Starting after {offset}s delay... (Plan: {plan_seconds} seconds)")
 
     tetris_prompt = f"""
@@ -62,30 +140,34 @@ The speed it drops is at around ~0.75s/grid bock.
 
     try:
         while True:
-            # Capture the screen
-            screen_width, screen_height = pyautogui.size()
-            region = (0, 0, screen_width // 64 * 18, screen_height // 64 * 40)
-            screenshot = pyautogui.screenshot(region=region)
-
-            # Create a unique folder for this thread's cache
-            thread_folder = f"cache/tetris/thread_{thread_id}"
-            os.makedirs(thread_folder, exist_ok=True)
-
-            screenshot_path = os.path.join(thread_folder, "screenshot.png")
-            screenshot.save(screenshot_path)
-
-            # Encode the screenshot
-            base64_image = encode_image(screenshot_path)
+            if pacer is not None:
+                await pacer.turn(thread_id)
+            frame = capture.latest() or await engine.run_io(capture.wait_for_frame)
+            if not await engine.run_io(gate.check, frame.image):
+                # Screen hasn't changed since the last request; wait for the next capture.
+                await asyncio.sleep(capture.interval)
+                continue
+            base64_image = frame.payload
+            prompt = tetris_prompt
+            if extractor is not None:
+                try:
+                    observation = await engine.run_io(extractor.parse, frame.image)
+                    board_text = observation_to_text(observation)
+                    base64_image = None
+                    prompt = f"The current board, top row first (# = stack, letters = current piece, . = empty):\n{board_text}\n" + tetris_prompt
+                except ValueError as e:
+                    print(f"[Thread {thread_id}] Could not read the board, sending the image: {e}")
 
             start_time = time.time()
-            if api_provider == "anthropic":
-                generated_code_str = anthropic_completion(system_prompt, model_name, base64_image, tetris_prompt)
-            elif api_provider == "openai":
-                generated_code_str = openai_completion(system_prompt, model_name, base64_image, tetris_prompt)
-            elif api_provider == "gemini":
-                generated_code_str = gemini_completion(system_prompt, model_name, base64_image, tetris_prompt)
-            else:
-                raise NotImplementedError(f"API provider: {api_provider} is not supported.")
+            try:
+                generated_code_str = await async_completion(
+                    api_provider, system_prompt, model_name, base64_image, prompt,
+                    deadline=scheduler.deadline(frame.timestamp),
+                )
+            except ProviderUnavailable as e:
+                gate.rollback(frame.image)
+                await play_fallback(engine, capture, scheduler, thread_id, fallback, plan_seconds, e)
+                continue
 
             end_time = time.time()
             latency = end_time - start_time
@@ -94,19 +176,99 @@ The speed it drops is at around ~0.75s/grid bock.
             print(f"[Thread {thread_id}] Request latency: {latency:.2f}s")
             avg_latency = np.mean(all_response_time)
             print(f"[Thread {thread_id}] Latencies: {all_response_time}")
-            print(f"[Thread {thread_id}] Average latency: {avg_latency:.2f}s\n")
+            print(f"[Thread {thread_id}] Average latency: {avg_latency:.2f}s")
+            if pacer is not None:
+                pacer.record(latency)
+                print(f"[Thread {thread_id}] Pacer: {pacer.summary()}")
+            print(f"[Thread {thread_id}] Frame gate: {gate.summary()}")
+            payload = f"image payload: {len(base64_image)} bytes" if base64_image is not None else "text board"
+            print(f"[Thread {thread_id}] Frame {frame.index} age: {frame_age(frame):.2f}s, {payload}\n")
 
             print(f"[Thread {thread_id}] --- API output ---\n{generated_code_str}\n")
 
             # Extract Python code for execution
             clean_code = extract_python_code(generated_code_str)
-            log_output(thread_id, f"[Thread {thread_id}] Python code to be executed:\n{clean_code}\n")
+            log_output(thread_id, f"[Thread {thread_id}] Python code to be executed:\n{clean_code}\n", "tetris")
             print(f"[Thread {thread_id}] Python code to be executed:\n{clean_code}\n")
 
+            plan = submit_code(scheduler, thread_id, clean_code, frame, plan_seconds)
+            if plan is not None:
+                await plan.wait_async()
+                print(f"[Thread {thread_id}] Plan {plan.status}, max drift {plan.max_drift * 1000:.1f}ms ({scheduler.summary()})")
+
+    except asyncio.CancelledError:
+        print(f"[Thread {thread_id}] Cancelled. Exiting...")
+        raise
+
+async def worker_tetris_planner(engine, capture, scheduler, extractor, planner, plan_seconds):
+    """
+    Local Tetris policy: reads the board from the pixels of every new frame and plays the
+    placement planner's key presses, with no model call in the loop. Plans for the same
+    piece are refreshed from newer frames, so the piece follows the plan even when a key
+    was missed.
+    """
+    last_index = None
+    plans = 0
+    print(f"[Planner] Starting (Plan: {plan_seconds} seconds)")
+    try:
+        while True:
+            frame = capture.latest() or await engine.run_io(capture.wait_for_frame)
+            if frame.index == last_index:
+                await asyncio.sleep(capture.interval)
+                continue
+            last_index = frame.index
+
+            try:
+                observation = await engine.run_io(extractor.parse, frame.image)
+            except ValueError as e:
+                print(f"[Planner] Could not read the board: {e}")
+                continue
+            start_time = time.time()
+            actions = await engine.run_io(planner.plan_observation, observation)
+            if not actions:
+                continue
+
+            plan = Plan(actions, source="planner", captured_at=frame.timestamp, horizon=plan_seconds)
+            plan.close()
+            scheduler.submit(plan)
+            plans += 1
+            if plans % 20 == 1:
+                print(f"[Planner] {observation.piece} -> {len(actions) // 2} keys, "
+                      f"planned in {(time.time() - start_time) * 1000:.1f}ms ({scheduler.summary()})")
+            await plan.wait_async()
+
+    except asyncio.CancelledError:
+        print("[Planner] Cancelled. Exiting...")
+        raise
+
+async def advise_weights(engine, capture, extractor, planner, system_prompt, api_provider, model_name, interval):
+    """
+    Let the model steer the local planner: every `interval` seconds, send it the board as
+    text and the current heuristic weights, and apply the weights it answers with.
+    The planner keeps playing with the previous weights while the request is in flight.
+    """
+    try:
+        while True:
+            await asyncio.sleep(interval)
+            frame = capture.latest()
+            if frame is None:
+                continue
+            try:
+                observation = await engine.run_io(extractor.parse, frame.image)
+            except ValueError as e:
+                print(f"[Advisor] Could not read the board: {e}")
+                continue
+            prompt = ADVISOR_PROMPT.format(weights=json.dumps(planner.weights), board=observation_to_text(observation))
+
+            start_time = time.time()
             try:
-                exec(clean_code)
-            except Exception as e:
-                print(f"[Thread {thread_id}] Error executing code: {e}")
+                response = await async_completion(api_provider, system_prompt, model_name, None, prompt)
+                updated = planner.set_weights(parse_weights(response))
+            except (ProviderUnavailable, ValueError) as e:
+                print(f"[Advisor] Ignoring response: {e}")
+                continue
+            print(f"[Advisor] Weights updated in {time.time() - start_time:.2f}s: {updated}")
 
-    except KeyboardInterrupt:
-        print(f"[Thread {thread_id}] Interrupted by user. Exiting...")
+    except asyncio.CancelledError:
+        print("[Advisor] Cancelled. Exiting...")
+        raise
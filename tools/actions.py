@@ -0,0 +1,572 @@
+import ast
+import time
+import asyncio
+import threading
+from collections import namedtuple, deque
+
+# One input primitive. `name` is one of "keyDown", "keyUp", "press" or "sleep";
+# `arg` is the key name (or the duration in seconds for "sleep").
+Action = namedtuple("Action", ["name", "arg"])
+
+# pyautogui waits PAUSE (0.1s by default) after every call; the plan keeps that spacing
+# so generated code behaves as it did under exec().
+DEFAULT_CALL_PAUSE = 0.1
+MAX_LOOP_REPEAT = 50
+
+
+class ActionParseError(ValueError):
+    pass
+
+
+def _evaluate(node, env):
+    """
+    Evaluate a constant expression: literals, names assigned earlier, + - * / and unary minus.
+    """
+    if isinstance(node, ast.Constant):
+        return node.value
+    if isinstance(node, ast.Name) and node.id in env:
+        return env[node.id]
+    if isinstance(node, (ast.List, ast.Tuple)):
+        return [_evaluate(element, env) for element in node.elts]
+    if isinstance(node, ast.UnaryOp) and isinstance(node.op, (ast.USub, ast.UAdd)):
+        value = _evaluate(node.operand, env)
+        return -value if isinstance(node.op, ast.USub) else value
+    if isinstance(node, ast.BinOp) and isinstance(node.op, (ast.Add, ast.Sub, ast.Mult, ast.Div)):
+        left, right = _evaluate(node.left, env), _evaluate(node.right, env)
+        if isinstance(node.op, ast.Add):
+            return left + right
+        if isinstance(node.op, ast.Sub):
+            return left - right
+        if isinstance(node.op, ast.Mult):
+            return left * right
+        return left / right
+    raise ActionParseError(f"Unsupported expression: {ast.dump(node)}")
+
+
+def _call_name(call):
+    """
+    Function name of a call such as `pyautogui.press(...)`, `time.sleep(...)` or `press(...)`.
+    """
+    func = call.func
+    if isinstance(func, ast.Attribute) and isinstance(func.value, ast.Name):
+        if func.value.id in ("pyautogui", "time"):
+            return func.attr
+        return None
+    if isinstance(func, ast.Name):
+        return func.id
+    return None
+
+
+def _as_keys(value):
+    return [value] if isinstance(value, str) else list(value)
+
+
+# Calls that produce input; anything else (print(), logging, ...) has no effect on the game.
+_INPUT_CALLS = {"sleep", "keyDown", "keyUp", "press", "hotkey", "write", "typewrite"}
+
+# Key of the current pyautogui.PAUSE in the parse environment (not a valid variable name).
+_PAUSE = "pyautogui.PAUSE"
+
+
+def _parse_call(call, env, actions):
+    name = _call_name(call)
+    if name not in _INPUT_CALLS:
+        # Skipped before evaluating the arguments, which may be anything (e.g. f-strings).
+        return
+    args = [_evaluate(arg, env) for arg in call.args]
+    kwargs = {kw.arg: _evaluate(kw.value, env) for kw in call.keywords if kw.arg is not None}
+
+    if name == "sleep":
+        actions.append(Action("sleep", float(args[0] if args else kwargs["secs"])))
+        return
+    if name in ("keyDown", "keyUp"):
+        actions.append(Action(name, args[0] if args else kwargs["key"]))
+    elif name == "press":
+        keys = _as_keys(args[0] if args else kwargs["keys"])
+        presses = int(args[1] if len(args) > 1 else kwargs.get("presses", 1))
+        interval = float(args[2] if len(args) > 2 else kwargs.get("interval", 0.0))
+        for i in range(presses):
+            for j, key in enumerate(keys):
+                actions.append(Action("press", key))
+                if interval and (i, j) != (presses - 1, len(keys) - 1):
+                    actions.append(Action("sleep", interval))
+    elif name == "hotkey":
+        keys = [str(arg) for arg in args]
+        for key in keys:
+            actions.append(Action("keyDown", key))
+        for key in reversed(keys):
+            actions.append(Action("keyUp", key))
+    elif name in ("write", "typewrite"):
+        message = args[0] if args else kwargs["message"]
+        interval = float(args[1] if len(args) > 1 else kwargs.get("interval", 0.0))
+        for i, key in enumerate(_as_keys(message)):
+            if i and interval:
+                actions.append(Action("sleep", interval))
+            actions.append(Action("press", key))
+
+    # As under exec(): pyautogui waits PAUSE after the call unless it is given _pause=False.
+    call_pause = env[_PAUSE]
+    if call_pause and kwargs.get("_pause", True):
+        actions.append(Action("sleep", float(call_pause)))
+
+
+def _bind(target, value, env):
+    if isinstance(target, ast.Name):
+        env[target.id] = value
+    elif isinstance(target, (ast.Tuple, ast.List)):
+        values = list(value)
+        if len(values) != len(target.elts):
+            raise ActionParseError(f"Cannot unpack {value!r} into {len(target.elts)} names.")
+        for element, item in zip(target.elts, values):
+            _bind(element, item, env)
+
+
+def _loop_values(iterator, env):
+    """
+    Values of a `for` loop over range(...) or a literal (or previously assigned) list/tuple.
+    """
+    if isinstance(iterator, ast.Call) and _call_name(iterator) == "range":
+        values = range(*[int(_evaluate(arg, env)) for arg in iterator.args])
+    else:
+        values = _evaluate(iterator, env)
+        if not isinstance(values, list):
+            raise ActionParseError("Only loops over range(n) or a list/tuple of values are supported.")
+    if len(values) > MAX_LOOP_REPEAT:
+        raise ActionParseError(f"Loop of {len(values)} iterations exceeds {MAX_LOOP_REPEAT}.")
+    return values
+
+
+def _parse_statement(statement, env, actions):
+    if isinstance(statement, ast.Expr) and isinstance(statement.value, ast.Call):
+        _parse_call(statement.value, env, actions)
+    elif isinstance(statement, ast.Expr) and isinstance(statement.value, ast.Constant):
+        return  # Docstrings and other bare strings.
+    elif isinstance(statement, ast.Assign):
+        for target in statement.targets:
+            if isinstance(target, ast.Name):
+                env[target.id] = _evaluate(statement.value, env)
+            elif (isinstance(target, ast.Attribute) and isinstance(target.value, ast.Name)
+                  and target.value.id == "pyautogui" and target.attr == "PAUSE"):
+                env[_PAUSE] = _evaluate(statement.value, env)
+    elif isinstance(statement, ast.For):
+        for value in _loop_values(statement.iter, env):
+            _bind(statement.target, value, env)
+            _parse_body(statement.body, env, actions)
+    elif isinstance(statement, ast.With):
+        held = []
+        for item in statement.items:
+            call = item.context_expr
+            if isinstance(call, ast.Call) and _call_name(call) == "hold":
+                held.extend(_as_keys(_evaluate(call.args[0], env)))
+        for key in held:
+            actions.append(Action("keyDown", key))
+        _parse_body(statement.body, env, actions)
+        for key in reversed(held):
+            actions.append(Action("keyUp", key))
+    elif isinstance(statement, (ast.Import, ast.ImportFrom, ast.Pass)):
+        return
+    else:
+        raise ActionParseError(f"Unsupported statement: {type(statement).__name__}")
+
+
+def _parse_body(body, env, actions):
+    for statement in body:
+        try:
+            _parse_statement(statement, env, actions)
+        except ActionParseError as e:
+            # One statement the DSL can't express shouldn't sink the rest of the plan.
+            print(f"[Actions] Skipping line {statement.lineno}: {e}")
+
+
+def parse_actions(code, call_pause=DEFAULT_CALL_PAUSE):
+    """
+    Translate generated PyAutoGUI code into a flat list of Actions without executing it.
+
+    Supports press/keyDown/keyUp/hotkey/write, time.sleep, `with pyautogui.hold(...)`,
+    `for` loops over range(n) or a list/tuple (at most MAX_LOOP_REPEAT iterations), simple
+    constant assignments and `pyautogui.PAUSE = ...`; other calls and docstrings are
+    ignored. `call_pause` is the initial pyautogui.PAUSE. Statements that can't be
+    expressed (e.g. `if`, `while`) are logged and skipped.
+    Raises SyntaxError if the code doesn't parse.
+    """
+    actions = []
+    _parse_body(ast.parse(code).body, {_PAUSE: call_pause}, actions)
+    return actions
+
+
+def plan_duration(actions):
+    return sum(action.arg for action in actions if action.name == "sleep")
+
+
+class Plan:
+    """
+    A sequence of actions executed by the InputScheduler.
+    Actions can be appended while the plan is running (e.g. while a response is streaming)
+    until `close()` is called.
+
+    `captured_at` is the time.time() of the frame the plan was generated from and
+    `horizon` the number of seconds of control it was requested for; both are optional
+    and used by the ActionArbiter.
+    """
+
+    def __init__(self, actions=(), source="", captured_at=None, horizon=None):
+        self.source = source
+        self.actions = list(actions)
+        self.captured_at = captured_at
+        self.horizon = horizon
+        self.closed = False
+        self.cancelled = False
+        self.reason = None
+        self.drifts = []
+        self.done = threading.Event()
+        self._changed = threading.Condition()
+        self._callbacks = []
+
+    def extend(self, actions):
+        with self._changed:
+            self.actions.extend(actions)
+            self._changed.notify_all()
+
+    def close(self):
+        with self._changed:
+            self.closed = True
+            self._changed.notify_all()
+
+    def cancel(self, reason="cancelled"):
+        with self._changed:
+            if not self.cancelled:
+                self.cancelled = True
+                self.reason = reason
+            self._changed.notify_all()
+
+    @property
+    def status(self):
+        if self.cancelled:
+            return self.reason
+        return "done" if self.done.is_set() else "running"
+
+    def wait(self, timeout=None):
+        return self.done.wait(timeout)
+
+    def add_done_callback(self, callback):
+        """
+        Call `callback(plan)` once the plan has finished or been cancelled.
+        """
+        with self._changed:
+            if not self.done.is_set():
+                self._callbacks.append(callback)
+                return
+        callback(self)
+
+    def _set_done(self):
+        with self._changed:
+            self.done.set()
+            callbacks, self._callbacks = self._callbacks, []
+        for callback in callbacks:
+            callback(self)
+
+    async def wait_async(self):
+        """
+        Await the end of the plan from an asyncio task without blocking an executor thread.
+        """
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+
+        def resolve(_):
+            try:
+                loop.call_soon_threadsafe(lambda: future.done() or future.set_result(None))
+            except RuntimeError:
+                pass  # The waiter's event loop has already shut down.
+
+        self.add_done_callback(resolve)
+        await future
+
+    def _next_action(self, index):
+        """
+        Block until action `index` exists; returns None once the plan is closed or cancelled.
+        """
+        with self._changed:
+            while index >= len(self.actions) and not self.closed and not self.cancelled:
+                self._changed.wait()
+            if self.cancelled or index >= len(self.actions):
+                return None
+            return self.actions[index]
+
+    def _sleep_until(self, target):
+        """
+        Sleep until perf_counter() reaches `target`, waking early if the plan is cancelled.
+        The last couple of milliseconds are spun for timing precision.
+        """
+        while not self.cancelled:
+            remaining = target - time.perf_counter()
+            if remaining <= 0:
+                return True
+            if remaining > 0.002:
+                with self._changed:
+                    if not self.cancelled:
+                        self._changed.wait(remaining - 0.002)
+        return False
+
+    @property
+    def max_drift(self):
+        return max((abs(d) for d in self.drifts), default=0.0)
+
+
+class PyAutoGUIBackend:
+    """
+    Sends key events through pyautogui, bypassing its built-in PAUSE so the scheduler owns timing.
+    """
+
+    def __init__(self):
+        import pyautogui
+        self._pyautogui = pyautogui
+
+    def key_down(self, key):
+        self._pyautogui.keyDown(key, _pause=False)
+
+    def key_up(self, key):
+        self._pyautogui.keyUp(key, _pause=False)
+
+
+class InputScheduler:
+    """
+    Dedicated input thread that executes Plans with precise timing.
+
+    Only one plan drives the keyboard at a time. With `preempt=True` a newly
+    submitted plan cancels the running one (held keys are released first);
+    otherwise plans run in submission order. Each action runs at its planned offset
+    from the plan start, or, if it arrived late (e.g. streamed), the sleeps before it
+    after the previous action actually ran, so durations such as a held jump survive.
+    The drift from that target time is recorded.
+    """
+
+    def __init__(self, backend=None, preempt=True, horizon_slack=0.5):
+        self.backend = backend if backend is not None else PyAutoGUIBackend()
+        self.preempt = preempt
+        self.horizon_slack = horizon_slack
+        self.plans_run = 0
+        self.plans_cancelled = 0
+        self.plans_truncated = 0
+        self.drifts = deque(maxlen=1000)
+
+        self._pending = deque()
+        self._current = None
+        self._held = set()
+        self._lock = threading.Condition()
+        self._stopped = False
+        self._thread = threading.Thread(target=self._run, name="input-scheduler", daemon=True)
+        self._thread.start()
+
+    def submit(self, plan):
+        """
+        Queue a Plan (or a list of Actions) for execution and return the Plan.
+        """
+        if not isinstance(plan, Plan):
+            plan = Plan(plan)
+            plan.close()
+        with self._lock:
+            if self.preempt:
+                self._preempt_all()
+            self._pending.append(plan)
+            self._lock.notify_all()
+        return plan
+
+    def _preempt_all(self):
+        """
+        Cancel the pending and running plans. Must be called with the lock held.
+        """
+        for pending in self._pending:
+            pending.cancel("preempted")
+            self._finish(pending, cancelled=True)
+        self._pending.clear()
+        if self._current is not None:
+            self._current.cancel("preempted")
+
+    def stop(self):
+        with self._lock:
+            self._stopped = True
+            for pending in self._pending:
+                self._finish(pending, cancelled=True)
+            self._pending.clear()
+            if self._current is not None:
+                self._current.cancel()
+            self._lock.notify_all()
+        self._thread.join(timeout=1.0)
+
+    def _finish(self, plan, cancelled):
+        if cancelled:
+            plan.cancel()
+            self.plans_cancelled += 1
+        else:
+            self.plans_run += 1
+        plan._set_done()
+
+    def _run(self):
+        while True:
+            with self._lock:
+                while not self._pending and not self._stopped:
+                    self._lock.wait()
+                if self._stopped:
+                    return
+                plan = self._current = self._pending.popleft()
+
+            self._execute(plan)
+
+            with self._lock:
+                self._current = None
+                self._finish(plan, cancelled=plan.cancelled)
+
+    def _execute(self, plan):
+        start = time.perf_counter()
+        offset = 0.0
+        gap = 0.0  # Sleeps since the previous input action.
+        last_run = None
+        index = 0
+        try:
+            while True:
+                action = plan._next_action(index)
+                if action is None:
+                    return
+                index += 1
+                if action.name == "sleep":
+                    offset += action.arg
+                    gap += action.arg
+                    continue
+                if plan.horizon is not None and offset > plan.horizon + self.horizon_slack:
+                    # The plan runs past the window it was generated for; stop here.
+                    self.plans_truncated += 1
+                    return
+
+                target = start + offset
+                if last_run is not None:
+                    target = max(target, last_run + gap)
+                if not plan._sleep_until(target):
+                    return
+                last_run = time.perf_counter()
+                gap = 0.0
+                drift = last_run - target
+                plan.drifts.append(drift)
+                self.drifts.append(drift)
+                self._apply(action)
+        finally:
+            self._release_held()
+
+    def _apply(self, action):
+        if action.name == "keyDown":
+            self.backend.key_down(action.arg)
+            self._held.add(action.arg)
+        elif action.name == "keyUp":
+            self.backend.key_up(action.arg)
+            self._held.discard(action.arg)
+        elif action.name == "press":
+            self.backend.key_down(action.arg)
+            self.backend.key_up(action.arg)
+
+    def _release_held(self):
+        for key in list(self._held):
+            self.backend.key_up(key)
+        self._held.clear()
+
+    def summary(self):
+        drifts = [abs(d) * 1000 for d in self.drifts]
+        mean = sum(drifts) / len(drifts) if drifts else 0.0
+        worst = max(drifts, default=0.0)
+        return (f"{self.plans_run} plans run, {self.plans_cancelled} cancelled, "
+                f"{self.plans_truncated} truncated at horizon, "
+                f"timing drift mean {mean:.1f}ms / max {worst:.1f}ms")
+
+
+class ActionArbiter(InputScheduler):
+    """
+    InputScheduler that arbitrates between overlapping workers by frame recency.
+
+    Every plan carries the capture time of the frame it was generated from:
+    - a plan whose frame is older than `max_frame_age` seconds is dropped as stale;
+    - a plan whose frame is older than the one behind the running/pending plan is
+      dropped as superseded;
+    - otherwise the plan pre-empts whatever is running (or is queued behind it
+      when `preempt` is False).
+    Plans are also cut off once they run past their horizon (see InputScheduler).
+    """
+
+    def __init__(self, backend=None, preempt=True, max_frame_age=None, horizon_slack=0.5):
+        super().__init__(backend=backend, preempt=preempt, horizon_slack=horizon_slack)
+        self.max_frame_age = max_frame_age
+        self.preemptions = 0
+        self.dropped_stale = 0
+        self.dropped_superseded = 0
+        self._latest_capture = None
+        self._fallback = None
+
+    @classmethod
+    def from_args(cls, args):
+        return cls(preempt=not args.no_preempt, max_frame_age=args.max_frame_age,
+                   horizon_slack=args.horizon_slack)
+
+    def deadline(self, captured_at):
+        """
+        Time after which a plan from a frame captured at `captured_at` is dropped as stale,
+        i.e. the last moment a model answer for that frame is still useful; None if never.
+        """
+        if self.max_frame_age is None or captured_at is None:
+            return None
+        return captured_at + self.max_frame_age
+
+    def submit(self, plan):
+        if not isinstance(plan, Plan):
+            plan = Plan(plan)
+            plan.close()
+
+        with self._lock:
+            captured_at = plan.captured_at
+            if captured_at is not None:
+                if self.max_frame_age is not None and time.time() - captured_at > self.max_frame_age:
+                    self.dropped_stale += 1
+                    plan.cancel("stale")
+                    self._finish(plan, cancelled=True)
+                    return plan
+                if self._latest_capture is not None and captured_at < self._latest_capture:
+                    self.dropped_superseded += 1
+                    plan.cancel("superseded")
+                    self._finish(plan, cancelled=True)
+                    return plan
+                self._latest_capture = captured_at
+
+            if self.preempt:
+                if self._pending or (self._current is not None and not self._current.cancelled):
+                    self.preemptions += 1
+                self._preempt_all()
+            self._pending.append(plan)
+            self._lock.notify_all()
+        return plan
+
+    def submit_fallback(self, plan):
+        """
+        Submit a fallback plan (played while the model is unavailable) unless another
+        worker's fallback plan is still running or pending; workers falling back at the
+        same time would otherwise pre-empt each other in a loop. Model plans still
+        pre-empt fallback plans as usual.
+        Returns the live fallback plan, which callers wait on either way.
+        """
+        with self._lock:
+            live = self._fallback
+            if live is not None and not live.done.is_set() and not live.cancelled:
+                return live
+            self._fallback = self.submit(plan)
+            return self._fallback
+
+    def summary(self):
+        return (f"{super().summary()}, {self.preemptions} pre-emptions, "
+                f"{self.dropped_stale} stale and {self.dropped_superseded} superseded plans dropped")
+
+
+def add_scheduler_args(parser):
+    """
+    Register the input scheduler / action arbiter command line options.
+    """
+    parser.add_argument("--no_preempt", action="store_true",
+                        help="Queue action plans instead of letting a plan from a newer frame cancel the running one.")
+    parser.add_argument("--max_frame_age", type=float, default=10.0,
+                        help="Drop action plans generated from frames older than this many seconds.")
+    parser.add_argument("--horizon_slack", type=float, default=0.5,
+                        help="Stop a plan once it runs this many seconds past the horizon it was requested for.")
@@ -0,0 +1,131 @@
+import time
+import threading
+from collections import namedtuple
+
+# A captured frame: sequence number, capture time (time.time()), raw image and base64 payload.
+Frame = namedtuple("Frame", ["index", "timestamp", "image", "payload"])
+
+
+def screen_region_grabber(region_fn=None):
+    """
+    Build a grab function for pyautogui. `region_fn(screen_width, screen_height)` returns the
+    (left, top, width, height) region to capture; by default the full screen is captured.
+    """
+    import pyautogui
+
+    def grab():
+        screen_width, screen_height = pyautogui.size()
+        if region_fn is None:
+            region = (0, 0, screen_width, screen_height)
+        else:
+            region = region_fn(screen_width, screen_height)
+        return pyautogui.screenshot(region=region)
+    return grab
+
+
+class FrameCaptureService:
+    """
+    Single producer that grabs frames at a fixed rate on its own thread.
+
+    Frames are encoded once and published into a ring buffer holding the latest
+    `buffer_size` frames. The capture thread is the only writer: it fills a slot and then
+    advances the published index, so readers never take a lock and always see a
+    complete frame. Workers call `latest()` to get the freshest frame instead of
+    capturing the screen themselves.
+    """
+
+    def __init__(self, grab, encoder, fps=10.0, buffer_size=8, debug_stem=None):
+        self.grab = grab
+        self.encoder = encoder
+        self.interval = 1.0 / fps
+        self.buffer_size = buffer_size
+        self.debug_stem = debug_stem
+
+        self._slots = [None] * buffer_size
+        self._published = -1
+        self._stop_event = threading.Event()
+        self._first_frame = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="frame-capture", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join(timeout=1.0)
+            self._thread = None
+
+    def _run(self):
+        index = self._published
+        next_tick = time.monotonic()
+        while not self._stop_event.is_set():
+            try:
+                timestamp = time.time()
+                image = self.grab()
+                payload = self.encoder.encode(image, debug_stem=self.debug_stem)
+            except Exception as e:
+                print(f"[Capture] Error capturing frame: {e}")
+            else:
+                index += 1
+                self._slots[index % self.buffer_size] = Frame(index, timestamp, image, payload)
+                self._published = index
+                self._first_frame.set()
+
+            # Fixed-rate schedule; if a grab overruns, skip ahead rather than bursting.
+            next_tick += self.interval
+            delay = next_tick - time.monotonic()
+            if delay < 0:
+                next_tick = time.monotonic()
+                delay = 0
+            self._stop_event.wait(delay)
+
+    def latest(self):
+        """
+        Return the freshest frame, or None if nothing has been captured yet.
+        """
+        index = self._published
+        if index < 0:
+            return None
+        return self._slots[index % self.buffer_size]
+
+    def recent(self, n=None):
+        """
+        Return up to `n` most recent frames, newest first.
+        """
+        index = self._published
+        n = self.buffer_size if n is None else min(n, self.buffer_size)
+        frames = []
+        for i in range(index, max(index - n, -1), -1):
+            frame = self._slots[i % self.buffer_size]
+            # The writer may have lapped a slot while we were reading.
+            if frame is not None and frame.index == i:
+                frames.append(frame)
+        return frames
+
+    def wait_for_frame(self, timeout=None):
+        """
+        Block until the first frame is available and return the freshest one.
+        """
+        self._first_frame.wait(timeout)
+        return self.latest()
+
+
+def frame_age(frame):
+    """
+    Seconds elapsed since the frame was captured.
+    """
+    return time.time() - frame.timestamp
+
+
+def add_capture_args(parser):
+    """
+    Register the shared capture service command line options.
+    """
+    parser.add_argument("--capture_fps", type=float, default=10.0,
+                        help="Rate at which the shared capture thread grabs frames.")
+    parser.add_argument("--frame_buffer", type=int, default=8,
+                        help="Number of recent frames kept by the capture service.")
@@ -0,0 +1,142 @@
+import time
+import threading
+
+import numpy as np
+from PIL import Image
+
+from tools.frames import to_pil
+
+
+def frame_signature(frame, size=16):
+    """
+    Cheap downsampled grayscale thumbnail (size x size, int16) used to compare frames.
+    """
+    image = to_pil(frame).resize((size, size), Image.BOX).convert("L")
+    return np.asarray(image, dtype=np.int16)
+
+
+def dhash(frame, hash_size=8):
+    """
+    Difference hash: 64-bit perceptual hash that is stable under small pixel noise.
+    """
+    image = to_pil(frame).resize((hash_size + 1, hash_size), Image.BOX).convert("L")
+    pixels = np.asarray(image, dtype=np.int16)
+    bits = (pixels[:, 1:] > pixels[:, :-1]).flatten()
+    return int("".join("1" if b else "0" for b in bits), 2)
+
+
+def _difference(a, b):
+    return np.abs(a - b).mean()
+
+
+def wait_for_stable_frame(grab, previous=None, timeout=1.0, poll_interval=0.02, threshold=1.0, signature_size=16):
+    """
+    Poll `grab()` until the screen has settled and return that frame.
+
+    With `previous` (the frame an action was based on), first wait for the screen to
+    change from it, so a frame captured before the game reacted isn't mistaken for a
+    settled one. Then poll until two consecutive frames are within `threshold` (mean
+    absolute difference of downsampled signatures, 0-255). After `timeout` seconds the
+    latest frame is returned as is, e.g. when an action didn't change anything.
+    """
+    deadline = time.time() + timeout
+    frame = grab()
+    signature = frame_signature(frame, signature_size)
+
+    if previous is not None:
+        baseline = frame_signature(previous, signature_size)
+        while _difference(signature, baseline) < threshold and time.time() < deadline:
+            time.sleep(poll_interval)
+            frame = grab()
+            signature = frame_signature(frame, signature_size)
+
+    while time.time() < deadline:
+        time.sleep(poll_interval)
+        next_frame = grab()
+        next_signature = frame_signature(next_frame, signature_size)
+        if _difference(next_signature, signature) < threshold:
+            return next_frame
+        frame, signature = next_frame, next_signature
+    return frame
+
+
+class FrameChangeGate:
+    """
+    Decides whether a frame differs enough from the last one sent to the model to be
+    worth a new request.
+
+    Frames are compared by the mean absolute difference of their downsampled
+    grayscale signatures (0-255 scale). A frame within `threshold` of the last one
+    sent is skipped, unless nothing has been sent for `max_skip_seconds`, so a truly
+    static screen still gets a decision now and then. A threshold <= 0 disables the gate.
+    The gate may be shared by several workers; a worker whose request failed calls
+    `rollback` so the same screen isn't skipped without a decision having come back.
+    """
+
+    def __init__(self, threshold=2.0, max_skip_seconds=2.0, signature_size=16):
+        self.threshold = threshold
+        self.max_skip_seconds = max_skip_seconds
+        self.signature_size = signature_size
+        self.sent = 0
+        self.skipped = 0
+
+        self._last_signature = None
+        self._last_sent_time = 0.0
+        self._last_frame = None
+        self._previous = (None, 0.0, None)
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_args(cls, args):
+        return cls(threshold=args.change_threshold, max_skip_seconds=args.max_skip_seconds)
+
+    def check(self, frame):
+        """
+        Return True if the frame should be sent (and remember it as the last one sent),
+        or False if the call should be skipped.
+        """
+        if self.threshold <= 0:
+            with self._lock:
+                self.sent += 1
+            return True
+
+        signature = frame_signature(frame, self.signature_size)
+        now = time.time()
+        with self._lock:
+            if self._last_signature is not None:
+                difference = _difference(signature, self._last_signature)
+                if difference < self.threshold and now - self._last_sent_time < self.max_skip_seconds:
+                    self.skipped += 1
+                    return False
+            self._previous = (self._last_signature, self._last_sent_time, self._last_frame)
+            self._last_signature = signature
+            self._last_sent_time = now
+            self._last_frame = frame
+            self.sent += 1
+            return True
+
+    def rollback(self, frame):
+        """
+        Forget `frame` as the last one sent, e.g. because its request failed, so the next
+        similar frame is sent. No effect once another frame has been sent since.
+        """
+        with self._lock:
+            if self._last_frame is frame:
+                self._last_signature, self._last_sent_time, self._last_frame = self._previous
+                self._previous = (None, 0.0, None)
+
+    def summary(self):
+        total = self.sent + self.skipped
+        rate = self.skipped / total if total else 0.0
+        return f"{self.sent} sent, {self.skipped} skipped ({rate:.0%} of frames)"
+
+
+def add_gate_args(parser):
+    """
+    Register the frame-change gate command line options.
+    """
+    parser.add_argument("--change_threshold", type=float, default=2.0,
+                        help="Skip model calls when the frame differs from the last one sent by less "
+                             "than this (mean absolute difference, 0-255). 0 disables the gate.")
+    parser.add_argument("--max_skip_seconds", type=float, default=2.0,
+                        help="Send a frame anyway after skipping for this many seconds.")
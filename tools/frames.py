@@ -0,0 +1,206 @@
+import os
+import io
+import base64
+
+import numpy as np
+from PIL import Image
+
+# PIL format name -> (file extension, media type)
+FRAME_FORMATS = {
+    "PNG": ("png", "image/png"),
+    "JPEG": ("jpg", "image/jpeg"),
+    "WEBP": ("webp", "image/webp"),
+}
+
+
+def to_pil(frame):
+    """
+    Convert a captured frame (PIL image, mss ScreenShot or HxWx3 uint8 array) to a PIL image.
+    """
+    if isinstance(frame, Image.Image):
+        return frame
+    if hasattr(frame, "rgb") and hasattr(frame, "size"):
+        # mss ScreenShot
+        return Image.frombytes("RGB", frame.size, frame.rgb)
+    return Image.fromarray(frame)
+
+
+class PixelView:
+    """
+    Uniform pixel access to a captured frame (ndarray, mss ScreenShot or PIL image) for
+    parsers that sample a few known pixels per frame. Only `rgb()` copies the whole frame.
+    """
+
+    def __init__(self, image):
+        if isinstance(image, np.ndarray):
+            self.kind, self.data = "array", image
+            self.shape = image.shape[:2]
+        elif hasattr(image, "bgra") and hasattr(image, "size"):
+            # mss ScreenShot: view its raw BGRA buffer without copying.
+            width, height = image.size
+            self.kind = "bgra"
+            self.data = np.frombuffer(image.bgra, dtype=np.uint8).reshape(height, width, 4)
+            self.shape = (height, width)
+        else:
+            self.kind, self.data = "pil", to_pil(image)
+            self.shape = (self.data.height, self.data.width)
+
+    def rgb(self):
+        if self.kind == "array":
+            return self.data[..., :3]
+        if self.kind == "bgra":
+            return self.data[..., 2::-1]
+        return np.asarray(self.data.convert("RGB"))
+
+    def sample(self, ys, xs):
+        """
+        RGB values at the given pixel coordinates, shape ys.shape + (3,).
+        """
+        if self.kind == "array":
+            return self.data[ys, xs, :3]
+        if self.kind == "bgra":
+            return self.data[ys, xs, 2::-1]
+        if self.data.mode not in ("RGB", "RGBA"):
+            self.data = self.data.convert("RGB")
+        access = self.data.load()
+        values = [access[int(x), int(y)][:3] for y, x in zip(ys.ravel(), xs.ravel())]
+        return np.array(values).reshape(ys.shape + (3,))
+
+
+class FramePreprocessor:
+    """
+    Shrinks frames before encoding to cut upload bytes and image-token cost.
+
+    - crop: (left, top, right, bottom) as fractions of the frame, e.g. the game viewport
+    - max_long_edge: downscale so the longer side is at most this many pixels
+    - palette_colors: quantize to an adaptive palette with this many colours
+    """
+
+    def __init__(self, crop=None, max_long_edge=None, palette_colors=None):
+        self.crop = tuple(crop) if crop else None
+        self.max_long_edge = max_long_edge
+        self.palette_colors = palette_colors
+
+    @classmethod
+    def from_args(cls, args, defaults=None):
+        """
+        Build from the command line, falling back to the game's `defaults` dict for unset options.
+        """
+        config = dict(defaults or {})
+        for key in ("crop", "max_long_edge", "palette_colors"):
+            value = getattr(args, key, None)
+            if value is not None:
+                config[key] = value
+        return cls(**config)
+
+    def apply(self, image):
+        if self.crop is not None:
+            width, height = image.size
+            left, top, right, bottom = self.crop
+            image = image.crop((
+                int(left * width), int(top * height), int(right * width), int(bottom * height)
+            ))
+
+        if self.max_long_edge is not None:
+            width, height = image.size
+            scale = self.max_long_edge / max(width, height)
+            if scale < 1:
+                image = image.resize(
+                    (max(1, round(width * scale)), max(1, round(height * scale))), Image.BILINEAR
+                )
+
+        if self.palette_colors is not None:
+            image = image.convert("RGB").quantize(
+                colors=self.palette_colors, method=Image.Quantize.FASTOCTREE
+            )
+
+        return image
+
+
+class FrameEncoder:
+    """
+    Encodes captured frames straight to a base64 payload in memory.
+
+    Nothing touches the disk unless `debug_snapshots` is enabled, in which case the
+    encoded bytes are also written to `<debug_stem>.<ext>` for inspection.
+    """
+
+    def __init__(self, fmt="PNG", quality=85, compress_level=1, debug_snapshots=False, preprocessor=None):
+        fmt = fmt.upper()
+        if fmt == "JPG":
+            fmt = "JPEG"
+        if fmt not in FRAME_FORMATS:
+            raise ValueError(f"Unsupported frame format: {fmt}")
+        self.fmt = fmt
+        self.quality = quality
+        self.compress_level = compress_level
+        self.debug_snapshots = debug_snapshots
+        self.preprocessor = preprocessor
+
+    @classmethod
+    def from_args(cls, args, preprocess_defaults=None):
+        """
+        Build an encoder (and its preprocessor) from the command line.
+        `preprocess_defaults` holds the game's own crop/downscale/palette settings.
+        """
+        return cls(
+            fmt=args.image_format,
+            quality=args.image_quality,
+            compress_level=args.png_compress_level,
+            debug_snapshots=args.debug_snapshots,
+            preprocessor=FramePreprocessor.from_args(args, preprocess_defaults),
+        )
+
+    @property
+    def media_type(self):
+        return FRAME_FORMATS[self.fmt][1]
+
+    def encode_bytes(self, frame):
+        """
+        Preprocess a frame and encode it to raw image bytes in the configured format.
+        """
+        image = to_pil(frame)
+        if self.preprocessor is not None:
+            image = self.preprocessor.apply(image)
+        buffer = io.BytesIO()
+        if self.fmt == "PNG":
+            # Palette (quantized) images stay in "P" mode, which keeps PNGs small.
+            image.save(buffer, format="PNG", compress_level=self.compress_level)
+        elif self.fmt == "JPEG":
+            image.convert("RGB").save(buffer, format="JPEG", quality=self.quality)
+        else:
+            image.convert("RGB").save(buffer, format="WEBP", quality=self.quality, method=0)
+        return buffer.getvalue()
+
+    def encode(self, frame, debug_stem=None):
+        """
+        Encode a frame and return it as a base64 string.
+        If debug snapshots are on and `debug_stem` is given, the image is also saved to disk.
+        """
+        data = self.encode_bytes(frame)
+        if self.debug_snapshots and debug_stem is not None:
+            os.makedirs(os.path.dirname(debug_stem) or ".", exist_ok=True)
+            with open(f"{debug_stem}.{FRAME_FORMATS[self.fmt][0]}", "wb") as f:
+                f.write(data)
+        return base64.b64encode(data).decode("utf-8")
+
+
+def add_frame_args(parser):
+    """
+    Register the frame-encoding command line options shared by the game agents.
+    """
+    parser.add_argument("--image_format", type=str, default="PNG", choices=["PNG", "JPEG", "WEBP"],
+                        help="Encoding of frames sent to the model.")
+    parser.add_argument("--image_quality", type=int, default=85,
+                        help="JPEG/WebP quality (1-100).")
+    parser.add_argument("--png_compress_level", type=int, default=1,
+                        help="PNG compression level (0-9). Lower is faster.")
+    parser.add_argument("--debug_snapshots", action="store_true",
+                        help="Also write every encoded frame to the cache folder.")
+    parser.add_argument("--crop", type=float, nargs=4, default=None,
+                        metavar=("LEFT", "TOP", "RIGHT", "BOTTOM"),
+                        help="Crop frames to this box, given as fractions of the captured frame.")
+    parser.add_argument("--max_long_edge", type=int, default=None,
+                        help="Downscale frames so their longer side is at most this many pixels.")
+    parser.add_argument("--palette_colors", type=int, default=None,
+                        help="Quantize frames to an adaptive palette with this many colours.")
@@ -0,0 +1,129 @@
+import math
+import time
+import asyncio
+from collections import deque
+
+import numpy as np
+
+
+class LatencyTracker:
+    """
+    Model response latencies shared by all workers: an exponentially weighted mean
+    that follows shifts quickly, and a percentile over the last `window` calls for the tail.
+    """
+
+    def __init__(self, initial=None, alpha=0.3, window=50, percentile=90):
+        self.alpha = alpha
+        self.percentile = percentile
+        self.ewma = initial
+        self.count = 0
+        self._recent = deque(maxlen=window)
+
+    def record(self, latency):
+        self.count += 1
+        self._recent.append(latency)
+        self.ewma = latency if self.ewma is None else self.alpha * latency + (1 - self.alpha) * self.ewma
+
+    def tail(self):
+        if not self._recent:
+            return self.ewma
+        return float(np.percentile(self._recent, self.percentile))
+
+    def estimate(self):
+        """
+        Latency to plan for: the larger of the EWMA and the tail percentile, or None before any data.
+        """
+        values = [v for v in (self.ewma, self.tail()) if v is not None]
+        return max(values) if values else None
+
+    def summary(self):
+        if self.ewma is None:
+            return "no latency samples"
+        return f"ewma {self.ewma:.2f}s, p{self.percentile:g} {self.tail():.2f}s over {len(self._recent)} calls"
+
+
+class AdaptivePacer:
+    """
+    Spaces model requests of a pool of workers `cadence` seconds apart and sizes the
+    pool from the measured latency.
+
+    Workers are started for up to `max_workers` slots; only the first `active` slots
+    make requests, the rest wait. Each request start is handed out as a turn at least
+    `cadence` seconds after the previous one, whichever worker takes it, so decisions
+    stay evenly phased when workers are added or removed or a call runs long. Every
+    `resize_every` recorded latencies, `active` is set to the number of workers needed
+    to cover the latency estimate at that cadence (as with the fixed offsets).
+    """
+
+    def __init__(self, cadence, initial_workers, min_workers=1, max_workers=8,
+                 initial_latency=None, resize_every=3, tracker=None):
+        self.cadence = cadence
+        self.min_workers = min_workers
+        self.max_workers = max(max_workers, min_workers)
+        self.resize_every = resize_every
+        self.tracker = tracker or LatencyTracker(initial=initial_latency)
+        self.active = self._clamp(initial_workers)
+        self.turns = 0
+        self.resizes = 0
+
+        self._next_start = 0.0
+        self._resized = asyncio.Event()
+
+    @classmethod
+    def from_args(cls, args, cadence, initial_workers):
+        return cls(cadence, initial_workers, min_workers=args.min_workers, max_workers=args.max_workers,
+                   initial_latency=args.api_response_latency_estimate)
+
+    def _clamp(self, workers):
+        return min(max(workers, self.min_workers), self.max_workers)
+
+    def target_workers(self):
+        estimate = self.tracker.estimate()
+        if estimate is None:
+            return self.active
+        return self._clamp(math.ceil(estimate / self.cadence))
+
+    async def turn(self, slot):
+        """
+        Wait until `slot` is active and the next request start time has come.
+        """
+        while slot >= self.active:
+            await self._resized.wait()
+        now = time.time()
+        start = max(now, self._next_start)
+        self._next_start = start + self.cadence
+        self.turns += 1
+        if start > now:
+            await asyncio.sleep(start - now)
+
+    def record(self, latency):
+        """
+        Add a measured request latency and resize the pool if the estimate moved.
+        """
+        self.tracker.record(latency)
+        if self.tracker.count % self.resize_every:
+            return
+        target = self.target_workers()
+        if target != self.active:
+            print(f"[Pacer] {self.active} -> {target} workers ({self.tracker.summary()}, cadence {self.cadence:.2f}s)")
+            self.active = target
+            self.resizes += 1
+            # Wake the waiting slots; those still inactive go back to waiting.
+            self._resized.set()
+            self._resized = asyncio.Event()
+
+    def summary(self):
+        return f"{self.active}/{self.max_workers} workers active, {self.resizes} resizes, {self.tracker.summary()}"
+
+
+def add_pacing_args(parser):
+    """
+    Register the adaptive worker pool command line options.
+    """
+    parser.add_argument("--adaptive_workers", action="store_true",
+                        help="Resize the worker pool from the measured latency and space requests evenly, "
+                             "instead of fixed offsets from --api_response_latency_estimate.")
+    parser.add_argument("--min_workers", type=int, default=1,
+                        help="Fewest active workers with --adaptive_workers.")
+    parser.add_argument("--max_workers", type=int, default=8,
+                        help="Most active workers with --adaptive_workers.")
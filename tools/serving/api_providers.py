@@ -1,61 +1,276 @@
 import os
+import time
+import asyncio
+import inspect
+import threading
+import contextlib
+import concurrent.futures
+from collections import deque
 
-from openai import OpenAI
+import numpy as np
+
+from tools.serving.resilience import ProviderUnavailable, CircuitBreaker, is_retryable, backoff_delay
+
+import httpx
+from openai import OpenAI, AsyncOpenAI
 import anthropic
 import google.generativeai as genai
 
-def openai_completion(system_prompt, model_name, base64_image, prompt):
-    client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
-    messages = [
-            {
-                "role": "user",
-                "content": [
-                    {
-                        "type": "image_url",
-                        "image_url": {
-                            "url": f"data:image/png;base64,{base64_image}"
-                        },
-                    },
-                    {
-                        "type": "text",
-                        "text": prompt
-                    },
-                ],
-            }
-        ]
+# Connection settings shared by every pooled provider client.
+# Use `configure_clients` to change them before the first request.
+CLIENT_SETTINGS = {
+    "pool_size": 32,        # max (keep-alive) connections per client
+    "timeout": 60.0,        # overall request timeout in seconds
+    "connect_timeout": 5.0, # TCP/TLS connect timeout in seconds
+}
+
+# Retries and circuit breaking applied to every request (see tools/serving/resilience.py).
+# Use `configure_resilience` to change them.
+RESILIENCE_SETTINGS = {
+    "attempts": 3,           # tries per request, while the deadline still leaves time for an answer
+    "backoff": 0.25,         # base of the jittered exponential backoff in seconds
+    "max_backoff": 2.0,      # cap of the backoff in seconds
+    "failure_threshold": 3,  # consecutive failures that open a provider's circuit
+    "reset_timeout": 15.0,   # seconds before an open circuit lets a probe request through
+}
+
+_clients = {}
+_clients_lock = threading.Lock()
+_breakers = {}
+
+# Clients are replaced as a whole generation by `configure_clients`. Requests count
+# themselves in the generation current when they start, and the replaced clients are
+# closed once the requests of their generation have finished.
+_generation = 0
+_in_flight = {}      # generation -> requests running
+_retired = {}        # generation -> replaced clients waiting for those requests
+_retired_async = []  # replaced asyncio clients, closed by `aclose_clients`
+
+def configure_clients(pool_size=None, timeout=None, connect_timeout=None):
+    """
+    Update the pool size / timeouts used by provider clients.
+    Cached clients are swapped out so that the next request picks up the new settings;
+    requests already running finish on the old clients, which are closed afterwards.
+    """
+    global _generation
+    if pool_size is not None:
+        CLIENT_SETTINGS["pool_size"] = pool_size
+    if timeout is not None:
+        CLIENT_SETTINGS["timeout"] = timeout
+    if connect_timeout is not None:
+        CLIENT_SETTINGS["connect_timeout"] = connect_timeout
+
+    with _clients_lock:
+        replaced = list(_clients.values())
+        _clients.clear()
+        if _in_flight.get(_generation):
+            _retired.setdefault(_generation, []).extend(replaced)
+            replaced = []
+        _generation += 1
+    _close_replaced(replaced)
+
+def _close_replaced(clients):
+    for client in clients:
+        if not hasattr(client, "close"):
+            continue
+        if inspect.iscoroutinefunction(client.close):
+            # Async clients are closed by `aclose_clients` on their own event loop.
+            with _clients_lock:
+                _retired_async.append(client)
+        else:
+            client.close()
+
+@contextlib.contextmanager
+def _client_lease():
+    """
+    Count a request against the current client generation while it runs.
+    """
+    with _clients_lock:
+        generation = _generation
+        _in_flight[generation] = _in_flight.get(generation, 0) + 1
+    try:
+        yield
+    finally:
+        with _clients_lock:
+            _in_flight[generation] -= 1
+            replaced = []
+            if not _in_flight[generation]:
+                del _in_flight[generation]
+                replaced = _retired.pop(generation, [])
+        _close_replaced(replaced)
+
+def configure_resilience(**settings):
+    """
+    Update RESILIENCE_SETTINGS (attempts, backoff, max_backoff, failure_threshold, reset_timeout).
+    Circuit breakers are reset so that they pick up the new thresholds.
+    """
+    unknown = set(settings) - set(RESILIENCE_SETTINGS)
+    if unknown:
+        raise ValueError(f"Unknown resilience settings: {sorted(unknown)}")
+    RESILIENCE_SETTINGS.update(settings)
+    with _clients_lock:
+        _breakers.clear()
+
+def circuit_breaker(api_provider):
+    """
+    The circuit breaker shared by every request to `api_provider`.
+    """
+    breaker = _breakers.get(api_provider)
+    if breaker is None:
+        with _clients_lock:
+            breaker = _breakers.setdefault(api_provider, CircuitBreaker(
+                RESILIENCE_SETTINGS["failure_threshold"], RESILIENCE_SETTINGS["reset_timeout"]
+            ))
+    return breaker
+
+def _retry_delay(api_provider, model_name, attempt, deadline):
+    """
+    Backoff before another attempt, or None when retrying is pointless: out of attempts,
+    or the deadline would pass before a typical answer arrives.
+    """
+    if attempt + 1 >= RESILIENCE_SETTINGS["attempts"]:
+        return None
+    delay = backoff_delay(attempt, RESILIENCE_SETTINGS["backoff"], RESILIENCE_SETTINGS["max_backoff"])
+    if deadline is not None:
+        expected = provider_stats(api_provider, model_name).percentile(50) or 0.0
+        if time.time() + delay + expected >= deadline:
+            return None
+    return delay
+
+def _remaining(deadline):
+    return None if deadline is None else deadline - time.time()
+
+def _http_client(use_async=False):
+    """
+    Build a keep-alive httpx client sized according to CLIENT_SETTINGS.
+    """
+    pool_size = CLIENT_SETTINGS["pool_size"]
+    client_cls = httpx.AsyncClient if use_async else httpx.Client
+    return client_cls(
+        limits=httpx.Limits(max_connections=pool_size, max_keepalive_connections=pool_size),
+        timeout=httpx.Timeout(CLIENT_SETTINGS["timeout"], connect=CLIENT_SETTINGS["connect_timeout"]),
+    )
+
+def _create_client(provider, model_name, api_key, use_async):
+    if provider == "openai":
+        client_cls = AsyncOpenAI if use_async else OpenAI
+        return client_cls(api_key=api_key, http_client=_http_client(use_async))
+    if provider == "anthropic":
+        client_cls = anthropic.AsyncAnthropic if use_async else anthropic.Anthropic
+        return client_cls(api_key=api_key, http_client=_http_client(use_async))
+    if provider == "gemini":
+        # genai keeps its transport in module state, so configure it once per key.
+        # The same GenerativeModel serves both generate_content and generate_content_async.
+        genai.configure(api_key=api_key)
+        return genai.GenerativeModel(model_name=model_name)
+    raise NotImplementedError(f"API provider: {provider} is not supported.")
+
+def get_client(provider, model_name, api_key=None, use_async=False):
+    """
+    Return the shared client for (provider, model_name, api_key), creating it on first use.
+    Clients are thread-safe and reuse keep-alive connections across worker threads.
+    With use_async=True the asyncio flavour of the client is returned.
+    """
+    if api_key is None:
+        api_key = os.getenv(f"{provider.upper()}_API_KEY")
+
+    key = (provider, model_name, api_key, use_async)
+    client = _clients.get(key)
+    if client is None:
+        with _clients_lock:
+            client = _clients.get(key)
+            if client is None:
+                client = _create_client(provider, model_name, api_key, use_async)
+                _clients[key] = client
+    return client
+
+async def aclose_clients():
+    """
+    Close and drop the asyncio clients. Call this before the event loop shuts down.
+    """
+    with _clients_lock:
+        async_keys = [key for key in _clients if key[3]]
+        async_clients = [_clients.pop(key) for key in async_keys] + _retired_async
+        _retired_async.clear()
+    for client in async_clients:
+        if hasattr(client, "close") and inspect.iscoroutinefunction(client.close):
+            await client.close()
+
+# Leading base64 characters of each supported image container.
+_BASE64_SIGNATURES = {
+    "iVBORw0KGgo": "image/png",
+    "/9j/": "image/jpeg",
+    "UklGR": "image/webp",
+}
+
+def guess_media_type(base64_image):
+    """
+    Infer the media type of a base64-encoded image from its magic bytes (defaults to PNG).
+    """
+    for prefix, media_type in _BASE64_SIGNATURES.items():
+        if base64_image.startswith(prefix):
+            return media_type
+    return "image/png"
+
+# Message builders; base64_image may be None for text-only prompts.
+def _openai_messages(base64_image, prompt):
+    content = [{"type": "text", "text": prompt}]
+    if base64_image is not None:
+        content.insert(0, {
+            "type": "image_url",
+            "image_url": {
+                "url": f"data:{guess_media_type(base64_image)};base64,{base64_image}"
+            },
+        })
+    return [{"role": "user", "content": content}]
+
+def _anthropic_messages(base64_image, prompt):
+    content = [{"type": "text", "text": prompt}]
+    if base64_image is not None:
+        content.insert(0, {
+            "type": "image",
+            "source": {
+                "type": "base64",
+                "media_type": guess_media_type(base64_image),
+                "data": base64_image,
+            },
+        })
+    return [{"role": "user", "content": content}]
+
+def _gemini_messages(base64_image, prompt):
+    if base64_image is None:
+        return [prompt]
+    return [
+        {
+            "mime_type": guess_media_type(base64_image),
+            "data": base64_image,
+        },
+        prompt,
+    ]
+
+def _timeout_kwargs(timeout):
+    # Passing timeout=None to the SDKs would disable the client timeout, so only pass real values.
+    return {} if timeout is None else {"timeout": timeout}
+
+def openai_completion(system_prompt, model_name, base64_image, prompt, timeout=None):
+    client = get_client("openai", model_name)
+    messages = _openai_messages(base64_image, prompt)
 
     response = client.chat.completions.create(
         model=model_name,
         messages=messages,
         temperature=0,
         max_tokens=1024,
+        **_timeout_kwargs(timeout),
     )
 
     generated_code_str = response.choices[0].message.content
      
     return generated_code_str
 
-def anthropic_completion(system_prompt, model_name, base64_image, prompt):
-    client = anthropic.Anthropic(api_key=os.getenv("ANTHROPIC_API_KEY"))
-    messages = [
-                {
-                    "role": "user",
-                    "content": [
-                        {
-                            "type": "image",
-                            "source": {
-                                "type": "base64",
-                                "media_type": "image/png",
-                                "data": base64_image,
-                            },
-                        },
-                        {
-                            "type": "text",
-                            "text": prompt
-                        },
-                    ],
-                }
-            ]
+def anthropic_completion(system_prompt, model_name, base64_image, prompt, timeout=None):
+    client = get_client("anthropic", model_name)
+    messages = _anthropic_messages(base64_image, prompt)
 
     with client.messages.stream(
             max_tokens=1024,
@@ -63,6 +278,7 @@ def anthropic_completion(system_prompt, model_name, base64_image, prompt):
             temperature=0,
             system=system_prompt,
             model=model_name, # claude-3-5-sonnet-20241022 # claude-3-7-sonnet-20250219
+            **_timeout_kwargs(timeout),
         ) as stream:
             partial_chunks = []
             for chunk in stream.text_stream:
@@ -72,25 +288,408 @@ def anthropic_completion(system_prompt, model_name, base64_image, prompt):
     
     return generated_code_str
 
-def gemini_completion(system_prompt, model_name, base64_image, prompt):
-    genai.configure(api_key=os.getenv("GEMINI_API_KEY"))
-    model = genai.GenerativeModel(model_name=model_name)
+def gemini_completion(system_prompt, model_name, base64_image, prompt, timeout=None):
+    model = get_client("gemini", model_name)
 
-    messages = [
-        {
-            "mime_type": "image/jpeg",
-            "data": base64_image,
-        },
-        prompt,
-    ]
-            
-    try:
-        response = model.generate_content(
-            messages,
-        )
-    except Exception as e:
-        print(f"error: {e}")
+    messages = _gemini_messages(base64_image, prompt)
+
+    # Errors propagate to `completion`, which retries them or reports the provider as unavailable.
+    response = model.generate_content(
+        messages,
+        request_options=_timeout_kwargs(timeout),
+    )
 
     generated_code_str = response.text
 
-    return generated_code_str
\ No newline at end of file
+    return generated_code_str
+
+def _dispatch(api_provider, system_prompt, model_name, base64_image, prompt, timeout=None):
+    with _client_lease():
+        if api_provider == "anthropic":
+            return anthropic_completion(system_prompt, model_name, base64_image, prompt, timeout)
+        elif api_provider == "openai":
+            return openai_completion(system_prompt, model_name, base64_image, prompt, timeout)
+        elif api_provider == "gemini":
+            return gemini_completion(system_prompt, model_name, base64_image, prompt, timeout)
+        else:
+            raise NotImplementedError(f"API provider: {api_provider} is not supported.")
+
+def completion(api_provider, system_prompt, model_name, base64_image, prompt, deadline=None):
+    """
+    Dispatch a request to the completion function of `api_provider`,
+    hedged to the backup provider when hedging is configured.
+    Failed requests are retried with jittered backoff while an answer could still arrive
+    before `deadline` (a time.time() value, or None for no deadline).
+    Raises ProviderUnavailable if no answer can be had.
+    """
+    if HEDGE_SETTINGS["backup"] is not None:
+        return _hedged_sync_completion(api_provider, system_prompt, model_name, base64_image, prompt, deadline)
+    return _timed_sync_completion(api_provider, system_prompt, model_name, base64_image, prompt, deadline)
+
+def _timed_sync_completion(api_provider, system_prompt, model_name, base64_image, prompt, deadline=None):
+    """
+    One request with the provider's circuit breaker, `deadline` and jittered retries;
+    latencies and errors go to the provider's stats.
+    """
+    stats = provider_stats(api_provider, model_name)
+    breaker = circuit_breaker(api_provider)
+    attempt = 0
+    while True:
+        if not breaker.allow():
+            raise ProviderUnavailable(f"{api_provider}: {breaker.summary()}")
+        remaining = _remaining(deadline)
+        if remaining is not None and remaining <= 0:
+            raise ProviderUnavailable(f"{api_provider}: deadline passed")
+        stats.calls += 1
+        start_time = time.time()
+        try:
+            result = _dispatch(api_provider, system_prompt, model_name, base64_image, prompt, remaining)
+        except NotImplementedError:
+            raise
+        except Exception as e:
+            stats.errors += 1
+            breaker.record_failure()
+            delay = _retry_delay(api_provider, model_name, attempt, deadline) if is_retryable(e) else None
+            if delay is None:
+                raise ProviderUnavailable(f"{api_provider}: {type(e).__name__}: {e}") from e
+            print(f"[{api_provider}] {type(e).__name__}: {e}; retrying in {delay:.2f}s")
+            time.sleep(delay)
+            attempt += 1
+            continue
+        breaker.record_success()
+        stats.latencies.append(time.time() - start_time)
+        return result
+
+async def async_openai_completion(system_prompt, model_name, base64_image, prompt):
+    client = get_client("openai", model_name, use_async=True)
+    messages = _openai_messages(base64_image, prompt)
+
+    response = await client.chat.completions.create(
+        model=model_name,
+        messages=messages,
+        temperature=0,
+        max_tokens=1024,
+    )
+
+    return response.choices[0].message.content
+
+async def async_anthropic_completion(system_prompt, model_name, base64_image, prompt):
+    client = get_client("anthropic", model_name, use_async=True)
+    messages = _anthropic_messages(base64_image, prompt)
+
+    partial_chunks = []
+    async with client.messages.stream(
+            max_tokens=1024,
+            messages=messages,
+            temperature=0,
+            system=system_prompt,
+            model=model_name,
+        ) as stream:
+            async for chunk in stream.text_stream:
+                partial_chunks.append(chunk)
+
+    return "".join(partial_chunks)
+
+async def async_gemini_completion(system_prompt, model_name, base64_image, prompt):
+    model = get_client("gemini", model_name, use_async=True)
+    messages = _gemini_messages(base64_image, prompt)
+
+    response = await model.generate_content_async(messages)
+
+    return response.text
+
+# Request hedging: when a request to the primary provider runs past the given percentile
+# of its own recent latencies, the same request is sent to the backup and the first
+# answer wins. Use `configure_hedging` to enable it; `backup` is None when disabled.
+HEDGE_SETTINGS = {
+    "backup": None,         # (provider, model_name) of the hedge request
+    "percentile": 90,       # hedge after this percentile of the primary's latency
+    "initial_delay": 5.0,   # hedge delay in seconds until enough latencies are known
+    "min_samples": 5,       # latencies needed before the percentile is used
+}
+
+class ProviderStats:
+    """
+    Latencies of successful requests to one (provider, model), and how it fares in hedged races.
+    """
+
+    def __init__(self, window=100):
+        self.latencies = deque(maxlen=window)
+        self.calls = 0
+        self.errors = 0
+        self.races = 0
+        self.wins = 0
+
+    def percentile(self, q):
+        return float(np.percentile(self.latencies, q)) if self.latencies else None
+
+    def summary(self):
+        if not self.latencies:
+            return f"{self.calls} calls, {self.errors} errors"
+        rate = self.wins / self.races if self.races else 0.0
+        return (f"{self.calls} calls, {self.errors} errors, p50 {self.percentile(50):.2f}s, "
+                f"p99 {self.percentile(99):.2f}s, won {self.wins}/{self.races} races ({rate:.0%})")
+
+_provider_stats = {}
+
+def provider_stats(api_provider, model_name):
+    key = (api_provider, model_name)
+    stats = _provider_stats.get(key)
+    if stats is None:
+        stats = _provider_stats.setdefault(key, ProviderStats())
+    return stats
+
+def configure_hedging(backup_provider=None, backup_model=None, percentile=None, initial_delay=None, min_samples=None):
+    """
+    Hedge requests to a backup provider/model (None disables hedging).
+    """
+    HEDGE_SETTINGS["backup"] = (backup_provider, backup_model) if backup_provider else None
+    if percentile is not None:
+        HEDGE_SETTINGS["percentile"] = percentile
+    if initial_delay is not None:
+        HEDGE_SETTINGS["initial_delay"] = initial_delay
+    if min_samples is not None:
+        HEDGE_SETTINGS["min_samples"] = min_samples
+
+def hedge_delay(api_provider, model_name):
+    """
+    Seconds to wait for `api_provider` before sending the hedge request.
+    """
+    stats = provider_stats(api_provider, model_name)
+    if len(stats.latencies) < HEDGE_SETTINGS["min_samples"]:
+        return HEDGE_SETTINGS["initial_delay"]
+    return stats.percentile(HEDGE_SETTINGS["percentile"])
+
+def provider_summary():
+    """
+    One line of stats per (provider, model) that served requests, with its provider's circuit state.
+    """
+    lines = []
+    for (provider, model), stats in _provider_stats.items():
+        breaker = _breakers.get(provider)
+        lines.append(f"{provider}/{model}: {stats.summary()}" + (f", {breaker.summary()}" if breaker else ""))
+    return "\n".join(lines)
+
+def add_hedging_args(parser):
+    """
+    Register the request hedging command line options.
+    """
+    parser.add_argument("--hedge_provider", type=str, default=None,
+                        help="Also send a request to this provider when the primary is slow; the first answer wins.")
+    parser.add_argument("--hedge_model", type=str, default=None,
+                        help="Model of the hedge requests (defaults to --model_name).")
+    parser.add_argument("--hedge_percentile", type=float, default=90,
+                        help="Send the hedge request once the primary runs past this percentile of its recent latencies.")
+    parser.add_argument("--hedge_initial_delay", type=float, default=5.0,
+                        help="Hedge delay in seconds until enough latencies are known.")
+
+def configure_hedging_from_args(args):
+    configure_hedging(args.hedge_provider, args.hedge_model or args.model_name,
+                      percentile=args.hedge_percentile, initial_delay=args.hedge_initial_delay)
+
+async def _timed_completion(api_provider, system_prompt, model_name, base64_image, prompt, deadline=None):
+    """
+    One request with the provider's circuit breaker, `deadline` and jittered retries
+    (see `completion`); latencies and errors go to the provider's stats.
+    """
+    stats = provider_stats(api_provider, model_name)
+    breaker = circuit_breaker(api_provider)
+    attempt = 0
+    while True:
+        if not breaker.allow():
+            raise ProviderUnavailable(f"{api_provider}: {breaker.summary()}")
+        remaining = _remaining(deadline)
+        if remaining is not None and remaining <= 0:
+            raise ProviderUnavailable(f"{api_provider}: deadline passed")
+        stats.calls += 1
+        start_time = time.time()
+        try:
+            result = await asyncio.wait_for(
+                _async_dispatch(api_provider, system_prompt, model_name, base64_image, prompt), remaining
+            )
+        except asyncio.TimeoutError as e:
+            stats.errors += 1
+            breaker.record_failure()
+            raise ProviderUnavailable(f"{api_provider}: no answer within {remaining:.1f}s") from e
+        except NotImplementedError:
+            raise
+        except Exception as e:
+            stats.errors += 1
+            breaker.record_failure()
+            delay = _retry_delay(api_provider, model_name, attempt, deadline) if is_retryable(e) else None
+            if delay is None:
+                raise ProviderUnavailable(f"{api_provider}: {type(e).__name__}: {e}") from e
+            print(f"[{api_provider}] {type(e).__name__}: {e}; retrying in {delay:.2f}s")
+            await asyncio.sleep(delay)
+            attempt += 1
+            continue
+        breaker.record_success()
+        stats.latencies.append(time.time() - start_time)
+        return result
+
+async def _hedged_completion(api_provider, system_prompt, model_name, base64_image, prompt, deadline=None):
+    """
+    Race the primary request against a delayed hedge request and cancel the loser.
+    The hedge is sent early if the primary fails; an error is raised only if both fail.
+    """
+    backup_provider, backup_model = HEDGE_SETTINGS["backup"]
+    start_time = time.time()
+    primary = asyncio.ensure_future(_timed_completion(api_provider, system_prompt, model_name, base64_image, prompt, deadline))
+    tasks = {primary: (api_provider, model_name)}
+    try:
+        await asyncio.wait({primary}, timeout=hedge_delay(api_provider, model_name))
+        if primary.done() and primary.exception() is None:
+            return primary.result()
+
+        backup = asyncio.ensure_future(_timed_completion(backup_provider, system_prompt, backup_model, base64_image, prompt, deadline))
+        tasks[backup] = (backup_provider, backup_model)
+        for provider, model in tasks.values():
+            provider_stats(provider, model).races += 1
+
+        pending = {task for task in tasks if not task.done()}
+        while True:
+            for task in tasks:
+                if task.done() and task.exception() is None:
+                    provider_stats(*tasks[task]).wins += 1
+                    if task is not primary and not primary.done():
+                        # The primary lost: its time so far is a lower bound of its latency, and
+                        # leaving it out would make its percentile, and so the hedge delay, drift
+                        # down. Other cut-short requests (late backups, shutdown) aren't recorded.
+                        provider_stats(api_provider, model_name).latencies.append(time.time() - start_time)
+                    return task.result()
+            if not pending:
+                # Both failed: surface the primary's error.
+                return primary.result()
+            _, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        for task in tasks:
+            task.cancel()
+
+def _in_thread(function, *args):
+    """
+    Run a blocking call in a daemon thread and return a Future of its result.
+    """
+    future = concurrent.futures.Future()
+
+    def run():
+        try:
+            future.set_result(function(*args))
+        except BaseException as e:
+            future.set_exception(e)
+
+    threading.Thread(target=run, daemon=True).start()
+    return future
+
+def _hedged_sync_completion(api_provider, system_prompt, model_name, base64_image, prompt, deadline=None):
+    """
+    `_hedged_completion` for blocking callers, with one thread per request.
+    A blocking request can't be cancelled: the loser runs on in its thread (bounded by
+    `deadline`) and its latency is recorded when it ends, so no lower bound is needed.
+    """
+    backup_provider, backup_model = HEDGE_SETTINGS["backup"]
+    primary = _in_thread(_timed_sync_completion, api_provider, system_prompt, model_name, base64_image, prompt, deadline)
+    concurrent.futures.wait({primary}, timeout=hedge_delay(api_provider, model_name))
+    if primary.done() and primary.exception() is None:
+        return primary.result()
+
+    backup = _in_thread(_timed_sync_completion, backup_provider, system_prompt, backup_model, base64_image, prompt, deadline)
+    tasks = {primary: (api_provider, model_name), backup: (backup_provider, backup_model)}
+    for provider, model in tasks.values():
+        provider_stats(provider, model).races += 1
+
+    pending = {task for task in tasks if not task.done()}
+    while True:
+        for task in tasks:
+            if task.done() and task.exception() is None:
+                provider_stats(*tasks[task]).wins += 1
+                return task.result()
+        if not pending:
+            # Both failed: surface the primary's error.
+            return primary.result()
+        _, pending = concurrent.futures.wait(pending, return_when=concurrent.futures.FIRST_COMPLETED)
+
+async def async_completion(api_provider, system_prompt, model_name, base64_image, prompt, deadline=None):
+    """
+    Dispatch a request to the asyncio completion function of `api_provider`,
+    hedged to the backup provider when hedging is configured.
+    Retried while an answer could still arrive before `deadline`, as in `completion`.
+    Raises ProviderUnavailable if no answer can be had.
+    """
+    if HEDGE_SETTINGS["backup"] is not None:
+        return await _hedged_completion(api_provider, system_prompt, model_name, base64_image, prompt, deadline)
+    return await _timed_completion(api_provider, system_prompt, model_name, base64_image, prompt, deadline)
+
+async def _async_dispatch(api_provider, system_prompt, model_name, base64_image, prompt):
+    with _client_lease():
+        if api_provider == "anthropic":
+            return await async_anthropic_completion(system_prompt, model_name, base64_image, prompt)
+        elif api_provider == "openai":
+            return await async_openai_completion(system_prompt, model_name, base64_image, prompt)
+        elif api_provider == "gemini":
+            return await async_gemini_completion(system_prompt, model_name, base64_image, prompt)
+        else:
+            raise NotImplementedError(f"API provider: {api_provider} is not supported.")
+
+async def async_completion_stream(api_provider, system_prompt, model_name, base64_image, prompt, deadline=None):
+    """
+    Async generator yielding the response text of `api_provider` chunk by chunk as it is generated.
+    Streams go through the provider's circuit breaker and stop at `deadline`; they are not
+    retried, since the chunks already yielded may have been acted on.
+    Raises ProviderUnavailable if the stream can't be started or breaks off.
+    """
+    breaker = circuit_breaker(api_provider)
+    if not breaker.allow():
+        raise ProviderUnavailable(f"{api_provider}: {breaker.summary()}")
+    stream = _async_stream(api_provider, system_prompt, model_name, base64_image, prompt)
+    try:
+        while True:
+            remaining = _remaining(deadline)
+            try:
+                chunk = await asyncio.wait_for(stream.__anext__(), None if remaining is None else max(remaining, 0))
+            except StopAsyncIteration:
+                break
+            yield chunk
+    except asyncio.TimeoutError as e:
+        breaker.record_failure()
+        raise ProviderUnavailable(f"{api_provider}: stream passed its deadline") from e
+    except (asyncio.CancelledError, NotImplementedError, ProviderUnavailable):
+        raise
+    except Exception as e:
+        breaker.record_failure()
+        raise ProviderUnavailable(f"{api_provider}: {type(e).__name__}: {e}") from e
+    finally:
+        await stream.aclose()
+    breaker.record_success()
+
+async def _async_stream(api_provider, system_prompt, model_name, base64_image, prompt):
+    with _client_lease():
+        if api_provider == "anthropic":
+            client = get_client("anthropic", model_name, use_async=True)
+            async with client.messages.stream(
+                    max_tokens=1024,
+                    messages=_anthropic_messages(base64_image, prompt),
+                    temperature=0,
+                    system=system_prompt,
+                    model=model_name,
+                ) as stream:
+                    async for chunk in stream.text_stream:
+                        yield chunk
+        elif api_provider == "openai":
+            client = get_client("openai", model_name, use_async=True)
+            stream = await client.chat.completions.create(
+                model=model_name,
+                messages=_openai_messages(base64_image, prompt),
+                temperature=0,
+                max_tokens=1024,
+                stream=True,
+            )
+            async for chunk in stream:
+                if chunk.choices and chunk.choices[0].delta.content:
+                    yield chunk.choices[0].delta.content
+        elif api_provider == "gemini":
+            model = get_client("gemini", model_name, use_async=True)
+            response = await model.generate_content_async(_gemini_messages(base64_image, prompt), stream=True)
+            async for chunk in response:
+                yield chunk.text
+        else:
+            raise NotImplementedError(f"API provider: {api_provider} is not supported.")
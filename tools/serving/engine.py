@@ -0,0 +1,69 @@
+import asyncio
+import functools
+import concurrent.futures
+
+from tools.serving.api_providers import aclose_clients
+
+
+class InferenceEngine:
+    """
+    Runs game workers as tasks on a single asyncio event loop.
+
+    Model requests are awaited on the loop, so the number of in-flight requests is
+    no longer tied to the number of OS threads. Blocking work (screen capture,
+    executing generated PyAutoGUI code) goes through a small thread pool via `run_io`.
+    """
+
+    def __init__(self, io_workers=4):
+        self.io_workers = io_workers
+        self._executor = None
+        self._tasks = set()
+
+    async def run_io(self, fn, *args, **kwargs):
+        """
+        Run a blocking function in the engine's executor and await its result.
+        """
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, functools.partial(fn, *args, **kwargs))
+
+    def spawn(self, coroutine):
+        """
+        Schedule a worker coroutine on the running loop and track it for shutdown.
+        """
+        task = asyncio.create_task(coroutine)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return task
+
+    async def _main(self, workers):
+        self._executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=self.io_workers, thread_name_prefix="engine-io"
+        )
+        try:
+            tasks = [self.spawn(worker) for worker in workers]
+            await asyncio.gather(*tasks)
+        finally:
+            await self.shutdown()
+
+    async def shutdown(self):
+        """
+        Cancel all workers, wait for them to unwind and release executor/client resources.
+        """
+        tasks = list(self._tasks)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+        if self._executor is not None:
+            # Code already running in the pool (e.g. a key sequence) finishes on its own.
+            self._executor.shutdown(wait=False, cancel_futures=True)
+        await aclose_clients()
+
+    def run(self, workers):
+        """
+        Run the given worker coroutines until they finish or Ctrl-C is pressed.
+        """
+        try:
+            asyncio.run(self._main(workers))
+        except KeyboardInterrupt:
+            print("\nMain loop interrupted. All workers cancelled.")
@@ -0,0 +1,81 @@
+import time
+import random
+import threading
+
+
+class ProviderUnavailable(Exception):
+    """
+    No usable answer from a provider: its circuit is open, the deadline passed or the
+    retries ran out. Callers fall back to a local policy instead of stalling.
+    """
+
+
+def is_retryable(error):
+    """
+    Whether a failed request may succeed when sent again: rate limits, server errors,
+    timeouts and dropped connections, but not malformed requests or bad credentials.
+    """
+    status = getattr(error, "status_code", None)
+    if status is None:
+        return not isinstance(error, (NotImplementedError, ValueError, TypeError))
+    return status in (408, 409, 429) or status >= 500
+
+
+def backoff_delay(attempt, base=0.25, cap=2.0, rng=random):
+    """
+    Full-jitter exponential backoff: uniform in [0, min(cap, base * 2^attempt)].
+    """
+    return rng.uniform(0, min(cap, base * (2 ** attempt)))
+
+
+class CircuitBreaker:
+    """
+    Fails fast while a provider is down.
+
+    After `failure_threshold` consecutive failures the circuit opens and requests are
+    refused. Every `reset_timeout` seconds one request is let through as a probe; a
+    success closes the circuit, a failure keeps it open for another `reset_timeout`.
+    Safe to share between threads.
+    """
+
+    def __init__(self, failure_threshold=3, reset_timeout=15.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self.trips = 0
+        self.refused = 0
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        return "closed" if self.opened_at is None else "open"
+
+    def allow(self):
+        with self._lock:
+            if self.opened_at is None:
+                return True
+            now = time.time()
+            if now - self.opened_at >= self.reset_timeout:
+                # Probe; the next one waits another reset_timeout unless this one succeeds.
+                self.opened_at = now
+                return True
+            self.refused += 1
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.opened_at is not None:
+                self.opened_at = time.time()
+            elif self.failures >= self.failure_threshold:
+                self.opened_at = time.time()
+                self.trips += 1
+
+    def summary(self):
+        return f"circuit {self.state}, {self.trips} trips, {self.refused} requests refused"
@@ -0,0 +1,146 @@
+import os
+import time
+import sqlite3
+import hashlib
+import threading
+from collections import OrderedDict
+
+from tools.frame_gate import dhash
+
+
+def prompt_hash(system_prompt, prompt):
+    """
+    Stable hash of the (system prompt, prompt) pair.
+    """
+    digest = hashlib.sha1()
+    digest.update((system_prompt or "").encode("utf-8"))
+    digest.update(b"\0")
+    digest.update((prompt or "").encode("utf-8"))
+    return digest.hexdigest()
+
+
+def state_fingerprint(board=None, image=None):
+    """
+    Normalized fingerprint of a game state.
+    Uses the parsed board when available and falls back to a perceptual hash of the frame.
+    """
+    if board is not None:
+        return "board:" + "/".join(",".join(str(cell) for cell in row) for row in board)
+    if image is not None:
+        return f"dhash:{dhash(image, hash_size=16):064x}"
+    raise ValueError("Either a board or an image is required to fingerprint a state.")
+
+
+class ResponseCache:
+    """
+    LRU/TTL cache of model responses keyed on (provider, model, prompt hash, state fingerprint).
+
+    The in-memory tier holds at most `max_entries` responses and evicts the least
+    recently used one. With `persist_path` set, responses are also written to a
+    SQLite file so replayed games are served from disk across runs; disk hits are
+    promoted back into memory. Entries older than `ttl` seconds are ignored.
+    """
+
+    def __init__(self, max_entries=4096, ttl=None, persist_path=None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._db = None
+        if persist_path:
+            os.makedirs(os.path.dirname(persist_path) or ".", exist_ok=True)
+            self._db = sqlite3.connect(persist_path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS responses "
+                "(key TEXT PRIMARY KEY, response TEXT NOT NULL, created REAL NOT NULL)"
+            )
+            self._db.commit()
+
+    @classmethod
+    def from_args(cls, args):
+        """
+        Build a cache from the command line, or return None when caching is disabled.
+        """
+        if args.cache_size <= 0:
+            return None
+        return cls(max_entries=args.cache_size, ttl=args.cache_ttl, persist_path=args.cache_path)
+
+    @staticmethod
+    def make_key(api_provider, model_name, system_prompt, prompt, fingerprint):
+        return f"{api_provider}|{model_name}|{prompt_hash(system_prompt, prompt)}|{fingerprint}"
+
+    def _expired(self, created):
+        return self.ttl is not None and time.time() - created > self.ttl
+
+    def get(self, key):
+        """
+        Return the cached response for `key`, or None.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                response, created = entry
+                if not self._expired(created):
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return response
+                del self._entries[key]
+
+            if self._db is not None:
+                row = self._db.execute(
+                    "SELECT response, created FROM responses WHERE key = ?", (key,)
+                ).fetchone()
+                if row is not None and not self._expired(row[1]):
+                    self._store(key, row[0], row[1])
+                    self.hits += 1
+                    return row[0]
+
+            self.misses += 1
+            return None
+
+    def put(self, key, response):
+        created = time.time()
+        with self._lock:
+            self._store(key, response, created)
+            if self._db is not None:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO responses (key, response, created) VALUES (?, ?, ?)",
+                    (key, response, created),
+                )
+                self._db.commit()
+
+    def invalidate(self, key):
+        """
+        Drop `key` from both tiers, e.g. when a cached decision turned out to be a no-op.
+        """
+        with self._lock:
+            self._entries.pop(key, None)
+            if self._db is not None:
+                self._db.execute("DELETE FROM responses WHERE key = ?", (key,))
+                self._db.commit()
+
+    def _store(self, key, response, created):
+        self._entries[key] = (response, created)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def summary(self):
+        total = self.hits + self.misses
+        rate = self.hits / total if total else 0.0
+        return f"{self.hits} hits, {self.misses} misses ({rate:.0%} hit rate), {len(self._entries)} entries"
+
+
+def add_cache_args(parser):
+    """
+    Register the response cache command line options.
+    """
+    parser.add_argument("--cache_size", type=int, default=4096,
+                        help="Number of model responses kept in memory, keyed on game state. 0 disables the cache.")
+    parser.add_argument("--cache_ttl", type=float, default=None,
+                        help="Seconds after which a cached response expires.")
+    parser.add_argument("--cache_path", type=str, default=None,
+                        help="SQLite file for a persistent on-disk cache tier, e.g. cache/2048/responses.db.")
@@ -0,0 +1,131 @@
+import re
+import ast
+import codeop
+
+# Statements that open an indented block, and clauses that continue one at the same indentation.
+_COMPOUND_KEYWORDS = {"for", "while", "if", "with", "try", "def", "class", "async"}
+_CLAUSE_KEYWORDS = {"else", "elif", "except", "finally"}
+
+
+def _first_word(line):
+    match = re.match(r"[A-Za-z_]+", line)
+    return match.group(0) if match else ""
+
+
+def _is_bare_name(statement):
+    """
+    True for statements such as `Sure` or `'text'`, i.e. prose that happens to parse as Python.
+    """
+    try:
+        tree = ast.parse(statement)
+    except SyntaxError:
+        return True
+    return (
+        len(tree.body) == 1
+        and isinstance(tree.body[0], ast.Expr)
+        and isinstance(tree.body[0].value, (ast.Name, ast.Constant))
+    )
+
+
+class StreamingCodeParser:
+    """
+    Incrementally splits streamed model output into complete Python statements.
+
+    Feed text chunks as they arrive; every simple statement (e.g. `pyautogui.press("x")`)
+    is returned as soon as its line is complete, so it can be executed before the rest
+    of the response has been generated. Compound statements (`for`, `with`, ...) are
+    returned once a dedented line or the end of the code block shows they are finished,
+    and expressions spanning several lines once they compile. Text outside ```python
+    fences, and prose that does not parse, is ignored.
+    """
+
+    def __init__(self):
+        self._partial_line = ""
+        self._block = []
+        self._block_kind = None  # None, "compound" or "continuation"
+        self._in_fence = False
+        self._seen_fence = False
+
+    def feed(self, text):
+        """
+        Add a chunk of streamed text and return the statements it completed.
+        """
+        self._partial_line += text
+        *lines, self._partial_line = self._partial_line.split("\n")
+        statements = []
+        for line in lines:
+            statements.extend(self._parse_line(line))
+        return statements
+
+    def close(self):
+        """
+        Signal the end of the stream and return any statements still buffered.
+        """
+        statements = []
+        if self._partial_line:
+            statements.extend(self._parse_line(self._partial_line))
+            self._partial_line = ""
+        statements.extend(self._flush_block())
+        return statements
+
+    def _flush_block(self):
+        block, kind = self._block, self._block_kind
+        self._block, self._block_kind = [], None
+        if not block:
+            return []
+        source = "\n".join(block)
+        if kind == "compound":
+            source += "\n"
+        try:
+            compile(source, "<stream>", "exec")
+        except SyntaxError:
+            return []
+        return [source]
+
+    def _parse_line(self, line):
+        stripped = line.strip()
+
+        if stripped.startswith("```"):
+            self._seen_fence = True
+            self._in_fence = not self._in_fence
+            return [] if self._in_fence else self._flush_block()
+        if self._seen_fence and not self._in_fence:
+            # Prose before/after/between code fences.
+            return []
+
+        if self._block_kind == "continuation":
+            self._block.append(line)
+            try:
+                code = codeop.compile_command("\n".join(self._block), "<stream>", "exec")
+            except SyntaxError:
+                self._block, self._block_kind = [], None
+                return []
+            return self._flush_block() if code is not None else []
+
+        if not stripped or stripped.startswith("#"):
+            if self._block_kind == "compound":
+                self._block.append(line)
+            return []
+
+        statements = []
+        if self._block_kind == "compound":
+            if line[:1] in (" ", "\t") or _first_word(stripped) in _CLAUSE_KEYWORDS:
+                self._block.append(line)
+                return []
+            statements.extend(self._flush_block())
+
+        if _first_word(stripped) in _COMPOUND_KEYWORDS:
+            self._block, self._block_kind = [stripped], "compound"
+            return statements
+
+        try:
+            code = codeop.compile_command(stripped, "<stream>", "exec")
+        except SyntaxError:
+            return statements
+        if code is None:
+            # e.g. an open bracket; wait for the following lines.
+            self._block, self._block_kind = [stripped], "continuation"
+        elif not _is_bare_name(stripped):
+            statements.append(stripped)
+        return statements
+
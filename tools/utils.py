@@ -1,6 +1,5 @@
 import time
 import os
-import pyautogui
 import base64
 import anthropic
 import numpy as np